@@ -0,0 +1,27 @@
+"""Account deletion in a fixed number of set-based statements.
+
+Deleting the users row lets SQLite's ON DELETE CASCADE remove everything keyed
+to it: books and, through them, chapters, note pages, comments and activities;
+follows, messages, conversations, feed entries, stats and sync records. That
+bypasses mapper events, so what the cascade can't reach is handled first: the
+search index and note history, which have no foreign keys, and the follower
+counts on other users' rows.
+"""
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+import follows
+import models
+import revisions
+import search
+
+
+def delete_account(db: Session, user_id: int) -> None:
+    """Delete a user and all their data in the session's transaction; the caller commits."""
+    connection = db.connection()
+    search.drop_user(connection, user_id)
+    revisions.drop_user(connection, user_id)
+    follows.drop_user(connection, user_id)
+    connection.execute(delete(models.User.__table__).where(models.User.__table__.c.id == user_id))
+    # Pending autosave edits for the user's chapters and notes are skipped at
+    # flush time, since their rows are gone.
@@ -1,30 +1,67 @@
 import os
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 import models
-from database import get_db
+from cache import TTLCache
+from database import get_async_read_db, get_read_db
+from hashing import check_password, hash_password
 
 SECRET_KEY = os.environ.get("BOOK_MEMORY_SECRET", "insecure-dev-secret")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
+AUTH_CACHE_TTL_SECONDS = float(os.environ.get("BOOK_MEMORY_AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get("BOOK_MEMORY_AUTH_CACHE_SIZE", "1024"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 
+class CurrentUser:
+    """Identity of the authenticated caller, detached from any DB session."""
+
+    __slots__ = ("id", "username")
+
+    def __init__(self, id: int, username: str):
+        self.id = id
+        self.username = username
+
+    def __repr__(self) -> str:
+        return f"CurrentUser(id={self.id!r}, username={self.username!r})"
+
+
+# token -> CurrentUser; saves the JWT decode and the users lookup on repeat requests.
+_principal_cache: TTLCache[CurrentUser] = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL_SECONDS)
+
+
+def invalidate_user(user_id: int) -> None:
+    _principal_cache.discard_where(lambda principal: principal.id == user_id)
+
+
+@event.listens_for(models.User, "after_delete")
+def _user_deleted(mapper, connection, target) -> None:
+    invalidate_user(target.id)
+
+
+@event.listens_for(models.User, "after_update")
+def _user_updated(mapper, connection, target) -> None:
+    if inspect(target).attrs.username.history.has_changes():
+        invalidate_user(target.id)
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return check_password(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return hash_password(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -35,7 +72,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> models.User:
+def authenticate_token(db: Session, token: str) -> CurrentUser:
+    cached = _principal_cache.get(token)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -48,7 +89,25 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if user is None:
+    row = db.query(models.User.id, models.User.username).filter(models.User.username == username).first()
+    if row is None:
         raise credentials_exception
-    return user
+    principal = CurrentUser(id=row.id, username=row.username)
+    # Never cache past the token's own expiry.
+    exp = payload.get("exp")
+    _principal_cache.set(token, principal, ttl=exp - time.time() if exp is not None else None)
+    return principal
+
+
+def get_current_user(db: Session = Depends(get_read_db), token: str = Depends(oauth2_scheme)) -> CurrentUser:
+    return authenticate_token(db, token)
+
+
+async def get_current_user_async(
+    db: AsyncSession = Depends(get_async_read_db), token: str = Depends(oauth2_scheme)
+) -> CurrentUser:
+    """get_current_user for async handlers; a cache hit never leaves the event loop."""
+    cached = _principal_cache.get(token)
+    if cached is not None:
+        return cached
+    return await db.run_sync(authenticate_token, token)
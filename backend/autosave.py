@@ -0,0 +1,254 @@
+"""Patch-based autosave for chapter and note text, with a coalescing write buffer.
+
+Clients send a delta (Quill-style retain/insert/delete ops, offsets in UTF-16
+code units as JavaScript counts them) against the revision they last saw. A
+patch whose base revision is stale gets a 409 instead of silently overwriting.
+
+Accepted patches are applied to an in-memory copy of the text and written to
+the database once the item has been idle for AUTOSAVE_DELAY seconds (or after
+AUTOSAVE_MAX_DELAY at the latest), so a burst of keystrokes costs one UPDATE.
+Handlers that read or replace the text flush the buffer first. The buffer is
+per process; run a single worker, or set BOOK_MEMORY_AUTOSAVE_DELAY=0 to write
+every patch straight through.
+
+Lock order is always writer connection, then buffer lock: nothing waits for the
+writer pool while holding the lock, so the single-connection pool can't deadlock.
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+AUTOSAVE_DELAY = float(os.environ.get("BOOK_MEMORY_AUTOSAVE_DELAY", "2"))
+AUTOSAVE_MAX_DELAY = float(os.environ.get("BOOK_MEMORY_AUTOSAVE_MAX_DELAY", "10"))
+
+# kind -> (model, text field, not-found message)
+KINDS = {
+    "chapter": (models.Chapter, "note_markdown", "Chapter not found"),
+    "note": (models.NotePage, "content", "Note not found"),
+}
+
+
+def apply_patch(text: str, ops: List[dict]) -> str:
+    """Apply retain/insert/delete ops to text; unconsumed text after the last op is kept."""
+    source = (text or "").encode("utf-16-le")
+    out = []
+    pos = 0
+    for index, op in enumerate(ops):
+        if len(op) != 1:
+            raise _bad_patch(index, "each op needs exactly one of retain, insert, delete")
+        (name, value), = op.items()
+        if name == "insert" and isinstance(value, str):
+            out.append(value.encode("utf-16-le"))
+            continue
+        if name not in ("retain", "delete") or not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise _bad_patch(index, f"invalid op {name!r}")
+        end = pos + value * 2
+        if end > len(source):
+            raise _bad_patch(index, f"{name} runs past the end of the text")
+        if name == "retain":
+            out.append(source[pos:end])
+        pos = end
+    out.append(source[pos:])
+    try:
+        return b"".join(out).decode("utf-16-le")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Patch splits a surrogate pair")
+
+
+def _bad_patch(index: int, detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"ops[{index}]: {detail}")
+
+
+def _conflict(revision: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={"message": "Revision conflict", "revision": revision},
+    )
+
+
+def check_revision(base_revision: Optional[int], revision: int) -> None:
+    if base_revision is not None and base_revision != revision:
+        raise _conflict(revision)
+
+
+@dataclass
+class _Pending:
+    user_id: int
+    book_id: int
+    text: str
+    revision: int
+    stored_revision: int  # revision of the row in the database
+    first_change: float
+    last_change: float
+
+
+class WriteBuffer:
+    def __init__(self, delay: float = AUTOSAVE_DELAY, max_delay: float = AUTOSAVE_MAX_DELAY):
+        self.delay = delay
+        self.max_delay = max_delay
+        self._pending: Dict[Tuple[str, int], _Pending] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.delay > 0
+
+    def patch(self, db: Session, kind: str, item_id: int, user_id: int, base_revision: int, ops: List[dict]) -> Tuple[int, str]:
+        """Apply a patch for the owner; returns (new revision, new text)."""
+        model, field, not_found = KINDS[kind]
+        key = (kind, item_id)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is not None:
+                if entry.user_id != user_id:
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=not_found)
+                return self._apply(entry, base_revision, ops)
+
+        row = (
+            db.query(model)
+            .join(models.Book)
+            .filter(model.id == item_id, models.Book.user_id == user_id)
+            .first()
+        )
+        if not row:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=not_found)
+
+        if not self.enabled:
+            check_revision(base_revision, row.revision)
+            setattr(row, field, apply_patch(getattr(row, field), ops))
+            db.commit()
+            return row.revision, getattr(row, field)
+
+        with self._lock:
+            entry = self._pending.get(key)  # another request may have loaded it meanwhile
+            if entry is None:
+                now = time.monotonic()
+                entry = _Pending(user_id, row.book_id, getattr(row, field) or "", row.revision, row.revision, now, now)
+                result = self._apply(entry, base_revision, ops)
+                self._pending[key] = entry
+                return result
+            return self._apply(entry, base_revision, ops)
+
+    def _apply(self, entry: _Pending, base_revision: int, ops: List[dict]) -> Tuple[int, str]:
+        check_revision(base_revision, entry.revision)
+        entry.text = apply_patch(entry.text, ops)
+        entry.revision += 1
+        entry.last_change = time.monotonic()
+        return entry.revision, entry.text
+
+    def has_pending(self, book_id: int) -> bool:
+        return any(entry.book_id == book_id for entry in list(self._pending.values()))
+
+    def flush(self, db: Session, kind: Optional[str] = None, item_id: Optional[int] = None,
+              book_id: Optional[int] = None, due_only: bool = False) -> int:
+        """Write matching pending entries through db and commit; returns how many were written."""
+        db.connection()  # take the writer connection before the buffer lock
+        with self._lock:
+            now = time.monotonic()
+            keys = [
+                key
+                for key, entry in self._pending.items()
+                if (kind is None or key == (kind, item_id))
+                and (book_id is None or entry.book_id == book_id)
+                and (not due_only or now - entry.last_change >= self.delay or now - entry.first_change >= self.max_delay)
+            ]
+            if not keys:
+                return 0
+            for key in keys:
+                self._write(db, key, self._pending[key])
+            db.commit()
+            for key in keys:
+                del self._pending[key]
+            return len(keys)
+
+    def _write(self, db: Session, key: Tuple[str, int], entry: _Pending) -> None:
+        model, field, _ = KINDS[key[0]]
+        row = db.get(model, key[1])
+        if row is None:
+            return
+        if row.revision != entry.stored_revision:
+            # Written behind the buffer's back (another process, a bulk tool); that
+            # write wins and the next patch against the old revision gets a 409.
+            logger.warning("Dropping buffered %s %s: revision %s != %s", key[0], key[1], row.revision, entry.stored_revision)
+            return
+        setattr(row, field, entry.text)
+        row.revision = entry.revision
+
+    def discard(self, kind: Optional[str] = None, item_id: Optional[int] = None, book_id: Optional[int] = None) -> None:
+        with self._lock:
+            for key in [
+                key
+                for key, entry in self._pending.items()
+                if (kind is None or key == (kind, item_id)) and (book_id is None or entry.book_id == book_id)
+            ]:
+                del self._pending[key]
+
+    def flush_book(self, book_id: int) -> None:
+        """Read-your-writes for read-only handlers: persist a book's pending edits first."""
+        if not self.has_pending(book_id):
+            return
+        db = SessionLocal()
+        try:
+            self.flush(db, book_id=book_id)
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        interval = min(self.delay, 0.5)
+        while not self._stop.wait(interval):
+            if not self._pending:
+                continue
+            db = SessionLocal()
+            try:
+                self.flush(db, due_only=True)
+            except Exception:
+                logger.exception("Autosave flush failed")
+            finally:
+                db.close()
+
+    def start(self) -> None:
+        if self.enabled and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="autosave-flush", daemon=True)
+            self._thread.start()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        db = SessionLocal()
+        try:
+            self.flush(db)
+        finally:
+            db.close()
+
+
+write_buffer = WriteBuffer()
+
+
+def _bump_revision(mapper, connection, target):
+    # Any ORM write that changes the text moves the revision on, so a client
+    # patching against what it saw before a full PUT gets a conflict.
+    field = KINDS["chapter" if isinstance(target, models.Chapter) else "note"][1]
+    if get_history(target, field).has_changes() and not get_history(target, "revision").has_changes():
+        target.revision = (target.revision or 0) + 1
+
+
+event.listen(models.Chapter, "before_update", _bump_revision)
+event.listen(models.NotePage, "before_update", _bump_revision)
@@ -0,0 +1,119 @@
+"""Batched create/update/delete/reorder for a book's chapters or note pages.
+
+Ownership is checked once by the caller. Operations run in list order inside
+one transaction, and a reorder is a single UPDATE ... CASE instead of one
+request per row.
+"""
+from datetime import datetime
+from typing import Dict, List, Type
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import case, update
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+import sync
+
+
+class BatchKind:
+    def __init__(self, kind: str, model, order_field: str, create_schema: Type[BaseModel], not_found: str):
+        self.kind = kind
+        self.model = model
+        self.order_field = order_field
+        self.create_schema = create_schema
+        self.not_found = not_found
+
+
+CHAPTERS = BatchKind("chapter", models.Chapter, "order", schemas.ChapterCreate, "Chapter not found")
+NOTES = BatchKind("note", models.NotePage, "sort_order", schemas.NotePageCreate, "Note not found")
+
+_OP_META_FIELDS = {"op", "id", "ids"}
+
+
+def _bad_op(index: int, detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"operations[{index}]: {detail}")
+
+
+def apply_batch(db: Session, spec: BatchKind, book: models.Book, operations: List[BaseModel]) -> None:
+    model = spec.model
+    referenced = set()
+    for index, op in enumerate(operations):
+        if op.op in ("update", "delete"):
+            if op.id is None:
+                raise _bad_op(index, f"{op.op} needs an id")
+            referenced.add(op.id)
+        elif op.op == "reorder":
+            if not op.ids:
+                raise _bad_op(index, "reorder needs ids")
+            if len(set(op.ids)) != len(op.ids):
+                raise _bad_op(index, "reorder ids must be unique")
+            referenced.update(op.ids)
+
+    # One query loads every row the batch touches, scoped to this book.
+    rows: Dict[int, object] = {}
+    if referenced:
+        rows = {
+            row.id: row
+            for row in db.query(model).filter(model.book_id == book.id, model.id.in_(referenced)).all()
+        }
+        missing = sorted(referenced - rows.keys())
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=f"{spec.not_found}: {', '.join(map(str, missing))}"
+            )
+
+    deleted = set()
+    for index, op in enumerate(operations):
+        fields = op.model_dump(exclude_unset=True, exclude=_OP_META_FIELDS)
+        if op.op == "create":
+            try:
+                data = spec.create_schema.model_validate(fields)
+            except ValidationError as exc:
+                raise _bad_op(index, "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors()))
+            db.add(model(**data.model_dump(), book_id=book.id))
+        elif op.id in deleted or (op.ids and deleted.intersection(op.ids)):
+            raise _bad_op(index, "refers to a row deleted earlier in this batch")
+        elif op.op == "update":
+            row = rows[op.id]
+            for field, value in fields.items():
+                setattr(row, field, value)
+            row.updated_at = datetime.utcnow()
+        elif op.op == "delete":
+            db.delete(rows[op.id])
+            deleted.add(op.id)
+        else:
+            _reorder(db, spec, book, op.ids, [rows[row_id] for row_id in op.ids])
+
+
+def _reorder(db: Session, spec: BatchKind, book: models.Book, ids: List[int], rows: List[object]) -> None:
+    # Earlier operations must reach the database before the bulk UPDATE runs over them.
+    db.flush()
+    model = spec.model
+    order_column = getattr(model, spec.order_field)
+    db.execute(
+        update(model)
+        .where(model.book_id == book.id, model.id.in_(ids))
+        .values(
+            {
+                order_column: case({row_id: position for position, row_id in enumerate(ids)}, value=model.id),
+                model.updated_at: datetime.utcnow(),
+            }
+        )
+        .execution_options(synchronize_session=False)
+    )
+    for row in rows:
+        db.expire(row)
+    # The bulk UPDATE skips mapper events, so log the reordered rows for /api/sync here.
+    sync.record_bulk(db.connection(), book.user_id, spec.kind, ids)
+
+
+def list_rows(db: Session, spec: BatchKind, book: models.Book) -> List[object]:
+    model = spec.model
+    return (
+        db.query(model)
+        .filter(model.book_id == book.id)
+        .order_by(getattr(model, spec.order_field), model.id)
+        .all()
+    )
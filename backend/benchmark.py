@@ -0,0 +1,503 @@
+"""Load and latency benchmark for the API.
+
+Seeds a synthetic SQLite database (users, books, chapters, notes of realistic
+size, follows, messages), then drives the app with N concurrent clients per
+endpoint and reports throughput and p50/p95/p99 latency as JSON:
+
+    python benchmark.py run --users 50 --books 20 --concurrency 1,16,64 \\
+        --target both --output after.json
+    python benchmark.py compare before.json after.json [--threshold 10]
+
+`--target inprocess` sends requests straight to the ASGI app (no sockets, so
+it measures the app itself); `--target uvicorn` starts a real server process.
+Client and server share the machine, so compare runs from the same host only.
+
+Seeding goes through the ORM, so search, feed, follow counts, sync and revision
+rows look the way the API leaves them. The database file is kept between runs;
+pass --reseed after changing the dataset options. Needs httpx.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import httpx
+except ImportError:  # only the benchmark needs it
+    httpx = None
+
+BACKEND_DIR = Path(__file__).resolve().parent
+DEFAULT_DB = os.path.join(tempfile.gettempdir(), "book-memory-benchmark.db")
+PASSWORD = "benchmark-password"
+
+WORDS = (
+    "reading memory chapter library author novel story history science design habit garden "
+    "river mountain window letter journey summer winter morning evening coffee theory method "
+    "practice language culture economy society future memoir essay poetry critique analysis "
+    "argument evidence character setting conflict dialogue narrative structure pattern system "
+    "network growth learning teaching question answer insight summary outline quotation margin "
+    "highlight bookmark index archive draft revision edition translation publisher classic modern "
+    "ancient empire revolution philosophy ethics logic mathematics physics biology ecology climate "
+    "ocean forest island village city travel friendship family childhood education craft music"
+).split()
+AUTHORS = [f"{first} {last}" for first in ("Aki", "Ren", "Mika", "Sora", "Yuki", "Kai", "Nao", "Rin")
+           for last in ("Tanaka", "Sato", "Suzuki", "Ito", "Kato", "Mori")]
+
+# name -> (method, path, json body) built from a random user context
+Request = Tuple[str, str, Optional[dict]]
+ENDPOINTS: Dict[str, Callable[[dict, random.Random], Request]] = {
+    "list_books": lambda u, r: ("GET", "/api/books", None),
+    "list_books_summary": lambda u, r: ("GET", "/api/books?fields=summary", None),
+    "get_book": lambda u, r: ("GET", f"/api/books/{r.choice(u['books'])}", None),
+    "list_chapters": lambda u, r: ("GET", f"/api/books/{r.choice(u['books'])}/chapters", None),
+    "list_notes": lambda u, r: ("GET", f"/api/books/{r.choice(u['books'])}/notes", None),
+    "feed": lambda u, r: ("GET", "/api/feed", None),
+    "followers": lambda u, r: ("GET", "/api/users/me/followers", None),
+    "following": lambda u, r: ("GET", "/api/users/me/following", None),
+    "conversations": lambda u, r: ("GET", "/api/conversations", None),
+    "messages": lambda u, r: ("GET", f"/api/messages/{r.choice(u['peers'])}", None),
+    "search": lambda u, r: ("GET", f"/api/search?q={r.choice(WORDS)}", None),
+    "sync": lambda u, r: ("GET", "/api/sync", None),
+    "stats": lambda u, r: ("GET", "/api/stats/dashboard", None),
+    "create_note": lambda u, r: (
+        "POST",
+        f"/api/books/{r.choice(u['books'])}/notes",
+        {"title": _sentence(r, 2, 5), "content": _html(r, 2000)},
+    ),
+    "send_message": lambda u, r: ("POST", f"/api/messages/{r.choice(u['peers'])}", {"content": _sentence(r, 4, 20)}),
+}
+# Writes grow the dataset, so they only run when asked for by name (or "all").
+WRITE_ENDPOINTS = {"create_note", "send_message"}
+
+
+def _sentence(rng: random.Random, low: int = 6, high: int = 16) -> str:
+    words = rng.choices(WORDS, k=rng.randint(low, high))
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(2, 6)))
+
+
+def _html(rng: random.Random, size: int) -> str:
+    parts: List[str] = []
+    length = 0
+    while length < size:
+        part = f"<h2>{_sentence(rng, 2, 5)}</h2>" if rng.random() < 0.15 else f"<p>{_paragraph(rng)}</p>"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+
+def _markdown(rng: random.Random, size: int) -> str:
+    parts: List[str] = []
+    length = 0
+    while length < size:
+        roll = rng.random()
+        if roll < 0.15:
+            part = f"## {_sentence(rng, 2, 5)}"
+        elif roll < 0.35:
+            part = "\n".join(f"- {_sentence(rng, 3, 10)}" for _ in range(rng.randint(2, 5)))
+        else:
+            part = _paragraph(rng)
+        parts.append(part)
+        length += len(part)
+    return "\n\n".join(parts)
+
+
+def _size(rng: random.Random, mean: int) -> int:
+    return max(1, int(rng.lognormvariate(0, 0.6) * mean))
+
+
+# --- Seeding ---
+def seed(args) -> None:
+    import conversations
+    import models
+    import rollup
+    from database import SessionLocal
+    from hashing import hash_password
+
+    rng = random.Random(args.seed)
+    password_hash = hash_password(PASSWORD)  # one bcrypt run, shared by every user
+    db = SessionLocal()
+    try:
+        users = [models.User(username=f"bench{index:05d}", password_hash=password_hash) for index in range(args.users)]
+        db.add_all(users)
+        db.commit()
+        user_ids = [user.id for user in users]
+
+        # Follows first, so the books below fan out into feeds the way live traffic would.
+        for user_id in user_ids:
+            others = [other for other in user_ids if other != user_id]
+            for following_id in rng.sample(others, min(args.follows, len(others))):
+                db.add(models.Follow(follower_id=user_id, following_id=following_id))
+        db.commit()
+
+        today = date.today()
+        for position, user_id in enumerate(user_ids, 1):
+            for _ in range(args.books):
+                finished = rng.random() < 0.6
+                started_at = today - timedelta(days=rng.randint(0, 3 * 365))
+                book = models.Book(
+                    user_id=user_id,
+                    title=_sentence(rng, 1, 5).rstrip("."),
+                    author=rng.choice(AUTHORS),
+                    status=models.BookStatus.READ if finished else models.BookStatus.WANT_TO_READ,
+                    note_markdown=_markdown(rng, _size(rng, args.note_bytes // 4)),
+                    started_at=started_at,
+                    finished_at=min(today, started_at + timedelta(days=rng.randint(1, 120))) if finished else None,
+                )
+                book.chapters = [
+                    models.Chapter(title=f"Chapter {order + 1}", order=order,
+                                   note_markdown=_markdown(rng, _size(rng, args.note_bytes // 2)))
+                    for order in range(args.chapters)
+                ]
+                book.notes = [
+                    models.NotePage(title=_sentence(rng, 2, 6), sort_order=order,
+                                    content=_html(rng, _size(rng, args.note_bytes)))
+                    for order in range(args.notes)
+                ]
+                db.add(book)
+            db.flush()
+            rollup.rebuild_user(db, user_id)
+            db.commit()
+            _progress(f"seeded {position}/{len(user_ids)} users")
+
+        for user_id in user_ids:
+            others = [other for other in user_ids if other != user_id]
+            for _ in range(args.messages if others else 0):
+                message = models.Message(sender_id=user_id, receiver_id=rng.choice(others), content=_sentence(rng, 4, 20))
+                db.add(message)
+                db.flush()
+                conversations.record_message(db, message)
+            db.commit()
+    finally:
+        db.close()
+    _progress("")
+
+
+def dataset(db_path: str) -> Tuple[dict, List[dict]]:
+    """Row counts plus one request context (token, ids) per benchmark user."""
+    import models
+    from auth import create_access_token
+    from database import ReadSessionLocal
+
+    db = ReadSessionLocal()
+    try:
+        counts = {
+            table: db.query(model).count()
+            for table, model in (
+                ("users", models.User),
+                ("books", models.Book),
+                ("chapters", models.Chapter),
+                ("notes", models.NotePage),
+                ("follows", models.Follow),
+                ("messages", models.Message),
+            )
+        }
+        books: Dict[int, List[int]] = {}
+        for user_id, book_id in db.query(models.Book.user_id, models.Book.id):
+            books.setdefault(user_id, []).append(book_id)
+        peers: Dict[int, List[int]] = {}
+        for follower_id, following_id in db.query(models.Follow.follower_id, models.Follow.following_id):
+            peers.setdefault(follower_id, []).append(following_id)
+        accounts = db.query(models.User).filter(models.User.username.like("bench%")).all()
+        users = [
+            {
+                "id": user.id,
+                "token": create_access_token(data={"sub": user.username}, expires_delta=timedelta(days=1)),
+                "books": books[user.id],
+                # people to message: whoever they follow, else anyone
+                "peers": peers.get(user.id) or [other.id for other in accounts if other.id != user.id],
+            }
+            for user in accounts
+            if user.id in books
+        ]
+    finally:
+        db.close()
+    counts["bytes"] = os.path.getsize(db_path)
+    return counts, users
+
+
+# --- Load generation ---
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not ordered:
+        return 0.0
+    rank = max(1, int(round(fraction * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+async def drive(client, endpoint: str, users: List[dict], concurrency: int, duration: float, warmup: float, seed_value: int) -> dict:
+    build = ENDPOINTS[endpoint]
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    async def worker(index: int) -> None:
+        rng = random.Random(seed_value * 1000 + index)
+        while True:
+            sent = time.perf_counter()
+            if sent >= stop_at:
+                return
+            user = rng.choice(users)
+            method, path, body = build(user, rng)
+            try:
+                response = await client.request(
+                    method, path, json=body, headers={"Authorization": f"Bearer {user['token']}"}
+                )
+                outcome = None if response.status_code < 400 else str(response.status_code)
+            except httpx.HTTPError as exc:
+                outcome = type(exc).__name__
+            if sent < measure_from:
+                continue
+            if outcome is None:
+                latencies.append(time.perf_counter() - sent)
+            else:
+                errors[outcome] = errors.get(outcome, 0) + 1
+
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - measure_from
+    latencies.sort()
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round((latencies[-1] if latencies else 0.0) * 1000, 2),
+    }
+
+
+async def run_matrix(target: str, client_factory, args, users: List[dict]) -> List[dict]:
+    results = []
+    for concurrency in args.concurrency:
+        async with client_factory(concurrency) as client:
+            for endpoint in args.endpoints:
+                result = await drive(client, endpoint, users, concurrency, args.duration, args.warmup, args.seed)
+                result["target"] = target
+                results.append(result)
+                _progress(
+                    f"{target:9} {endpoint:18} c={concurrency:<4} {result['throughput']:>8} req/s  "
+                    f"p50 {result['p50_ms']}ms  p99 {result['p99_ms']}ms"
+                    + (f"  errors {result['errors']}" if result["errors"] else ""),
+                    newline=True,
+                )
+    return results
+
+
+async def run_inprocess(args, users: List[dict]) -> List[dict]:
+    from main import app
+
+    def client(concurrency: int):
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=args.timeout)
+
+    async with app.router.lifespan_context(app):
+        return await run_matrix("inprocess", client, args, users)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_uvicorn(args, users: List[dict]) -> List[dict]:
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", str(BACKEND_DIR),
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=os.environ.copy(),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        async with httpx.AsyncClient(base_url=base_url) as probe:
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+                try:
+                    await probe.get("/api/books")
+                    break
+                except httpx.TransportError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError("uvicorn did not start within 60s")
+                    await asyncio.sleep(0.2)
+
+        def client(concurrency: int):
+            limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+            return httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout)
+
+        return await run_matrix("uvicorn", client, args, users)
+    finally:
+        server.terminate()
+        try:
+            server.wait(30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _progress(text: str, newline: bool = False) -> None:
+    """Status on stderr; lines without newline overwrite each other on a terminal and are skipped elsewhere."""
+    if sys.stderr.isatty():
+        sys.stderr.write("\r\033[K" + text + ("\n" if newline else ""))
+    elif newline:
+        sys.stderr.write(text + "\n")
+    sys.stderr.flush()
+
+
+def run(args) -> dict:
+    if httpx is None:
+        raise SystemExit("benchmark.py needs the httpx package")
+    # database.py builds its engines at import time, so point it at the benchmark file first.
+    if args.reseed:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+    fresh = not os.path.exists(args.db)
+    os.environ["BOOK_MEMORY_DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.db)}"
+    sys.path.insert(0, str(BACKEND_DIR))
+    import main  # noqa: F401  creates the schema and runs migrations
+
+    if fresh:
+        seed(args)
+    counts, users = dataset(args.db)
+    if not users:
+        raise SystemExit(f"{args.db} has no benchmark users; run again with --reseed")
+
+    results: List[dict] = []
+    if args.target in ("inprocess", "both"):
+        results += asyncio.run(run_inprocess(args, users))
+    if args.target in ("uvicorn", "both"):
+        results += asyncio.run(run_uvicorn(args, users))
+    return {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {key: value for key, value in os.environ.items() if key.startswith("BOOK_MEMORY_")},
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "dataset": counts,
+        },
+        "results": results,
+    }
+
+
+# --- Comparison ---
+def compare(before: dict, after: dict, threshold: Optional[float]) -> int:
+    """Print per-endpoint changes; with threshold, return 1 if any p99 got that many percent worse."""
+    old = {(r["target"], r["endpoint"], r["concurrency"]): r for r in before["results"]}
+    regressed = []
+    print(f"{'target':10} {'endpoint':18} {'conc':>5} {'req/s':>17} {'p50 ms':>17} {'p99 ms':>19}")
+    for result in after["results"]:
+        key = (result["target"], result["endpoint"], result["concurrency"])
+        previous = old.get(key)
+        if previous is None:
+            continue
+        change = _change(previous["p99_ms"], result["p99_ms"])
+        if threshold is not None and change is not None and change > threshold:
+            regressed.append(key)
+        print(
+            f"{key[0]:10} {key[1]:18} {key[2]:>5} "
+            f"{previous['throughput']:>7} -> {result['throughput']:<7} "
+            f"{previous['p50_ms']:>7} -> {result['p50_ms']:<7} "
+            f"{previous['p99_ms']:>7} -> {result['p99_ms']:<7}"
+            + ("" if change is None else f" {change:+.0f}%")
+        )
+    for target, endpoint, concurrency in regressed:
+        print(f"p99 regression over {threshold}%: {target} {endpoint} c={concurrency}", file=sys.stderr)
+    return 1 if regressed else 0
+
+
+def _change(before: float, after: float) -> Optional[float]:
+    return None if not before else (after - before) / before * 100
+
+
+def _csv_ints(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part]
+
+
+def _endpoint_list(value: str) -> List[str]:
+    if value == "all":
+        return list(ENDPOINTS)
+    if value == "reads":
+        return [name for name in ENDPOINTS if name not in WRITE_ENDPOINTS]
+    names = [part for part in value.split(",") if part]
+    unknown = [name for name in names if name not in ENDPOINTS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown endpoints {unknown}; choose from {list(ENDPOINTS)}")
+    return names
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for the API.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    bench = sub.add_parser("run", help="seed (if needed) and benchmark")
+    bench.add_argument("--db", default=DEFAULT_DB, help=f"SQLite file for the dataset (default {DEFAULT_DB})")
+    bench.add_argument("--reseed", action="store_true", help="delete and re-create the dataset")
+    bench.add_argument("--seed", type=int, default=1, help="random seed for data and request mix")
+    bench.add_argument("--users", type=int, default=50)
+    bench.add_argument("--books", type=int, default=20, help="books per user")
+    bench.add_argument("--chapters", type=int, default=5, help="chapters per book")
+    bench.add_argument("--notes", type=int, default=3, help="note pages per book")
+    bench.add_argument("--note-bytes", type=int, default=4000, help="typical note page size; chapter memos get half")
+    bench.add_argument("--follows", type=int, default=10, help="users each user follows")
+    bench.add_argument("--messages", type=int, default=20, help="messages sent per user")
+    bench.add_argument("--target", choices=("inprocess", "uvicorn", "both"), default="inprocess")
+    bench.add_argument("--concurrency", type=_csv_ints, default=[1, 16, 64], help="comma-separated client counts")
+    bench.add_argument("--endpoints", type=_endpoint_list, default="reads",
+                       help="comma-separated names, 'reads' (default) or 'all'")
+    bench.add_argument("--duration", type=float, default=5.0, help="measured seconds per endpoint and concurrency")
+    bench.add_argument("--warmup", type=float, default=1.0, help="unmeasured seconds before each measurement")
+    bench.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    bench.add_argument("--output", help="write the JSON report here instead of stdout")
+
+    diff = sub.add_parser("compare", help="compare two JSON reports")
+    diff.add_argument("before")
+    diff.add_argument("after")
+    diff.add_argument("--threshold", type=float, help="exit 1 if any p99 is this many percent slower")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        with open(args.before) as before, open(args.after) as after:
+            return compare(json.load(before), json.load(after), args.threshold)
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as out:
+            out.write(report + "\n")
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
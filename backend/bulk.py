@@ -0,0 +1,267 @@
+"""Streaming bulk import and export of a user's library.
+
+Import reads CSV or NDJSON row by row and writes each batch of rows in one
+transaction with multi-row INSERT ... RETURNING. Bulk inserts skip ORM mapper
+events, so each batch also updates the rollups, the search index and the sync
+log itself. Export yields rows from yield_per cursors, so memory stays flat
+however large the library is.
+"""
+import csv
+import io
+import json
+import re
+from datetime import date, datetime
+from typing import IO, Dict, Iterator, List
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import models
+import rollup
+import schemas
+import search
+import sync
+
+IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+EXPORT_YIELD_PER = 500
+
+BOOK_EXPORT_FIELDS = ("id",) + tuple(schemas.BookBase.model_fields) + ("created_at", "updated_at")
+CHAPTER_EXPORT_FIELDS = ("id", "book_id", "title", "order", "note_markdown", "created_at", "updated_at")
+NOTE_EXPORT_FIELDS = ("id", "book_id", "title", "sort_order", "content", "created_at", "updated_at")
+
+# Header aliases for CSV exports from other services (Goodreads), mapped onto BookCreate fields.
+CSV_HEADER_ALIASES = {
+    "title": "title",
+    "author": "author",
+    "status": "status",
+    "exclusive shelf": "status",
+    "amazon_url": "amazon_url",
+    "cover_image_url": "cover_image_url",
+    "note_markdown": "note_markdown",
+    "my review": "note_markdown",
+    "started_at": "started_at",
+    "finished_at": "finished_at",
+    "date read": "finished_at",
+    "title_guess": "title_guess",
+}
+STATUS_ALIASES = {
+    "read": models.BookStatus.READ,
+    "to-read": models.BookStatus.WANT_TO_READ,
+    "currently-reading": models.BookStatus.WANT_TO_READ,
+    "want_to_read": models.BookStatus.WANT_TO_READ,
+}
+_SLASH_DATE = re.compile(r"^(\d{4})/(\d{1,2})/(\d{1,2})$")
+
+
+class _Importer:
+    def __init__(self, db: Session, user_id: int):
+        self.db = db
+        self.user_id = user_id
+        self.result = schemas.ImportResult()
+        self.book_ids: Dict[int, int] = {}  # exported book id -> new id, for chapter/note lines
+        self.books: List[tuple] = []  # (line, exported id, BookCreate)
+        self.chapters: List[tuple] = []  # (line, exported book id, ChapterCreate)
+        self.notes: List[tuple] = []
+
+    def error(self, line: int, message: str) -> None:
+        self.result.failed += 1
+        if len(self.result.errors) < MAX_REPORTED_ERRORS:
+            self.result.errors.append(schemas.ImportRowError(line=line, error=message))
+
+    def add(self, line: int, record: dict) -> None:
+        kind = record.pop("type", "book")
+        try:
+            if kind == "book":
+                self.books.append((line, record.get("id"), schemas.BookCreate.model_validate(_clean_book(record))))
+            elif kind == "chapter":
+                self.chapters.append((line, record.get("book_id"), schemas.ChapterCreate.model_validate(record)))
+            elif kind == "note":
+                self.notes.append((line, record.get("book_id"), schemas.NotePageCreate.model_validate(record)))
+            else:
+                self.error(line, f"unknown record type {kind!r}")
+                return
+        except (ValidationError, ValueError) as exc:
+            self.error(line, _describe(exc))
+            return
+        if len(self.books) + len(self.chapters) + len(self.notes) >= IMPORT_BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if not (self.books or self.chapters or self.notes):
+            return
+        now = datetime.utcnow()
+        if self.books:
+            self._insert_books(now)
+        for kind, model, pending in (
+            ("chapter", models.Chapter, self.chapters),
+            ("note", models.NotePage, self.notes),
+        ):
+            if pending:
+                self._insert_children(kind, model, pending, now)
+        self.db.commit()
+        self.result.batches += 1
+        self.books, self.chapters, self.notes = [], [], []
+
+    def _insert_books(self, now: datetime) -> None:
+        table = models.Book.__table__
+        rows = [
+            {**book.model_dump(), "user_id": self.user_id, "created_at": now, "updated_at": now}
+            for _, _, book in self.books
+        ]
+        rollup.apply_book_changes(
+            self.db,
+            self.user_id,
+            [(None, rollup.BookSnapshot(r["status"], r["started_at"], r["finished_at"])) for r in rows],
+        )
+        new_ids = self.db.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        for (_, exported_id, _), new_id, row in zip(self.books, new_ids, rows):
+            row.update(id=new_id, book_id=new_id)
+            if exported_id is not None:
+                self.book_ids[exported_id] = new_id
+        self._after_insert("book", rows)
+        self.result.imported += len(rows)
+
+    def _insert_children(self, kind: str, model, pending: List[tuple], now: datetime) -> None:
+        table = model.__table__
+        rows = []
+        for line, exported_book_id, item in pending:
+            book_id = self.book_ids.get(exported_book_id)
+            if book_id is None:
+                self.error(line, f"book_id {exported_book_id!r} does not refer to a book earlier in this import")
+                continue
+            rows.append({**item.model_dump(), "book_id": book_id, "created_at": now, "updated_at": now})
+        if not rows:
+            return
+        new_ids = self.db.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        for row, new_id in zip(rows, new_ids):
+            row.update(id=new_id, user_id=self.user_id)
+        self._after_insert(kind, rows)
+        self.result.imported += len(rows)
+
+    def _after_insert(self, kind: str, rows: List[dict]) -> None:
+        connection = self.db.connection()
+        search.index_rows(connection, kind, rows)
+        sync.record_bulk(connection, self.user_id, kind, [row["id"] for row in rows])
+
+
+def _describe(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors())
+    return str(exc)
+
+
+def _clean_book(record: dict) -> dict:
+    record = {key: value for key, value in record.items() if key in schemas.BookBase.model_fields}
+    status = record.get("status")
+    if isinstance(status, str) and status.strip().lower() in STATUS_ALIASES:
+        record["status"] = STATUS_ALIASES[status.strip().lower()]
+    elif status in (None, ""):
+        record.pop("status", None)
+    for field in ("started_at", "finished_at"):
+        value = record.get(field)
+        if isinstance(value, str):
+            match = _SLASH_DATE.match(value.strip())
+            if match:
+                record[field] = date(*map(int, match.groups())).isoformat()
+    return record
+
+
+def _csv_records(stream: IO[str]) -> Iterator[tuple]:
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    fields = [CSV_HEADER_ALIASES.get(name.strip().lower()) for name in header]
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        record = {field: (cell.strip() or None) for field, cell in zip(fields, row) if field}
+        yield reader.line_num, record
+
+
+def _ndjson_records(stream: IO[str]) -> Iterator[tuple]:
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as exc:
+            yield line_number, exc
+            continue
+        yield line_number, record if isinstance(record, dict) else ValueError("expected a JSON object")
+
+
+def import_stream(db: Session, user_id: int, stream: IO[bytes], fmt: str, encoding: str) -> schemas.ImportResult:
+    text_stream = io.TextIOWrapper(stream, encoding=encoding, newline="")
+    records = _csv_records(text_stream) if fmt == "csv" else _ndjson_records(text_stream)
+    importer = _Importer(db, user_id)
+    try:
+        for line, record in records:
+            if isinstance(record, Exception):
+                importer.error(line, str(record))
+            else:
+                importer.add(line, record)
+    except (UnicodeDecodeError, csv.Error) as exc:
+        importer.error(0, f"could not read input: {exc}")
+    importer.flush()
+    return importer.result
+
+
+# --- Export ---
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, models.BookStatus):
+        return value.value
+    raise TypeError(f"not JSON serializable: {type(value).__name__}")
+
+
+def _export_queries(db: Session, user_id: int, include_children: bool):
+    Book = models.Book
+    yield "book", BOOK_EXPORT_FIELDS, db.query(*(getattr(Book, f) for f in BOOK_EXPORT_FIELDS)).filter(
+        Book.user_id == user_id
+    ).order_by(Book.id)
+    if not include_children:
+        return
+    for kind, model, fields in (
+        ("chapter", models.Chapter, CHAPTER_EXPORT_FIELDS),
+        ("note", models.NotePage, NOTE_EXPORT_FIELDS),
+    ):
+        yield kind, fields, db.query(*(getattr(model, f) for f in fields)).join(Book).filter(
+            Book.user_id == user_id
+        ).order_by(model.book_id, model.id)
+
+
+def export_ndjson(db: Session, user_id: int, include_children: bool = True) -> Iterator[bytes]:
+    for kind, fields, query in _export_queries(db, user_id, include_children):
+        for row in query.yield_per(EXPORT_YIELD_PER):
+            record = {"type": kind, **dict(zip(fields, row))}
+            yield (json.dumps(record, ensure_ascii=False, default=_json_default) + "\n").encode()
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, models.BookStatus):
+        return value.value
+    return value
+
+
+def export_csv(db: Session, user_id: int) -> Iterator[bytes]:
+    # CSV is flat, so only books are exported; use NDJSON to include chapters and notes.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(BOOK_EXPORT_FIELDS)
+    yield ("\ufeff" + buffer.getvalue()).encode()  # BOM so spreadsheet apps detect UTF-8
+    for _, _, query in _export_queries(db, user_id, include_children=False):
+        for row in query.yield_per(EXPORT_YIELD_PER):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow([_csv_value(value) for value in row])
+            yield buffer.getvalue().encode()
@@ -0,0 +1,158 @@
+"""Transparent compression for large text columns.
+
+`CompressedText` keeps short values as plain TEXT and stores values of at least
+BOOK_MEMORY_COMPRESS_MIN_BYTES (UTF-8) as a BLOB: one codec byte followed by the
+compressed payload. SQLite doesn't mind a BLOB in a TEXT column, so no schema
+change is needed and old rows stay readable; the column type tells them apart
+on the way out.
+
+zlib is always available. Set BOOK_MEMORY_COMPRESSION=zstd to write zstd instead
+(needs the optional `zstandard` package, which is then also required to read
+those rows back).
+
+Existing rows are converted in place with:
+    python compression.py migrate [--batch-size 500] [--decompress] [--vacuum]
+"""
+import argparse
+import os
+import zlib
+
+from sqlalchemy import Text, literal_column, select
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("BOOK_MEMORY_COMPRESS_MIN_BYTES", "512"))
+COMPRESSION = os.environ.get("BOOK_MEMORY_COMPRESSION", "zlib")
+ZLIB_LEVEL = int(os.environ.get("BOOK_MEMORY_ZLIB_LEVEL", "6"))
+
+_ZLIB = b"\x01"
+_ZSTD = b"\x02"
+
+if COMPRESSION not in ("zlib", "zstd"):
+    raise RuntimeError(f"BOOK_MEMORY_COMPRESSION must be zlib or zstd, not {COMPRESSION!r}")
+if COMPRESSION == "zstd" and zstandard is None:
+    raise RuntimeError("BOOK_MEMORY_COMPRESSION=zstd needs the zstandard package")
+
+
+def compress(value: str):
+    """Return value unchanged if it is below the threshold, else codec byte + payload."""
+    raw = value.encode("utf-8")
+    if len(raw) < COMPRESS_MIN_BYTES:
+        return value
+    if COMPRESSION == "zstd":
+        packed = _ZSTD + zstandard.ZstdCompressor().compress(raw)
+    else:
+        packed = _ZLIB + zlib.compress(raw, ZLIB_LEVEL)
+    # Markup that barely compresses isn't worth the BLOB.
+    return packed if len(packed) < len(raw) else value
+
+
+def decompress(value):
+    if not isinstance(value, (bytes, bytearray, memoryview)):
+        return value
+    value = bytes(value)
+    codec, payload = value[:1], value[1:]
+    if codec == _ZLIB:
+        return zlib.decompress(payload).decode("utf-8")
+    if codec == _ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Row is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload).decode("utf-8")
+    raise ValueError(f"Unknown compression codec {codec!r}")
+
+
+class CompressedText(TypeDecorator):
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress(value)
+
+
+def compressed_columns():
+    import models  # models imports this module for the column type
+
+    return [
+        (table, column)
+        for table in models.Base.metadata.sorted_tables
+        for column in table.columns
+        if isinstance(column.type, CompressedText)
+    ]
+
+
+def migrate(bind, batch_size: int = 500, reverse: bool = False) -> dict:
+    """Rewrite existing rows to match the current threshold, one keyset batch per transaction.
+
+    Reads the raw column values (bypassing CompressedText) so only rows that
+    actually change are written, and never holds more than one batch in memory.
+    """
+    stats = {"rows": 0, "changed": 0, "bytes_before": 0, "bytes_after": 0}
+    for table, column in compressed_columns():
+        raw = literal_column(f'"{column.name}"')
+        # Single-column primary key: integer ids, or rendered_html's hash key.
+        (key,) = table.primary_key.columns
+        # Driver-level SQL so values go in as-is (str -> TEXT, bytes -> BLOB)
+        # instead of through CompressedText again.
+        statement = f'UPDATE {table.name} SET "{column.name}" = ? WHERE "{key.name}" = ?'
+        last_id = None
+        while True:
+            with bind.begin() as conn:
+                query = select(key, raw).select_from(table).order_by(key).limit(batch_size)
+                if last_id is not None:
+                    query = query.where(key > last_id)
+                rows = conn.execute(query).all()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                updates = []
+                for row_id, value in rows:
+                    if value is None:
+                        continue
+                    stats["rows"] += 1
+                    before = len(value) if isinstance(value, bytes) else len(value.encode("utf-8"))
+                    plain = decompress(value)
+                    target = plain if reverse else compress(plain)
+                    after = len(target) if isinstance(target, bytes) else len(target.encode("utf-8"))
+                    stats["bytes_before"] += before
+                    stats["bytes_after"] += after
+                    if type(target) is not type(value) or target != value:
+                        updates.append((target, row_id))
+                if updates:
+                    conn.exec_driver_sql(statement, updates)
+                stats["changed"] += len(updates)
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compression maintenance for large text columns.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("migrate", help="compress (or with --decompress, expand) existing rows in place")
+    run.add_argument("--batch-size", type=int, default=500)
+    run.add_argument("--decompress", action="store_true", help="store every value as plain TEXT again")
+    run.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to give freed pages back to the OS")
+    args = parser.parse_args()
+
+    import compression  # the module models.py uses, whose CompressedText the columns carry
+    from database import engine
+
+    stats = compression.migrate(engine, batch_size=args.batch_size, reverse=args.decompress)
+    print(
+        f"{stats['changed']} of {stats['rows']} values rewritten; "
+        f"{stats['bytes_before']} -> {stats['bytes_after']} bytes"
+    )
+    if args.vacuum:
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Per-pair conversation summaries backing the inbox.
+
+send_message calls `record_message` in its own transaction, so the inbox is one
+indexed query over `conversations` instead of a history scan per partner.
+"""
+from typing import List, Optional, Tuple
+
+from sqlalchemy import case, func, insert, or_, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, aliased
+
+import models
+import schemas
+from pagination import decode_cursor, encode_cursor
+
+
+def ordered_pair(a: int, b: int) -> Tuple[int, int]:
+    return (a, b) if a < b else (b, a)
+
+
+def record_message(db: Session, message: models.Message) -> None:
+    """Upsert the pair's summary for a flushed message and bump the receiver's unread count."""
+    low, high = ordered_pair(message.sender_id, message.receiver_id)
+    table = models.Conversation.__table__
+    stmt = sqlite_insert(table).values(
+        user_low_id=low,
+        user_high_id=high,
+        last_message_id=message.id,
+        last_message_at=message.created_at,
+        unread_low=1 if message.receiver_id == low else 0,
+        unread_high=1 if message.receiver_id == high else 0,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_low_id, table.c.user_high_id],
+        set_={
+            "last_message_id": stmt.excluded.last_message_id,
+            "last_message_at": stmt.excluded.last_message_at,
+            "unread_low": table.c.unread_low + stmt.excluded.unread_low,
+            "unread_high": table.c.unread_high + stmt.excluded.unread_high,
+        },
+    )
+    db.execute(stmt)
+
+
+def mark_read(db: Session, user_id: int, other_user_id: int) -> bool:
+    low, high = ordered_pair(user_id, other_user_id)
+    field = "unread_low" if user_id == low else "unread_high"
+    result = db.execute(
+        update(models.Conversation)
+        .where(models.Conversation.user_low_id == low, models.Conversation.user_high_id == high)
+        .values({field: 0})
+    )
+    return result.rowcount > 0
+
+
+def list_conversations(
+    db: Session, user_id: int, cursor: Optional[str], limit: int
+) -> Tuple[List[schemas.ConversationOut], Optional[str]]:
+    Conversation = models.Conversation
+    Other = aliased(models.User)
+    is_low = Conversation.user_low_id == user_id
+    other_id = case((is_low, Conversation.user_high_id), else_=Conversation.user_low_id)
+    unread = case((is_low, Conversation.unread_low), else_=Conversation.unread_high)
+
+    query = (
+        db.query(
+            Conversation.id,
+            Conversation.last_message_at,
+            unread.label("unread_count"),
+            Other.id.label("other_id"),
+            Other.username.label("other_username"),
+            models.Message.id.label("message_id"),
+            models.Message.sender_id.label("message_sender_id"),
+            models.Message.content.label("message_content"),
+        )
+        .join(Other, Other.id == other_id)
+        .outerjoin(models.Message, models.Message.id == Conversation.last_message_id)
+        .filter(or_(Conversation.user_low_id == user_id, Conversation.user_high_id == user_id))
+    )
+    if cursor:
+        cursor_at, cursor_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Conversation.last_message_at, Conversation.id) < (cursor_at, cursor_id))
+    rows = query.order_by(Conversation.last_message_at.desc(), Conversation.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].last_message_at, rows[-1].id)
+    items = [
+        schemas.ConversationOut(
+            other_user=schemas.UserOut(id=row.other_id, username=row.other_username),
+            last_message_id=row.message_id,
+            last_message_sender_id=row.message_sender_id,
+            last_message_preview=(row.message_content or "")[:100],
+            last_message_at=row.last_message_at,
+            unread_count=row.unread_count,
+        )
+        for row in rows
+    ]
+    return items, next_cursor
+
+
+def ensure_backfill(bind) -> None:
+    """Build summaries from existing messages the first time the table is used."""
+    Message = models.Message
+    table = models.Conversation.__table__
+    with bind.begin() as conn:
+        if conn.execute(select(table.c.id).limit(1)).first() is not None:
+            return
+        if conn.execute(select(Message.id).limit(1)).first() is None:
+            return
+        low = func.min(Message.sender_id, Message.receiver_id)
+        high = func.max(Message.sender_id, Message.receiver_id)
+        latest = (
+            select(low.label("low"), high.label("high"), func.max(Message.id).label("last_id"))
+            .group_by(low, high)
+            .subquery()
+        )
+        conn.execute(
+            insert(table).from_select(
+                ["user_low_id", "user_high_id", "last_message_id", "last_message_at"],
+                select(latest.c.low, latest.c.high, latest.c.last_id, Message.created_at).join(
+                    Message, Message.id == latest.c.last_id
+                ),
+            )
+        )
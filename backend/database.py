@@ -1,12 +1,75 @@
-from sqlalchemy import create_engine
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./data.db"
+from dbconfig import ASYNC_DRIVER, DATABASE_URL, READ_POOL_SIZE, WRITE_POOL_TIMEOUT, apply_pragmas
+from metrics import instrument_engine
 
+try:
+    import aiosqlite
+    import greenlet  # noqa: F401  SQLAlchemy's asyncio layer runs on it
+except ImportError:  # optional
+    aiosqlite = None
+
+if ASYNC_DRIVER not in ("threadpool", "aiosqlite"):
+    raise RuntimeError(f"BOOK_MEMORY_ASYNC_DRIVER must be threadpool or aiosqlite, not {ASYNC_DRIVER!r}")
+if ASYNC_DRIVER == "aiosqlite" and aiosqlite is None:
+    raise RuntimeError("BOOK_MEMORY_ASYNC_DRIVER=aiosqlite needs the aiosqlite and greenlet packages")
+
+SQLALCHEMY_DATABASE_URL = DATABASE_URL
+
+# Single writer connection: write transactions are serialized by the pool.
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=1,
+    max_overflow=0,
+    pool_timeout=WRITE_POOL_TIMEOUT,
+)
+read_engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=READ_POOL_SIZE,
+    max_overflow=READ_POOL_SIZE,
 )
+
+
+@event.listens_for(engine, "connect")
+def _configure_writer(dbapi_connection, connection_record):
+    apply_pragmas(dbapi_connection)
+
+
+@event.listens_for(read_engine, "connect")
+def _configure_reader(dbapi_connection, connection_record):
+    apply_pragmas(dbapi_connection, read_only=True)
+
+
+instrument_engine(engine)
+instrument_engine(read_engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Async handlers only read. Writes stay on the single sync writer connection,
+# since SQLite serializes them either way.
+async_read_engine = None
+AsyncReadSessionLocal = None
+if ASYNC_DRIVER == "aiosqlite":
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_read_engine = create_async_engine(
+        make_url(SQLALCHEMY_DATABASE_URL).set(drivername="sqlite+aiosqlite"),
+        pool_size=READ_POOL_SIZE,
+        max_overflow=READ_POOL_SIZE,
+    )
+
+    @event.listens_for(async_read_engine.sync_engine, "connect")
+    def _configure_async_reader(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, read_only=True)
+
+    instrument_engine(async_read_engine.sync_engine)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -17,3 +80,37 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """Session on the read-only pool, for handlers that never write."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class ThreadedSession:
+    """The AsyncSession surface async handlers use, backed by a sync read session.
+
+    `run_sync` runs the function with the session in a worker thread.
+    """
+
+    def __init__(self, session):
+        self._session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self._session, *args, **kwargs)
+
+    async def close(self):
+        await run_in_threadpool(self._session.close)
+
+
+async def get_async_read_db():
+    """Read session for `async def` handlers: do the ORM work inside `await db.run_sync(fn)`."""
+    db = AsyncReadSessionLocal() if AsyncReadSessionLocal is not None else ThreadedSession(ReadSessionLocal())
+    try:
+        yield db
+    finally:
+        await db.close()
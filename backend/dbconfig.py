@@ -0,0 +1,39 @@
+"""SQLite connection settings, overridable through BOOK_MEMORY_* environment variables."""
+import os
+
+DATABASE_URL = os.environ.get("BOOK_MEMORY_DATABASE_URL", "sqlite:///./data.db")
+
+# Applied to every new DBAPI connection. WAL lets readers keep going while the
+# writer commits; synchronous=NORMAL is durable across app crashes in WAL mode.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("BOOK_MEMORY_SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("BOOK_MEMORY_SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("BOOK_MEMORY_SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.environ.get("BOOK_MEMORY_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.environ.get("BOOK_MEMORY_SQLITE_CACHE_SIZE", "-65536")),  # negative = KiB
+    "temp_store": os.environ.get("BOOK_MEMORY_SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+# Readers get their own pool; all writes in a process share one connection so
+# they queue in the pool instead of fighting over the database lock.
+READ_POOL_SIZE = int(os.environ.get("BOOK_MEMORY_READ_POOL_SIZE", "8"))
+WRITE_POOL_TIMEOUT = float(os.environ.get("BOOK_MEMORY_WRITE_POOL_TIMEOUT", "30"))
+# How `async def` read handlers reach the database: "threadpool" runs their ORM
+# code on the sync read pool in a worker thread (one hop per request);
+# "aiosqlite" uses an async engine (needs the optional aiosqlite package).
+ASYNC_DRIVER = os.environ.get("BOOK_MEMORY_ASYNC_DRIVER", "threadpool")
+
+
+def apply_pragmas(dbapi_connection, read_only: bool = False) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            if read_only and name == "journal_mode":
+                continue  # persistent per database file; the writer sets it
+            cursor.execute(f"PRAGMA {name}={value}")
+        # Off by default in SQLite and per connection; the schema relies on ON DELETE CASCADE.
+        cursor.execute("PRAGMA foreign_keys=ON")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
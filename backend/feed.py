@@ -0,0 +1,215 @@
+"""Home feed: what the people you follow are reading.
+
+Mapper events write one `activities` row per event (book added or status
+changed, book finished, note page created) in the same transaction as the
+change. If the actor has at most FEED_FANOUT_LIMIT followers, the activity is
+also copied into every follower's `feed_entries` with a single INSERT ... SELECT,
+so reading a feed is one index range scan. Feeds are trimmed back to
+FEED_MAX_ENTRIES every FEED_TRIM_EVERY activities, in one DELETE that only
+looks at the feeds which received entries since the previous trim.
+
+Activities of users with more followers than that are not copied; readers pull
+them from `activities` (fan-out on read) and merge them in. Entries are keyed by
+activity id, so an actor crossing the limit never shows up twice.
+
+Deleting a book, note page or user takes its activities and their feed entries
+with it through ON DELETE CASCADE.
+"""
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete, event, insert, literal, select, text, tuple_
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.attributes import get_history
+
+import models
+from pagination import decode_cursor, encode_cursor
+
+FEED_MAX_ENTRIES = int(os.environ.get("BOOK_MEMORY_FEED_MAX_ENTRIES", "500"))
+FEED_FANOUT_LIMIT = int(os.environ.get("BOOK_MEMORY_FEED_FANOUT_LIMIT", "1000"))
+FEED_TRIM_EVERY = int(os.environ.get("BOOK_MEMORY_FEED_TRIM_EVERY", "100"))
+# How many of a user's recent activities a new follower gets straight away.
+FOLLOW_BACKFILL = 20
+
+_activities = models.Activity.__table__
+_entries = models.FeedEntry.__table__
+_follows = models.Follow.__table__
+_users = models.User.__table__
+
+_TRIM = text(
+    """
+    DELETE FROM feed_entries
+    WHERE owner_id = :owner_id
+      AND (created_at, activity_id) <= (
+        SELECT created_at, activity_id FROM feed_entries
+        WHERE owner_id = :owner_id
+        ORDER BY created_at DESC, activity_id DESC
+        LIMIT 1 OFFSET :keep
+      )
+    """
+)
+
+# _TRIM for every feed that got an entry for an activity after :since, in one
+# statement: find each feed's (:keep + 1)-th newest entry by an index walk, then
+# delete that entry and everything older. Feeds under the cap have no such entry.
+_TRIM_RECENT = text(
+    """
+    DELETE FROM feed_entries WHERE rowid IN (
+      SELECT e.rowid
+      FROM (
+        SELECT (
+          SELECT rowid FROM feed_entries AS k
+          WHERE k.owner_id = touched.owner_id
+          ORDER BY k.created_at DESC, k.activity_id DESC
+          LIMIT 1 OFFSET :keep
+        ) AS cut_rowid
+        FROM (SELECT DISTINCT owner_id FROM feed_entries WHERE activity_id > :since) AS touched
+      ) AS cuts
+      JOIN feed_entries AS cut ON cut.rowid = cuts.cut_rowid
+      JOIN feed_entries AS e ON e.owner_id = cut.owner_id
+        AND (e.created_at, e.activity_id) <= (cut.created_at, cut.activity_id)
+    )
+    """
+)
+
+
+def fans_out(connection, user_id: int) -> bool:
+    """True unless user_id has more than FEED_FANOUT_LIMIT followers."""
+    count = connection.execute(select(_users.c.follower_count).where(_users.c.id == user_id)).scalar()
+    return (count or 0) <= FEED_FANOUT_LIMIT
+
+
+def _trim(connection, owner_id: int) -> None:
+    connection.execute(_TRIM, {"owner_id": owner_id, "keep": FEED_MAX_ENTRIES})
+
+
+def trim_recent(connection, since: int) -> None:
+    """Trim every feed that received an entry for an activity newer than `since` (0: all feeds)."""
+    connection.execute(_TRIM_RECENT, {"since": since, "keep": FEED_MAX_ENTRIES})
+
+
+def publish(connection, actor_id: int, kind: str, book_id: int, book_title: str, status=None,
+            note_id: Optional[int] = None, note_title: Optional[str] = None) -> None:
+    now = datetime.utcnow()
+    activity_id = connection.execute(
+        insert(_activities).values(
+            actor_id=actor_id,
+            kind=kind,
+            book_id=book_id,
+            book_title=book_title,
+            status=status,
+            note_id=note_id,
+            note_title=note_title,
+            created_at=now,
+        )
+    ).inserted_primary_key[0]
+    if fans_out(connection, actor_id):
+        connection.execute(
+            insert(_entries).from_select(
+                ["owner_id", "activity_id", "actor_id", "created_at"],
+                select(_follows.c.follower_id, literal(activity_id), literal(actor_id), literal(now)).where(
+                    _follows.c.following_id == actor_id
+                ),
+            )
+        )
+    # Feeds only grow by receiving entries, so a feed over the cap is always
+    # covered by a later pass even if the transaction running this one rolls back.
+    if activity_id % FEED_TRIM_EVERY == 0:
+        trim_recent(connection, activity_id - FEED_TRIM_EVERY)
+
+
+def _book_kind(status) -> str:
+    return "finished" if status == models.BookStatus.READ else "status"
+
+
+@event.listens_for(models.Book, "after_insert")
+def _book_added(mapper, connection, book):
+    publish(connection, book.user_id, _book_kind(book.status), book.id, book.title, status=book.status)
+
+
+@event.listens_for(models.Book, "after_update")
+def _book_updated(mapper, connection, book):
+    if get_history(book, "status").has_changes():
+        publish(connection, book.user_id, _book_kind(book.status), book.id, book.title, status=book.status)
+
+
+@event.listens_for(models.NotePage, "after_insert")
+def _note_added(mapper, connection, note):
+    book = connection.execute(
+        select(models.Book.user_id, models.Book.title).where(models.Book.id == note.book_id)
+    ).one()
+    publish(connection, book.user_id, "note", note.book_id, book.title, note_id=note.id, note_title=note.title)
+
+
+@event.listens_for(models.Follow, "after_insert")
+def _followed(mapper, connection, follow):
+    # Seed the new follower's feed; large accounts are read on demand anyway.
+    if not fans_out(connection, follow.following_id):
+        return
+    recent = (
+        select(_activities.c.id, _activities.c.actor_id, _activities.c.created_at)
+        .where(_activities.c.actor_id == follow.following_id)
+        .order_by(_activities.c.created_at.desc(), _activities.c.id.desc())
+        .limit(FOLLOW_BACKFILL)
+    )
+    rows = connection.execute(recent).all()
+    if rows:
+        connection.execute(
+            insert(_entries).prefix_with("OR IGNORE"),
+            [
+                {"owner_id": follow.follower_id, "activity_id": row.id, "actor_id": row.actor_id, "created_at": row.created_at}
+                for row in rows
+            ],
+        )
+        _trim(connection, follow.follower_id)
+
+
+@event.listens_for(models.Follow, "after_delete")
+def _unfollowed(mapper, connection, follow):
+    connection.execute(
+        delete(_entries).where(_entries.c.owner_id == follow.follower_id, _entries.c.actor_id == follow.following_id)
+    )
+
+
+def _pulled_actors(db: Session, user_id: int) -> List[int]:
+    """Followed users whose activities aren't fanned out to their followers."""
+    rows = (
+        db.query(models.Follow.following_id)
+        .join(models.User, models.User.id == models.Follow.following_id)
+        .filter(models.Follow.follower_id == user_id, models.User.follower_count > FEED_FANOUT_LIMIT)
+        .all()
+    )
+    return [row.following_id for row in rows]
+
+
+def feed_page(db: Session, user_id: int, cursor: Optional[str], limit: int) -> Tuple[List[models.Activity], Optional[str]]:
+    after = decode_cursor(cursor) if cursor else None
+    Entry, Activity = models.FeedEntry, models.Activity
+
+    pushed = db.query(Entry.created_at, Entry.activity_id.label("id")).filter(Entry.owner_id == user_id)
+    if after:
+        pushed = pushed.filter(tuple_(Entry.created_at, Entry.activity_id) < after)
+    candidates = pushed.order_by(Entry.created_at.desc(), Entry.activity_id.desc()).limit(limit + 1).all()
+
+    # One bounded query per large account keeps each on its (actor_id, created_at, id) index.
+    for actor_id in _pulled_actors(db, user_id):
+        pulled = db.query(Activity.created_at, Activity.id).filter(Activity.actor_id == actor_id)
+        if after:
+            pulled = pulled.filter(tuple_(Activity.created_at, Activity.id) < after)
+        candidates += pulled.order_by(Activity.created_at.desc(), Activity.id.desc()).limit(limit + 1).all()
+
+    keys = sorted({(row.created_at, row.id) for row in candidates}, reverse=True)[: limit + 1]
+    next_cursor = None
+    if len(keys) > limit:
+        keys = keys[:limit]
+        next_cursor = encode_cursor(*keys[-1])
+    if not keys:
+        return [], None
+    by_id = {
+        activity.id: activity
+        for activity in db.query(Activity)
+        .options(joinedload(Activity.actor))
+        .filter(Activity.id.in_([activity_id for _, activity_id in keys]))
+    }
+    return [by_id[activity_id] for _, activity_id in keys], next_cursor
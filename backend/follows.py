@@ -0,0 +1,131 @@
+"""Follower/following listings and the per-user counts behind them.
+
+`users.follower_count` / `following_count` are bumped by mapper events in the
+same transaction as the follow row, as relative UPDATEs, so concurrent follows
+never lose an increment. Listings join `users` and work out the mutual-follow
+flags with EXISTS probes on the (follower_id, following_id) unique index, all in
+one keyset-paginated query.
+"""
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event, exists, func, select, tuple_, update
+from sqlalchemy.orm import Session, aliased
+
+import models
+import schemas
+from pagination import decode_cursor, encode_cursor
+
+_users = models.User.__table__
+
+
+def _bump(connection, follower_id: int, following_id: int, delta: int) -> None:
+    connection.execute(
+        update(_users).where(_users.c.id == follower_id).values(following_count=_users.c.following_count + delta)
+    )
+    connection.execute(
+        update(_users).where(_users.c.id == following_id).values(follower_count=_users.c.follower_count + delta)
+    )
+
+
+@event.listens_for(models.Follow, "after_insert")
+def _followed(mapper, connection, follow):
+    _bump(connection, follow.follower_id, follow.following_id, 1)
+
+
+@event.listens_for(models.Follow, "after_delete")
+def _unfollowed(mapper, connection, follow):
+    _bump(connection, follow.follower_id, follow.following_id, -1)
+
+
+def drop_user(connection, user_id: int) -> None:
+    """Take a user out of the counts of everyone they follow or are followed by.
+
+    Call before deleting the user; the follows rows themselves go by ON DELETE CASCADE.
+    """
+    follows = models.Follow.__table__
+    connection.execute(
+        update(_users)
+        .where(_users.c.id.in_(select(follows.c.following_id).where(follows.c.follower_id == user_id)))
+        .values(follower_count=_users.c.follower_count - 1)
+    )
+    connection.execute(
+        update(_users)
+        .where(_users.c.id.in_(select(follows.c.follower_id).where(follows.c.following_id == user_id)))
+        .values(following_count=_users.c.following_count - 1)
+    )
+
+
+def list_follows(
+    db: Session, user_id: int, viewer_id: int, direction: str, cursor: Optional[str], limit: int
+) -> Tuple[List[schemas.FollowListItem], Optional[str]]:
+    """direction="followers": who follows user_id; "following": whom user_id follows."""
+    Follow = models.Follow
+    Other = aliased(models.User)
+    if direction == "followers":
+        own, other = Follow.following_id, Follow.follower_id
+    else:
+        own, other = Follow.follower_id, Follow.following_id
+    Mine, Theirs = aliased(Follow), aliased(Follow)
+    viewer_follows = exists().where(Mine.follower_id == viewer_id, Mine.following_id == Other.id)
+    follows_viewer = exists().where(Theirs.follower_id == Other.id, Theirs.following_id == viewer_id)
+
+    query = (
+        db.query(
+            Follow.id,
+            Follow.created_at,
+            Other.id.label("user_id"),
+            Other.username,
+            Other.follower_count,
+            Other.following_count,
+            viewer_follows.label("is_following"),
+            follows_viewer.label("follows_you"),
+        )
+        .join(Other, Other.id == other)
+        .filter(own == user_id)
+    )
+    if cursor:
+        cursor_at, cursor_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Follow.created_at, Follow.id) < (cursor_at, cursor_id))
+    rows = query.order_by(Follow.created_at.desc(), Follow.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    items = [
+        schemas.FollowListItem(
+            user=schemas.UserProfileOut(
+                id=row.user_id,
+                username=row.username,
+                follower_count=row.follower_count,
+                following_count=row.following_count,
+            ),
+            is_following=row.is_following,
+            follows_you=row.follows_you,
+            followed_at=row.created_at,
+        )
+        for row in rows
+    ]
+    return items, next_cursor
+
+
+def ensure_backfill(bind) -> None:
+    """Fill the counters from existing follows the first time the columns are used."""
+    Follow = models.Follow
+    with bind.begin() as conn:
+        if conn.execute(select(Follow.id).limit(1)).first() is None:
+            return
+        if conn.execute(
+            select(_users.c.id).where((_users.c.follower_count > 0) | (_users.c.following_count > 0)).limit(1)
+        ).first() is not None:
+            return
+        conn.execute(
+            update(_users).values(
+                follower_count=select(func.count())
+                .where(Follow.following_id == _users.c.id)
+                .scalar_subquery(),
+                following_count=select(func.count())
+                .where(Follow.follower_id == _users.c.id)
+                .scalar_subquery(),
+            )
+        )
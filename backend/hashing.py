@@ -0,0 +1,99 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+# Kept free of app/database imports: the pool's worker processes import this module.
+BCRYPT_ROUNDS = int(os.environ.get("BOOK_MEMORY_BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.environ.get("BOOK_MEMORY_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+HASH_MAX_PENDING = int(os.environ.get("BOOK_MEMORY_HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+HASH_RETRY_AFTER_SECONDS = 1
+
+# Setting rounds makes needs_update() flag hashes made with any other cost, which
+# is what drives rehash-on-login after BOOK_MEMORY_BCRYPT_ROUNDS changes.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+T = TypeVar("T")
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    return pwd_context.needs_update(hashed_password)
+
+
+def _warm_up() -> None:
+    pass
+
+
+class HashingPool:
+    """Process pool for bcrypt work with a hard cap on queued jobs.
+
+    Keeps hashing off the threadpool the sync endpoints share; once
+    `max_pending` jobs are in flight new callers get a 503 instead of queueing.
+    Workers are spawned rather than forked: a fork would copy the parent's
+    threads, locks and open SQLite connections into each child.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def start(self) -> None:
+        """Start the workers now so the first login does not wait for them to spawn."""
+        executor = self._get_executor()
+        for _ in range(self.workers):
+            executor.submit(_warm_up)
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Authentication is busy, please retry",
+                    headers={"Retry-After": str(HASH_RETRY_AFTER_SECONDS)},
+                )
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hashing_pool = HashingPool(workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING)
+
+
+async def hash_password_async(password: str) -> str:
+    return await hashing_pool.run(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await hashing_pool.run(check_password, plain_password, hashed_password)
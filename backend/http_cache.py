@@ -0,0 +1,57 @@
+"""ETag / conditional GET helpers for per-user read endpoints.
+
+The ETag is derived from the user's sync version (sync.current_version), which
+moves on every write to their books, chapters, notes or comments. Checking it
+costs one index lookup, so a 304 is answered before any collection is loaded.
+"""
+import os
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+
+import sync
+
+# Bump when the shape of a cached response changes, so old ETags stop matching.
+ETAG_SCHEMA_VERSION = "1"
+# "private" by default: responses are per user. Deployments whose proxy honours
+# Vary: Authorization can set e.g. "no-cache, must-revalidate" to allow shared caching.
+CACHE_CONTROL = os.environ.get("BOOK_MEMORY_HTTP_CACHE_CONTROL", "private, no-cache")
+
+
+def make_etag(user_id: int, version: int, variant: str = "") -> str:
+    # `variant` separates representations that change without a sync version bump (e.g. rendered HTML).
+    suffix = f"-{variant}" if variant else ""
+    return f'"{ETAG_SCHEMA_VERSION}-{user_id}-{version}{suffix}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses weak comparison, so a W/ prefix still matches.
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Authorization"}
+
+
+def conditional_get(
+    request: Request, response: Response, db: Session, user_id: int, variant: str = ""
+) -> Optional[Response]:
+    """Return a 304 response if the client's copy is current, else set caching headers on `response`."""
+    etag = make_etag(user_id, sync.current_version(db, user_id), variant)
+    headers = cache_headers(etag)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def uncacheable(response: Response) -> None:
+    """Drop the validator from a response that is known to be incomplete (e.g. HTML still rendering)."""
+    if "etag" in response.headers:
+        del response.headers["etag"]
+    response.headers["Cache-Control"] = "no-store"
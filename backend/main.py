@@ -1,24 +1,77 @@
+import codecs
+import tempfile
+from contextlib import asynccontextmanager
 from datetime import datetime, date
 from typing import List, Optional
 
-from fastapi import Depends, FastAPI, HTTPException, status
+from fastapi import (
+    BackgroundTasks,
+    Depends,
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import and_, extract, or_
-from sqlalchemy.orm import Session
-
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, load_only, selectinload, undefer
+
+import accounts
+import batch
+import bulk
+import conversations
+import feed
+import follows
+import http_cache
+import metrics
 import models
+import reading_calendar
+import rendering
+import revisions
+import rollup
 import schemas
+import search
+import serializers
+import stats
+import sync
 from auth import (
+    CurrentUser,
+    authenticate_token,
     create_access_token,
     get_current_user,
-    get_password_hash,
-    verify_password,
+    get_current_user_async,
+    invalidate_user,
 )
-from database import Base, engine, get_db
+from database import Base, ReadSessionLocal, SessionLocal, engine, get_async_read_db, get_db, get_read_db
+from hashing import hash_password_async, hashing_pool, password_needs_rehash, verify_password_async
+from migrations import run_migrations
+from pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor
+from autosave import check_revision, write_buffer
+from realtime import message_hub
 
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    write_buffer.start()
+    rendering.render_worker.start()
+    hashing_pool.start()
+    yield
+    write_buffer.shutdown()
+    rendering.render_worker.shutdown()
+    hashing_pool.shutdown()
 
-app = FastAPI(title="Book Memory API")
+
+app = FastAPI(title="Book Memory API", lifespan=lifespan)
 
 # Adjust origins as needed in production
 origins = [
@@ -32,28 +85,56 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+# Outermost, so recorded latency includes the other middleware.
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_threadpool()
 
 
 @app.post("/api/auth/signup", response_model=schemas.Token)
-def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(models.User).filter(models.User.username == user.username).first()
+async def signup(
+    user: schemas.UserCreate,
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
+):
+    # DB work stays on the threadpool; bcrypt goes to the hashing process pool. The
+    # writer connection is only checked out after hashing, for the INSERT itself.
+    existing = await run_in_threadpool(
+        lambda: read_db.query(models.User.id).filter(models.User.username == user.username).first()
+    )
     if existing:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password_async(user.password)
     new_user = models.User(username=user.username, password_hash=hashed_password)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    access_token = create_access_token(data={"sub": new_user.username})
+    await run_in_threadpool(db.commit)
+    access_token = create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @app.post("/api/auth/login", response_model=schemas.Token)
-def login(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
-    if not db_user or not verify_password(user.password, db_user.password_hash):
+async def login(
+    user: schemas.UserCreate,
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
+):
+    db_user = await run_in_threadpool(
+        lambda: read_db.query(models.User.id, models.User.username, models.User.password_hash)
+        .filter(models.User.username == user.username)
+        .first()
+    )
+    if not db_user or not await verify_password_async(user.password, db_user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
+    if password_needs_rehash(db_user.password_hash):
+        # BOOK_MEMORY_BCRYPT_ROUNDS changed since this hash was made; upgrade it while we have the plaintext.
+        new_hash = await hash_password_async(user.password)
+
+        def save_hash():
+            db.query(models.User).filter(models.User.id == db_user.id).update({"password_hash": new_hash})
+            db.commit()
+
+        await run_in_threadpool(save_hash)
     access_token = create_access_token(data={"sub": db_user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -64,50 +145,221 @@ def logout():
     return {"message": "Logged out"}
 
 
+@app.delete("/api/users/me", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_account(
+    body: schemas.AccountDelete,
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    password_hash = await run_in_threadpool(
+        lambda: read_db.query(models.User.password_hash).filter(models.User.id == current_user.id).scalar()
+    )
+    if password_hash is None or not await verify_password_async(body.password, password_hash):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Incorrect password")
+
+    def remove():
+        accounts.delete_account(db, current_user.id)
+        db.commit()
+
+    await run_in_threadpool(remove)
+    # Core DELETE: the User after_delete hook that clears cached tokens doesn't fire.
+    invalidate_user(current_user.id)
+    return None
+
+
+def parse_book_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    if fields == "summary":
+        return list(schemas.BOOK_SUMMARY_FIELDS)
+    selected = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in schemas.BOOK_SPARSE_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}",
+        )
+    if "id" not in selected:
+        selected.insert(0, "id")
+    return selected
+
+
 @app.get("/api/books", response_model=List[schemas.BookOut])
-def list_books(
+async def list_books(
+    request: Request,
+    response: Response,
     status_filter: Optional[models.BookStatus] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    render: bool = False,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
 ):
-    query = db.query(models.Book).filter(models.Book.user_id == current_user.id)
-    if status_filter:
-        query = query.filter(models.Book.status == status_filter)
-    books = query.order_by(models.Book.created_at.desc()).all()
-    return books
+    def load(db: Session):
+        selected = parse_book_fields(fields)
+        # Sparse field lists carry no rendered_html, so ?render only applies to full books.
+        with_html = render and selected is None
+        variant = rendering.ETAG_VARIANT if with_html else ""
+        not_modified = http_cache.conditional_get(request, response, db, current_user.id, variant)
+        if not_modified:
+            return not_modified
+        criteria = [models.Book.user_id == current_user.id]
+        if status_filter:
+            criteria.append(models.Book.status == status_filter)
+        if cursor:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+            criteria.append(tuple_(models.Book.created_at, models.Book.id) < (cursor_created_at, cursor_id))
+        if serializers.FAST_JSON:
+            rows, next_cursor = serializers.books(db, criteria, limit, selected)
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            if with_html and rendering.attach_books(db, rows):
+                http_cache.uncacheable(response)
+            return serializers.ORJSONResponse(rows, headers=dict(response.headers))
+        query = db.query(models.Book).filter(*criteria)
+        if selected is None:
+            query = query.options(
+                undefer(models.Book.note_markdown),
+                selectinload(models.Book.chapters),
+                selectinload(models.Book.notes),
+            )
+        else:
+            # Deferred at the SQL level: columns outside `selected` are never read from SQLite.
+            columns = {"created_at", *selected}
+            query = query.options(load_only(*(getattr(models.Book, name) for name in columns)))
+        query = query.order_by(models.Book.created_at.desc(), models.Book.id.desc())
+
+        if limit is None:
+            books = query.all()
+            next_cursor = None
+        else:
+            books = query.limit(limit + 1).all()
+            next_cursor = None
+            if len(books) > limit:
+                next_cursor = encode_cursor(books[limit - 1].created_at, books[limit - 1].id)
+            books = books[:limit]
+
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        if selected is not None:
+            rows = [{name: getattr(book, name) for name in selected} for book in books]
+            return JSONResponse(jsonable_encoder(rows), headers=dict(response.headers))
+        items = [schemas.BookOut.model_validate(book) for book in books]
+        if with_html and rendering.attach_books(db, items):
+            http_cache.uncacheable(response)
+        return items
+
+    return await db.run_sync(load)
 
 
 @app.post("/api/books", response_model=schemas.BookOut, status_code=status.HTTP_201_CREATED)
 def create_book(
     book: schemas.BookCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     # TODO: integrate Amazon Product Advertising API to auto-populate URLs and cover images.
     new_book = models.Book(
         **book.dict(),
         user_id=current_user.id,
     )
+    rollup.apply_book_change(db, current_user.id, None, rollup.snapshot(new_book))
     db.add(new_book)
     db.commit()
     db.refresh(new_book)
     return new_book
 
 
+# Spooled to disk past this size while the request body streams in.
+IMPORT_SPOOL_MAX_MEMORY = 1024 * 1024
+IMPORT_CONTENT_TYPES = {"text/csv": "csv", "application/x-ndjson": "ndjson", "application/jsonl": "ndjson"}
+
+
+@app.post("/api/books/import", response_model=schemas.ImportResult)
+async def import_books(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    encoding: str = "utf-8-sig",
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown encoding: {encoding}")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = format or IMPORT_CONTENT_TYPES.get(content_type, "ndjson")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_MAX_MEMORY)
+    try:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+
+        def run_import():
+            db = SessionLocal()
+            try:
+                return bulk.import_stream(db, current_user.id, spool, fmt, encoding)
+            finally:
+                db.close()
+
+        return await run_in_threadpool(run_import)
+    finally:
+        spool.close()
+
+
+@app.get("/api/books/export")
+def export_books(
+    format: str = Query("ndjson", pattern="^(csv|ndjson)$"),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    # The generator owns its session: it outlives this function while the response streams.
+    def rows():
+        db = ReadSessionLocal()
+        try:
+            if format == "csv":
+                yield from bulk.export_csv(db, current_user.id)
+            else:
+                yield from bulk.export_ndjson(db, current_user.id)
+        finally:
+            db.close()
+
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"books.{'csv' if format == 'csv' else 'ndjson'}"
+    return StreamingResponse(
+        rows(), media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 @app.get("/api/books/{book_id}", response_model=schemas.BookOut)
-def get_book(
+async def get_book(
     book_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    render: bool = False,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
 ):
-    book = (
-        db.query(models.Book)
-        .filter(models.Book.id == book_id, models.Book.user_id == current_user.id)
-        .first()
-    )
-    if not book:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
-    return book
+    def load(db: Session):
+        variant = rendering.ETAG_VARIANT if render else ""
+        not_modified = http_cache.conditional_get(request, response, db, current_user.id, variant)
+        if not_modified:
+            return not_modified
+        book = (
+            db.query(models.Book)
+            .options(undefer(models.Book.note_markdown))
+            .filter(models.Book.id == book_id, models.Book.user_id == current_user.id)
+            .first()
+        )
+        if not book:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+        item = schemas.BookOut.model_validate(book)
+        if render and rendering.attach_books(db, [item]):
+            http_cache.uncacheable(response)
+        return item
+
+    return await db.run_sync(load)
 
 
 @app.put("/api/books/{book_id}", response_model=schemas.BookOut)
@@ -115,7 +367,7 @@ def update_book(
     book_id: int,
     book_update: schemas.BookUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     book = (
         db.query(models.Book)
@@ -125,10 +377,12 @@ def update_book(
     if not book:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
 
+    before = rollup.snapshot(book)
     update_data = book_update.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(book, field, value)
     book.updated_at = datetime.utcnow()
+    rollup.apply_book_change(db, current_user.id, before, rollup.snapshot(book))
 
     db.commit()
     db.refresh(book)
@@ -139,7 +393,7 @@ def update_book(
 def delete_book(
     book_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     book = (
         db.query(models.Book)
@@ -149,6 +403,8 @@ def delete_book(
     if not book:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
 
+    rollup.apply_book_change(db, current_user.id, rollup.snapshot(book), None)
+    write_buffer.discard(book_id=book.id)
     db.delete(book)
     db.commit()
     return None
@@ -156,19 +412,43 @@ def delete_book(
 
 # --- Chapter APIs ---
 @app.get("/api/books/{book_id}/chapters", response_model=List[schemas.ChapterOut])
-def list_chapters(
+async def list_chapters(
     book_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    render: bool = False,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
 ):
-    book = (
-        db.query(models.Book)
-        .filter(models.Book.id == book_id, models.Book.user_id == current_user.id)
-        .first()
-    )
-    if not book:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
-    return book.chapters
+    if write_buffer.has_pending(book_id):
+        await run_in_threadpool(write_buffer.flush_book, book_id)
+
+    def load(db: Session):
+        variant = rendering.ETAG_VARIANT if render else ""
+        not_modified = http_cache.conditional_get(request, response, db, current_user.id, variant)
+        if not_modified:
+            return not_modified
+        if serializers.FAST_JSON:
+            owned = db.query(models.Book.id).filter(models.Book.id == book_id, models.Book.user_id == current_user.id)
+            if owned.first() is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+            rows = serializers.chapters_by_book(db, [book_id]).get(book_id, [])
+            if render and rendering.attach(db, rendering.MARKDOWN, rows, "note_markdown"):
+                http_cache.uncacheable(response)
+            return serializers.ORJSONResponse(rows, headers=dict(response.headers))
+        book = (
+            db.query(models.Book)
+            .filter(models.Book.id == book_id, models.Book.user_id == current_user.id)
+            .first()
+        )
+        if not book:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+        items = [schemas.ChapterOut.model_validate(chapter) for chapter in book.chapters]
+        if render and rendering.attach(db, rendering.MARKDOWN, items, "note_markdown"):
+            http_cache.uncacheable(response)
+        return items
+
+    return await db.run_sync(load)
 
 
 @app.post("/api/books/{book_id}/chapters", response_model=schemas.ChapterOut, status_code=status.HTTP_201_CREATED)
@@ -176,7 +456,7 @@ def create_chapter(
     book_id: int,
     chapter: schemas.ChapterCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     book = (
         db.query(models.Book)
@@ -196,12 +476,32 @@ def create_chapter(
     return new_chapter
 
 
+@app.post("/api/books/{book_id}/chapters:batch", response_model=List[schemas.ChapterOut])
+def batch_chapters(
+    book_id: int,
+    payload: schemas.ChapterBatch,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    book = (
+        db.query(models.Book)
+        .filter(models.Book.id == book_id, models.Book.user_id == current_user.id)
+        .first()
+    )
+    if not book:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+    write_buffer.flush(db, book_id=book.id)
+    batch.apply_batch(db, batch.CHAPTERS, book, payload.operations)
+    db.commit()
+    return batch.list_rows(db, batch.CHAPTERS, book)
+
+
 @app.put("/api/chapters/{chapter_id}", response_model=schemas.ChapterOut)
 def update_chapter(
     chapter_id: int,
     chapter_update: schemas.ChapterUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     chapter = (
         db.query(models.Chapter)
@@ -212,7 +512,9 @@ def update_chapter(
     if not chapter:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chapter not found")
 
-    for field, value in chapter_update.dict(exclude_unset=True).items():
+    write_buffer.flush(db, "chapter", chapter.id)
+    check_revision(chapter_update.base_revision, chapter.revision)
+    for field, value in chapter_update.dict(exclude_unset=True, exclude={"base_revision"}).items():
         setattr(chapter, field, value)
     chapter.updated_at = datetime.utcnow()
     db.commit()
@@ -220,11 +522,74 @@ def update_chapter(
     return chapter
 
 
+@app.patch("/api/chapters/{chapter_id}/note_markdown", response_model=schemas.TextPatchResult)
+def patch_chapter_note(
+    chapter_id: int,
+    patch: schemas.TextPatch,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    revision, text = write_buffer.patch(db, "chapter", chapter_id, current_user.id, patch.base_revision, patch.ops)
+    return {"id": chapter_id, "revision": revision, "length": len(text.encode("utf-16-le")) // 2}
+
+
+def owned_chapter(db: Session, chapter_id: int, user_id: int) -> models.Chapter:
+    chapter = (
+        db.query(models.Chapter)
+        .join(models.Book)
+        .filter(models.Chapter.id == chapter_id, models.Book.user_id == user_id)
+        .first()
+    )
+    if not chapter:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chapter not found")
+    return chapter
+
+
+@app.get("/api/chapters/{chapter_id}/revisions", response_model=List[schemas.TextRevisionOut])
+def list_chapter_revisions(
+    chapter_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    chapter = owned_chapter(db, chapter_id, current_user.id)
+    write_buffer.flush_book(chapter.book_id)
+    return revisions.list_revisions(db, "chapter", chapter.id)
+
+
+@app.get("/api/chapters/{chapter_id}/revisions/{revision}", response_model=schemas.TextRevisionContent)
+def get_chapter_revision(
+    chapter_id: int,
+    revision: int,
+    db: Session = Depends(get_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    chapter = owned_chapter(db, chapter_id, current_user.id)
+    write_buffer.flush_book(chapter.book_id)
+    return {"revision": revision, "text": revisions.require_text_at(db, "chapter", chapter.id, revision)}
+
+
+@app.post("/api/chapters/{chapter_id}/revisions/{revision}/restore", response_model=schemas.ChapterOut)
+def restore_chapter_revision(
+    chapter_id: int,
+    revision: int,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    chapter = owned_chapter(db, chapter_id, current_user.id)
+    write_buffer.flush(db, "chapter", chapter.id)
+    # Restoring writes the old text as a new revision, so the history stays linear.
+    chapter.note_markdown = revisions.require_text_at(db, "chapter", chapter.id, revision)
+    chapter.updated_at = datetime.utcnow()
+    db.commit()
+    db.refresh(chapter)
+    return chapter
+
+
 @app.delete("/api/chapters/{chapter_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_chapter(
     chapter_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     chapter = (
         db.query(models.Chapter)
@@ -235,6 +600,7 @@ def delete_chapter(
     if not chapter:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chapter not found")
 
+    write_buffer.discard("chapter", chapter.id)
     db.delete(chapter)
     db.commit()
     return None
@@ -242,15 +608,39 @@ def delete_chapter(
 
 # --- Note Pages (rich editor JSON) ---
 @app.get("/api/books/{book_id}/notes", response_model=List[schemas.NotePageOut])
-def list_notes(
+async def list_notes(
     book_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    render: bool = False,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
 ):
-    book = db.query(models.Book).filter(models.Book.id == book_id, models.Book.user_id == current_user.id).first()
-    if not book:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
-    return book.notes
+    if write_buffer.has_pending(book_id):
+        await run_in_threadpool(write_buffer.flush_book, book_id)
+
+    def load(db: Session):
+        variant = rendering.ETAG_VARIANT if render else ""
+        not_modified = http_cache.conditional_get(request, response, db, current_user.id, variant)
+        if not_modified:
+            return not_modified
+        if serializers.FAST_JSON:
+            owned = db.query(models.Book.id).filter(models.Book.id == book_id, models.Book.user_id == current_user.id)
+            if owned.first() is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+            rows = serializers.notes_by_book(db, [book_id]).get(book_id, [])
+            if render and rendering.attach(db, rendering.QUILL, rows, "content"):
+                http_cache.uncacheable(response)
+            return serializers.ORJSONResponse(rows, headers=dict(response.headers))
+        book = db.query(models.Book).filter(models.Book.id == book_id, models.Book.user_id == current_user.id).first()
+        if not book:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+        items = [schemas.NotePageOut.model_validate(note) for note in book.notes]
+        if render and rendering.attach(db, rendering.QUILL, items, "content"):
+            http_cache.uncacheable(response)
+        return items
+
+    return await db.run_sync(load)
 
 
 @app.post("/api/books/{book_id}/notes", response_model=schemas.NotePageOut, status_code=status.HTTP_201_CREATED)
@@ -258,7 +648,7 @@ def create_note(
     book_id: int,
     note: schemas.NotePageCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     book = db.query(models.Book).filter(models.Book.id == book_id, models.Book.user_id == current_user.id).first()
     if not book:
@@ -270,12 +660,28 @@ def create_note(
     return new_note
 
 
+@app.post("/api/books/{book_id}/notes:batch", response_model=List[schemas.NotePageOut])
+def batch_notes(
+    book_id: int,
+    payload: schemas.NotePageBatch,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    book = db.query(models.Book).filter(models.Book.id == book_id, models.Book.user_id == current_user.id).first()
+    if not book:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+    write_buffer.flush(db, book_id=book.id)
+    batch.apply_batch(db, batch.NOTES, book, payload.operations)
+    db.commit()
+    return batch.list_rows(db, batch.NOTES, book)
+
+
 @app.put("/api/notes/{note_id}", response_model=schemas.NotePageOut)
 def update_note(
     note_id: int,
     note_update: schemas.NotePageUpdate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     note = (
         db.query(models.NotePage)
@@ -285,7 +691,9 @@ def update_note(
     )
     if not note:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Note not found")
-    for field, value in note_update.dict(exclude_unset=True).items():
+    write_buffer.flush(db, "note", note.id)
+    check_revision(note_update.base_revision, note.revision)
+    for field, value in note_update.dict(exclude_unset=True, exclude={"base_revision"}).items():
         setattr(note, field, value)
     note.updated_at = datetime.utcnow()
     db.commit()
@@ -293,11 +701,74 @@ def update_note(
     return note
 
 
+@app.patch("/api/notes/{note_id}/content", response_model=schemas.TextPatchResult)
+def patch_note_content(
+    note_id: int,
+    patch: schemas.TextPatch,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    revision, text = write_buffer.patch(db, "note", note_id, current_user.id, patch.base_revision, patch.ops)
+    return {"id": note_id, "revision": revision, "length": len(text.encode("utf-16-le")) // 2}
+
+
+def owned_note(db: Session, note_id: int, user_id: int) -> models.NotePage:
+    note = (
+        db.query(models.NotePage)
+        .join(models.Book)
+        .filter(models.NotePage.id == note_id, models.Book.user_id == user_id)
+        .first()
+    )
+    if not note:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Note not found")
+    return note
+
+
+@app.get("/api/notes/{note_id}/revisions", response_model=List[schemas.TextRevisionOut])
+def list_note_revisions(
+    note_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    note = owned_note(db, note_id, current_user.id)
+    write_buffer.flush_book(note.book_id)
+    return revisions.list_revisions(db, "note", note.id)
+
+
+@app.get("/api/notes/{note_id}/revisions/{revision}", response_model=schemas.TextRevisionContent)
+def get_note_revision(
+    note_id: int,
+    revision: int,
+    db: Session = Depends(get_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    note = owned_note(db, note_id, current_user.id)
+    write_buffer.flush_book(note.book_id)
+    return {"revision": revision, "text": revisions.require_text_at(db, "note", note.id, revision)}
+
+
+@app.post("/api/notes/{note_id}/revisions/{revision}/restore", response_model=schemas.NotePageOut)
+def restore_note_revision(
+    note_id: int,
+    revision: int,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    note = owned_note(db, note_id, current_user.id)
+    write_buffer.flush(db, "note", note.id)
+    # Restoring writes the old text as a new revision, so the history stays linear.
+    note.content = revisions.require_text_at(db, "note", note.id, revision)
+    note.updated_at = datetime.utcnow()
+    db.commit()
+    db.refresh(note)
+    return note
+
+
 @app.delete("/api/notes/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_note(
     note_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     note = (
         db.query(models.NotePage)
@@ -307,6 +778,7 @@ def delete_note(
     )
     if not note:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Note not found")
+    write_buffer.discard("note", note.id)
     db.delete(note)
     db.commit()
     return None
@@ -314,23 +786,33 @@ def delete_note(
 
 # --- Comments ---
 @app.get("/api/books/{book_id}/comments", response_model=List[schemas.CommentOut])
-def list_comments(
+async def list_comments(
     book_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
 ):
-    book = db.query(models.Book).filter(models.Book.id == book_id).first()
-    if not book:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
-    # Only owner can see own book; others cannot access
-    if book.user_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
-    return (
-        db.query(models.Comment)
-        .filter(models.Comment.book_id == book_id)
-        .order_by(models.Comment.created_at.desc())
-        .all()
-    )
+    def load(db: Session):
+        not_modified = http_cache.conditional_get(request, response, db, current_user.id)
+        if not_modified:
+            return not_modified
+        book = db.query(models.Book).filter(models.Book.id == book_id).first()
+        if not book:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+        # Only owner can see own book; others cannot access
+        if book.user_id != current_user.id:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+        comments = (
+            db.query(models.Comment)
+            .options(joinedload(models.Comment.user))
+            .filter(models.Comment.book_id == book_id)
+            .order_by(models.Comment.created_at.desc())
+            .all()
+        )
+        return [schemas.CommentOut.model_validate(comment) for comment in comments]
+
+    return await db.run_sync(load)
 
 
 @app.post("/api/books/{book_id}/comments", response_model=schemas.CommentOut, status_code=status.HTTP_201_CREATED)
@@ -338,7 +820,7 @@ def create_comment(
     book_id: int,
     comment: schemas.CommentCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     book = db.query(models.Book).filter(models.Book.id == book_id).first()
     if not book:
@@ -356,7 +838,7 @@ def create_comment(
 def delete_comment(
     comment_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     comment = db.query(models.Comment).filter(models.Comment.id == comment_id).first()
     if not comment:
@@ -373,10 +855,12 @@ def delete_comment(
 def follow_user(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     if user_id == current_user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot follow yourself")
+    if db.get(models.User, user_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     existing = (
         db.query(models.Follow)
         .filter(models.Follow.follower_id == current_user.id, models.Follow.following_id == user_id)
@@ -394,7 +878,7 @@ def follow_user(
 def unfollow_user(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     follow = (
         db.query(models.Follow)
@@ -408,94 +892,320 @@ def unfollow_user(
     return {"message": "unfollowed"}
 
 
-@app.get("/api/users/me/following", response_model=List[schemas.FollowOut])
-def get_following(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    follows = (
-        db.query(models.Follow)
-        .filter(models.Follow.follower_id == current_user.id)
-        .all()
-    )
-    return follows
+def resolve_user_id(user_id: str, current_user: CurrentUser) -> int:
+    if user_id == "me":
+        return current_user.id
+    try:
+        return int(user_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
 
-@app.get("/api/users/me/followers", response_model=List[schemas.FollowOut])
-def get_followers(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    follows = (
-        db.query(models.Follow)
-        .filter(models.Follow.following_id == current_user.id)
-        .all()
+@app.get("/api/users/{user_id}", response_model=schemas.UserProfileOut)
+def get_user_profile(
+    user_id: str,
+    db: Session = Depends(get_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    user = db.get(models.User, resolve_user_id(user_id, current_user))
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return user
+
+
+@app.get("/api/users/{user_id}/following", response_model=List[schemas.FollowListItem])
+def get_following(
+    user_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    items, next_cursor = follows.list_follows(
+        db, resolve_user_id(user_id, current_user), current_user.id, "following", cursor, limit
     )
-    return follows
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+
+@app.get("/api/users/{user_id}/followers", response_model=List[schemas.FollowListItem])
+def get_followers(
+    user_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    items, next_cursor = follows.list_follows(
+        db, resolve_user_id(user_id, current_user), current_user.id, "followers", cursor, limit
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+
+@app.get("/api/feed", response_model=List[schemas.FeedItemOut])
+async def get_feed(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+):
+    def load(db: Session):
+        items, next_cursor = feed.feed_page(db, current_user.id, cursor, limit)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return [schemas.FeedItemOut.model_validate(item) for item in items]
+
+    return await db.run_sync(load)
 
 
 # --- Messages ---
+def conversation_filter(user_id: int, other_user_id: int):
+    return or_(
+        and_(models.Message.sender_id == user_id, models.Message.receiver_id == other_user_id),
+        and_(models.Message.sender_id == other_user_id, models.Message.receiver_id == user_id),
+    )
+
+
 @app.get("/api/messages/{other_user_id}", response_model=List[schemas.MessageOut])
-def get_messages(
+async def get_messages(
     other_user_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
-):
-    messages = (
-        db.query(models.Message)
-        .filter(
-            or_(
-                and_(models.Message.sender_id == current_user.id, models.Message.receiver_id == other_user_id),
-                and_(models.Message.sender_id == other_user_id, models.Message.receiver_id == current_user.id),
-            )
-        )
-        .order_by(models.Message.created_at.asc())
-        .all()
-    )
-    return messages
+    after_id: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+):
+    def load(db: Session):
+        criteria = [conversation_filter(current_user.id, other_user_id)]
+        if after_id is not None:
+            criteria.append(models.Message.id > after_id)
+        if serializers.FAST_JSON:
+            return serializers.ORJSONResponse(serializers.messages(db, criteria, limit))
+        query = db.query(models.Message).filter(*criteria)
+        query = query.options(joinedload(models.Message.sender), joinedload(models.Message.receiver))
+        query = query.order_by(models.Message.created_at.asc(), models.Message.id.asc())
+        if limit is not None:
+            query = query.limit(limit)
+        return [schemas.MessageOut.model_validate(message) for message in query.all()]
+
+    return await db.run_sync(load)
 
 
 @app.post("/api/messages/{other_user_id}", response_model=schemas.MessageOut, status_code=status.HTTP_201_CREATED)
 def send_message(
     other_user_id: int,
     msg: schemas.MessageCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     if other_user_id == current_user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot send to yourself")
+    if db.get(models.User, other_user_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     message = models.Message(sender_id=current_user.id, receiver_id=other_user_id, content=msg.content)
     db.add(message)
+    db.flush()
+    conversations.record_message(db, message)
     db.commit()
     db.refresh(message)
-    return message
+    payload = schemas.MessageOut.model_validate(message).model_dump(mode="json")
+    # Pushed once the response is sent; the sender's other tabs get it too.
+    background_tasks.add_task(
+        message_hub.publish, (other_user_id, current_user.id), {"type": "message", "message": payload}
+    )
+    return payload
 
 
-# --- Stats ---
-@app.get("/api/stats/overview", response_model=schemas.StatsOverview)
-def stats_overview(
+@app.get("/api/conversations", response_model=List[schemas.ConversationOut])
+async def list_conversations(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+):
+    def load(db: Session):
+        items, next_cursor = conversations.list_conversations(db, current_user.id, cursor, limit)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return items
+
+    return await db.run_sync(load)
+
+
+@app.post("/api/conversations/{other_user_id}/read", status_code=status.HTTP_204_NO_CONTENT)
+def mark_conversation_read(
+    other_user_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    total_read = db.query(models.Book).filter(models.Book.user_id == current_user.id, models.Book.status == models.BookStatus.READ).count()
-    total_want = db.query(models.Book).filter(models.Book.user_id == current_user.id, models.Book.status == models.BookStatus.WANT_TO_READ).count()
+    if not conversations.mark_read(db, current_user.id, other_user_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found")
+    db.commit()
+    return None
 
-    today = date.today()
-    read_this_month = (
-        db.query(models.Book)
-        .filter(
-            models.Book.user_id == current_user.id,
-            extract('year', models.Book.started_at) == today.year,
-            extract('month', models.Book.started_at) == today.month,
-        )
-        .count()
-    )
-    finished_this_month = (
-        db.query(models.Book)
-        .filter(
-            models.Book.user_id == current_user.id,
-            extract('year', models.Book.finished_at) == today.year,
-            extract('month', models.Book.finished_at) == today.month,
+
+def load_missed_messages(user_id: int, after_id: int) -> List[dict]:
+    db = ReadSessionLocal()
+    try:
+        messages = (
+            db.query(models.Message)
+            .filter(
+                or_(models.Message.sender_id == user_id, models.Message.receiver_id == user_id),
+                models.Message.id > after_id,
+            )
+            .options(joinedload(models.Message.sender), joinedload(models.Message.receiver))
+            .order_by(models.Message.id.asc())
+            .limit(MAX_PAGE_SIZE)
+            .all()
         )
-        .count()
-    )
-    return schemas.StatsOverview(
-        total_read=total_read,
-        total_want_to_read=total_want,
-        read_this_month=read_this_month,
-        finished_this_month=finished_this_month,
+        return [schemas.MessageOut.model_validate(m).model_dump(mode="json") for m in messages]
+    finally:
+        db.close()
+
+
+def authenticate_websocket(token: str) -> CurrentUser:
+    db = ReadSessionLocal()
+    try:
+        return authenticate_token(db, token)
+    finally:
+        db.close()
+
+
+@app.websocket("/ws/messages")
+async def messages_socket(websocket: WebSocket, token: str, after_id: Optional[int] = None):
+    # Browsers can't set Authorization on a WebSocket handshake, so the JWT comes as ?token=.
+    try:
+        current_user = await run_in_threadpool(authenticate_websocket, token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    await message_hub.connect(current_user.id, websocket)
+    try:
+        if after_id is not None:
+            for payload in await run_in_threadpool(load_missed_messages, current_user.id, after_id):
+                await websocket.send_json({"type": "message", "message": payload})
+        while True:
+            # Nothing is expected from the client; reading keeps the socket alive and notices disconnects.
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await message_hub.disconnect(current_user.id, websocket)
+
+
+# --- Sync ---
+@app.get("/api/sync", response_model=schemas.SyncResponse)
+async def sync_changes(
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+):
+    def load(db: Session):
+        return sync.changes_since(db, current_user.id, sync.parse_token(since), limit)
+
+    return await db.run_sync(load)
+
+
+# --- Search ---
+@app.get("/api/search", response_model=List[schemas.SearchHit])
+async def search_notes(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Optional[str] = Query(None, pattern="^(book|chapter|note)$"),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+):
+    def load(db: Session):
+        return search.search(db, current_user.id, q, limit, kind)
+
+    return await db.run_sync(load)
+
+
+# --- Stats ---
+async def load_stats(db: AsyncSession, user_id: int, build):
+    """Run `build(db)` on the read session once the user's rollup rows exist."""
+
+    def load(db: Session):
+        if not rollup.has_rollup(db, user_id):
+            return None
+        return build(db)
+
+    result = await db.run_sync(load)
+    if result is None:
+        # First stats read for this user: create the rows in a short writer transaction.
+        await run_in_threadpool(rollup.create_rollup, user_id)
+        result = await db.run_sync(load)
+    return result
+
+
+@app.get("/api/stats/overview", response_model=schemas.StatsOverview)
+async def stats_overview(
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+):
+    return await load_stats(db, current_user.id, lambda db: stats.overview(db, current_user.id, date.today()))
+
+
+@app.get("/api/stats/dashboard", response_model=schemas.StatsDashboard)
+async def stats_dashboard(
+    months: int = Query(12, ge=1, le=60),
+    authors: int = Query(5, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+):
+    return await load_stats(
+        db, current_user.id, lambda db: stats.dashboard(db, current_user.id, date.today(), months, authors)
     )
+
+
+# --- Calendar ---
+@app.get("/api/calendar", response_model=List[schemas.CalendarEvent])
+async def calendar_events(
+    request: Request,
+    response: Response,
+    from_: date = Query(..., alias="from"),
+    to: date = Query(...),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+):
+    def load(db: Session):
+        not_modified = http_cache.conditional_get(request, response, db, current_user.id)
+        if not_modified:
+            return not_modified
+        return reading_calendar.events(db, current_user.id, from_, to)
+
+    return await db.run_sync(load)
+
+
+@app.get("/api/calendar/heatmap", response_model=schemas.CalendarHeatmap)
+async def calendar_heatmap(
+    request: Request,
+    response: Response,
+    year: Optional[int] = Query(None, ge=1, le=9998),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: CurrentUser = Depends(get_current_user_async),
+):
+    def load(db: Session):
+        not_modified = http_cache.conditional_get(request, response, db, current_user.id)
+        if not_modified:
+            return not_modified
+        return reading_calendar.heatmap(db, current_user.id, year or date.today().year)
+
+    return await db.run_sync(load)
+
+
+# --- Metrics ---
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,287 @@
+"""Per-request performance instrumentation, exported in Prometheus text format.
+
+`MetricsMiddleware` opens a `RequestStats` for every HTTP request and stores it
+in a context variable. Context variables follow the request into worker threads
+(sync handlers and dependencies, `run_in_threadpool`, streaming bodies), so the
+cursor hooks that `instrument_engine` installs on each SQLAlchemy engine can add
+every statement to the request that issued it. `instrument_threadpool` wraps
+anyio's `to_thread.run_sync`, which all of those go through, to time how long
+each call queued for a worker thread. When the response finishes, the
+totals go into per-route histograms served by GET /metrics.
+
+With BOOK_MEMORY_DEBUG_TIMING=1 responses also carry a Server-Timing header, and
+requests that run more than BOOK_MEMORY_QUERY_BUDGET statements are logged with
+their most repeated statements, which is how an N+1 lazy load shows up.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+
+import anyio.to_thread
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("BOOK_MEMORY_METRICS", "1") == "1"
+DEBUG_TIMING = os.environ.get("BOOK_MEMORY_DEBUG_TIMING", "0") == "1"
+QUERY_BUDGET = int(os.environ.get("BOOK_MEMORY_QUERY_BUDGET", "25"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152)
+
+Labels = Tuple[str, ...]
+
+
+class RequestStats:
+    __slots__ = ("sql_count", "sql_seconds", "wait_seconds", "statements")
+
+    def __init__(self, track_statements: bool = False):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.wait_seconds = 0.0
+        # Statement text -> executions, only kept when something will report it.
+        self.statements: Optional[Counter] = Counter() if track_statements else None
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("book_memory_request_stats", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values."""
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Labels, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(snapshot):
+            base = _format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_number(bound)
+                lines.append(f"{self.name}_bucket{{{base},le=\"{le}\"}} {cumulative}")
+            lines.append(f"{self.name}_sum{{{base}}} {_format_number(total)}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name: str, help: str, label_names: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for labels, value in snapshot:
+            lines.append(f"{self.name}{{{_format_labels(self.label_names, labels)}}} {_format_number(value)}")
+        return lines
+
+
+def _format_labels(names: Labels, values: Labels) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+ROUTE_LABELS = ("method", "route")
+
+requests_total = CounterMetric(
+    "book_memory_http_requests_total", "HTTP requests by route template and status.", ROUTE_LABELS + ("status",)
+)
+request_duration = Histogram(
+    "book_memory_http_request_duration_seconds", "Time from request start to the last response byte.",
+    ROUTE_LABELS, LATENCY_BUCKETS,
+)
+request_sql_statements = Histogram(
+    "book_memory_http_request_sql_statements", "SQL statements executed per request.",
+    ROUTE_LABELS, STATEMENT_BUCKETS,
+)
+request_sql_duration = Histogram(
+    "book_memory_http_request_sql_duration_seconds", "Time spent executing SQL per request.",
+    ROUTE_LABELS, LATENCY_BUCKETS,
+)
+request_threadpool_wait = Histogram(
+    "book_memory_http_request_threadpool_wait_seconds",
+    "Time the request's threadpool work (sync handlers and dependencies included) waited for a free worker thread.",
+    ROUTE_LABELS, LATENCY_BUCKETS,
+)
+response_size = Histogram(
+    "book_memory_http_response_size_bytes", "Response body size.", ROUTE_LABELS, SIZE_BUCKETS,
+)
+
+_HISTOGRAMS = (request_duration, request_sql_statements, request_sql_duration, request_threadpool_wait, response_size)
+
+
+def render() -> str:
+    lines = requests_total.render()
+    for histogram in _HISTOGRAMS:
+        lines.extend(histogram.render())
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    lines += [
+        "# HELP book_memory_threadpool_threads Worker threads available to run_in_threadpool.",
+        "# TYPE book_memory_threadpool_threads gauge",
+        f"book_memory_threadpool_threads {_format_number(limiter.total_tokens)}",
+        "# HELP book_memory_threadpool_busy_threads Worker threads currently running a task.",
+        "# TYPE book_memory_threadpool_busy_threads gauge",
+        f"book_memory_threadpool_busy_threads {limiter.borrowed_tokens}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+# --- SQL hooks ---
+
+def instrument_engine(engine) -> None:
+    """Count statements and their time against the current request, if there is one."""
+    if not ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("book_memory_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        if stats is None:
+            return
+        started = conn.info.get("book_memory_query_start")
+        if started:
+            stats.sql_seconds += time.perf_counter() - started.pop()
+        stats.sql_count += 1
+        if stats.statements is not None:
+            stats.statements[statement] += 1
+
+
+# --- Threadpool ---
+
+_run_sync = anyio.to_thread.run_sync
+
+
+async def _timed_run_sync(func, *args, **kwargs):
+    stats = _current.get()
+    if stats is None:
+        return await _run_sync(func, *args, **kwargs)
+    queued_at = time.perf_counter()
+
+    def timed(*call_args):
+        stats.wait_seconds += time.perf_counter() - queued_at
+        return func(*call_args)
+
+    return await _run_sync(timed, *args, **kwargs)
+
+
+def instrument_threadpool() -> None:
+    """Route anyio.to_thread.run_sync through the wait timer.
+
+    Starlette runs sync endpoints, sync dependencies (get_db included) and
+    run_in_threadpool calls through that one function, looked up at call time.
+    """
+    if ENABLED:
+        anyio.to_thread.run_sync = _timed_run_sync
+
+
+# --- Middleware ---
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so it sees the scope the router fills in with the matched route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(track_statements=DEBUG_TIMING)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if DEBUG_TIMING:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(stats, time.perf_counter() - started).encode()))
+                    message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            self._record(scope, stats, status, size, time.perf_counter() - started)
+
+    def _record(self, scope, stats: RequestStats, status: int, size: int, elapsed: float) -> None:
+        route = scope.get("route")
+        # Unmatched paths share one label so scanners can't blow up the series count.
+        labels = (scope["method"], getattr(route, "path", None) or "<unmatched>")
+        requests_total.inc(labels + (str(status),))
+        request_duration.observe(labels, elapsed)
+        request_sql_statements.observe(labels, stats.sql_count)
+        request_sql_duration.observe(labels, stats.sql_seconds)
+        request_threadpool_wait.observe(labels, stats.wait_seconds)
+        response_size.observe(labels, size)
+        if DEBUG_TIMING and stats.sql_count > QUERY_BUDGET:
+            repeated = ", ".join(
+                f"{count}x {' '.join(statement.split())[:120]}" for statement, count in stats.statements.most_common(3)
+            )
+            logger.warning(
+                "%s %s ran %d SQL statements (budget %d) in %.1f ms; most repeated: %s",
+                labels[0], labels[1], stats.sql_count, QUERY_BUDGET, stats.sql_seconds * 1000, repeated,
+            )
+
+
+def _server_timing(stats: RequestStats, elapsed: float) -> str:
+    return (
+        f'app;dur={elapsed * 1000:.1f}, '
+        f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.sql_count} queries", '
+        f'pool;dur={stats.wait_seconds * 1000:.1f};desc="threadpool wait"'
+    )
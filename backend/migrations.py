@@ -0,0 +1,135 @@
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn, CreateTable
+
+import conversations
+import follows
+import search
+import sync
+from database import Base
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_indexes(bind) -> None:
+    # create_all() skips tables that already exist, so indexes added to an existing
+    # model later on would never reach an old data.db without this pass.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+
+def ensure_columns(bind) -> None:
+    # Same problem for columns: add any the model has but the table lacks. Only
+    # nullable columns or ones with a server_default can be added this way.
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+
+def _foreign_keys_of(table) -> set:
+    return {
+        (fk.parent.name, fk.column.table.name, fk.column.name, (fk.ondelete or "NO ACTION").upper())
+        for fk in table.foreign_keys
+    }
+
+
+def _rebuild(cursor, table, dialect) -> None:
+    # SQLite can't ALTER a foreign key: create the new shape, copy, drop, rename.
+    name = table.name
+    staging = f"{name}__rebuild"
+    ddl = str(CreateTable(table).compile(dialect=dialect))
+    staged = ddl.replace(f"CREATE TABLE {name} (", f"CREATE TABLE {staging} (", 1)
+    if staged == ddl:
+        raise RuntimeError(f"Unexpected DDL for {name}: {ddl!r}")
+    existing = {row[1] for row in cursor.execute(f'PRAGMA table_info("{name}")')}
+    columns = ", ".join(f'"{column.name}"' for column in table.columns if column.name in existing)
+    # AUTOINCREMENT ids are sync tokens and must never be reused, so carry the
+    # high-water mark over even if the newest rows were deleted.
+    sequence = None
+    if table.dialect_options["sqlite"]["autoincrement"]:
+        row = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (name,)).fetchone()
+        sequence = row[0] if row else None
+    cursor.execute(staged)
+    cursor.execute(f'INSERT INTO {staging} ({columns}) SELECT {columns} FROM "{name}"')
+    cursor.execute(f'DROP TABLE "{name}"')
+    cursor.execute(f'ALTER TABLE {staging} RENAME TO "{name}"')
+    if sequence is not None:
+        cursor.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?", (sequence, name))
+
+
+def ensure_foreign_keys(bind) -> None:
+    """Give tables from older databases the models' ON DELETE actions.
+
+    Runs with foreign key enforcement off, in one transaction. Rows whose parent
+    is already gone (which nothing enforced before) are deleted, since they would
+    fail every later write that touches them. Indexes of rebuilt tables come back
+    in ensure_indexes.
+    """
+    with bind.connect() as conn:
+        inspector = inspect(conn)
+        stale = []
+        for table in Base.metadata.sorted_tables:
+            if not table.foreign_keys or not inspector.has_table(table.name):
+                continue
+            actual = {
+                (row[3], row[2], row[4], row[6].upper())
+                for row in conn.exec_driver_sql(f'PRAGMA foreign_key_list("{table.name}")')
+            }
+            if actual != _foreign_keys_of(table):
+                stale.append(table)
+    if not stale:
+        return
+
+    raw = bind.raw_connection()
+    try:
+        dbapi_connection = raw.driver_connection
+        isolation_level = dbapi_connection.isolation_level
+        dbapi_connection.isolation_level = None  # explicit BEGIN/COMMIT below
+        cursor = dbapi_connection.cursor()
+        # Has no effect inside a transaction, so it goes first.
+        cursor.execute("PRAGMA foreign_keys=OFF")
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for table in stale:
+                _rebuild(cursor, table, bind.dialect)
+            orphans = {}
+            # Deleting an orphan can orphan its own children, so repeat until clean.
+            while True:
+                violations = cursor.execute("PRAGMA foreign_key_check").fetchall()
+                if not violations:
+                    break
+                for table_name, rowid in {(row[0], row[1]) for row in violations}:
+                    cursor.execute(f'DELETE FROM "{table_name}" WHERE rowid = ?', (rowid,))
+                    orphans[table_name] = orphans.get(table_name, 0) + 1
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.close()
+            dbapi_connection.isolation_level = isolation_level
+    finally:
+        raw.close()
+    logger.info("Rebuilt foreign keys of %s", ", ".join(table.name for table in stale))
+    if orphans:
+        logger.warning("Deleted rows whose parent no longer existed: %s", orphans)
+
+
+def run_migrations(bind) -> None:
+    ensure_columns(bind)
+    ensure_foreign_keys(bind)
+    ensure_indexes(bind)
+    search.ensure_index(bind)
+    sync.ensure_backfill(bind)
+    conversations.ensure_backfill(bind)
+    follows.ensure_backfill(bind)
@@ -1,17 +1,22 @@
 import enum
 from datetime import datetime, date
 from sqlalchemy import (
+    Boolean,
     Column,
     Integer,
+    LargeBinary,
     String,
     Text,
     DateTime,
     Enum,
     ForeignKey,
     Date,
+    Index,
     UniqueConstraint,
 )
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy.orm import relationship, backref, deferred
+
+from compression import CompressedText
 
 from database import Base
 
@@ -28,36 +33,56 @@ class User(Base):
     username = Column(String(50), unique=True, index=True, nullable=False)
     password_hash = Column(String(255), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Denormalized from follows; maintained by follows.py.
+    follower_count = Column(Integer, default=0, server_default="0", nullable=False)
+    following_count = Column(Integer, default=0, server_default="0", nullable=False)
 
-    books = relationship("Book", back_populates="owner", cascade="all, delete-orphan")
-    comments = relationship("Comment", back_populates="user", cascade="all, delete-orphan")
-    sent_messages = relationship("Message", back_populates="sender", foreign_keys='Message.sender_id')
-    received_messages = relationship("Message", back_populates="receiver", foreign_keys='Message.receiver_id')
+    # passive_deletes: child rows go through ON DELETE CASCADE in SQLite instead of
+    # being loaded and deleted one by one. Side tables without a foreign key are
+    # cleaned up by accounts.delete_account.
+    books = relationship("Book", back_populates="owner", cascade="all, delete-orphan", passive_deletes=True)
+    comments = relationship("Comment", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    sent_messages = relationship(
+        "Message", back_populates="sender", foreign_keys='Message.sender_id', passive_deletes=True
+    )
+    received_messages = relationship(
+        "Message", back_populates="receiver", foreign_keys='Message.receiver_id', passive_deletes=True
+    )
     following = relationship(
         "Follow",
         foreign_keys='Follow.follower_id',
         cascade="all, delete-orphan",
         back_populates="follower",
+        passive_deletes=True,
     )
     followers = relationship(
         "Follow",
         foreign_keys='Follow.following_id',
         cascade="all, delete-orphan",
         back_populates="following",
+        passive_deletes=True,
     )
 
 
 class Book(Base):
     __tablename__ = "books"
+    __table_args__ = (
+        # Serves the bookshelf keyset pagination: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        Index("ix_books_user_created_id", "user_id", "created_at", "id"),
+        # Calendar and monthly stats: WHERE user_id = ? AND started_at/finished_at in a date range
+        Index("ix_books_user_started", "user_id", "started_at"),
+        Index("ix_books_user_finished", "user_id", "finished_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
     title = Column(String(200), nullable=False)
     author = Column(String(200))
     status = Column(Enum(BookStatus), default=BookStatus.WANT_TO_READ, nullable=False)
     amazon_url = Column(String(500))
     cover_image_url = Column(String(500))
-    note_markdown = Column(Text, default="")
+    # Deferred: ownership checks and summary lists load books without needing the memo.
+    note_markdown = deferred(Column(CompressedText, default=""))
     started_at = Column(Date)
     finished_at = Column(Date)
     title_guess = Column(String(200))
@@ -65,29 +90,34 @@ class Book(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     owner = relationship("User", back_populates="books")
+    # Deleting a book leaves its chapters, notes and comments to ON DELETE CASCADE;
+    # search, sync and revisions clear their rows for them in before_delete hooks.
     chapters = relationship(
         "Chapter",
         backref=backref("book"),
         cascade="all, delete-orphan",
         order_by="Chapter.order",
+        passive_deletes=True,
     )
     notes = relationship(
         "NotePage",
         backref=backref("book"),
         cascade="all, delete-orphan",
         order_by="NotePage.sort_order",
+        passive_deletes=True,
     )
-    comments = relationship("Comment", back_populates="book", cascade="all, delete-orphan")
+    comments = relationship("Comment", back_populates="book", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Chapter(Base):
     __tablename__ = "chapters"
 
     id = Column(Integer, primary_key=True, index=True)
-    book_id = Column(Integer, ForeignKey("books.id"), index=True, nullable=False)
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), index=True, nullable=False)
     title = Column(String(200), nullable=False)
     order = Column(Integer, default=0)
-    note_markdown = Column(Text, default="")
+    note_markdown = Column(CompressedText, default="")
+    revision = Column(Integer, default=0, server_default="0", nullable=False)  # bumped on every text change
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -96,20 +126,26 @@ class NotePage(Base):
     __tablename__ = "note_pages"
 
     id = Column(Integer, primary_key=True, index=True)
-    book_id = Column(Integer, ForeignKey("books.id"), index=True, nullable=False)
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), index=True, nullable=False)
     title = Column(String(200), nullable=False)
     sort_order = Column(Integer, default=0)
-    content = Column(Text, default="")  # rich text (React Quill HTML)
+    content = Column(CompressedText, default="")  # rich text (React Quill HTML)
+    revision = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        # Cascades from books and users look children up by these.
+        Index("ix_comments_book_id", "book_id"),
+        Index("ix_comments_user_id", "user_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -119,11 +155,16 @@ class Comment(Base):
 
 class Follow(Base):
     __tablename__ = "follows"
-    __table_args__ = (UniqueConstraint('follower_id', 'following_id', name='uq_follow'),)
+    __table_args__ = (
+        UniqueConstraint('follower_id', 'following_id', name='uq_follow'),
+        # Keyset-paginated listings per side; following_id also serves feed fan-out.
+        Index("ix_follows_follower_created_id", "follower_id", "created_at", "id"),
+        Index("ix_follows_following_created_id", "following_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    follower_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    following_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    follower_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    following_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     follower = relationship("User", foreign_keys=[follower_id], back_populates="following")
@@ -132,12 +173,152 @@ class Follow(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # One index per direction of a conversation; together they serve the
+        # OR-of-ANDs history query and the after_id gap fill.
+        Index("ix_messages_sender_receiver_created", "sender_id", "receiver_id", "created_at"),
+        Index("ix_messages_receiver_sender_created", "receiver_id", "sender_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    receiver_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    sender_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    receiver_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     sender = relationship("User", foreign_keys=[sender_id], back_populates="sent_messages")
     receiver = relationship("User", foreign_keys=[receiver_id], back_populates="received_messages")
+
+
+class Conversation(Base):
+    """One row per pair of users who have exchanged messages (user_low_id < user_high_id)."""
+
+    __tablename__ = "conversations"
+    __table_args__ = (
+        UniqueConstraint("user_low_id", "user_high_id", name="uq_conversation_pair"),
+        Index("ix_conversations_low_activity", "user_low_id", "last_message_at", "id"),
+        Index("ix_conversations_high_activity", "user_high_id", "last_message_at", "id"),
+        Index("ix_conversations_last_message_id", "last_message_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_low_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    user_high_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    last_message_id = Column(Integer, ForeignKey("messages.id", ondelete="SET NULL"))
+    last_message_at = Column(DateTime, nullable=False)
+    unread_low = Column(Integer, default=0, nullable=False)  # unread by user_low_id
+    unread_high = Column(Integer, default=0, nullable=False)
+
+
+class UserStats(Base):
+    """Per-user reading counters, kept in step with books by rollup.py."""
+
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total_read = Column(Integer, default=0, nullable=False)
+    total_want_to_read = Column(Integer, default=0, nullable=False)
+    duration_days_total = Column(Integer, default=0, nullable=False)
+    duration_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UserMonthlyStats(Base):
+    __tablename__ = "user_monthly_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    month = Column(String(7), primary_key=True)  # YYYY-MM
+    started_count = Column(Integer, default=0, nullable=False)
+    finished_count = Column(Integer, default=0, nullable=False)
+
+
+class SyncChange(Base):
+    """Latest change per synced row, in commit order; see sync.py.
+
+    AUTOINCREMENT so ids are never reused and always grow with commit order,
+    which is what makes them usable as sync tokens.
+    """
+
+    __tablename__ = "sync_changes"
+    __table_args__ = (
+        UniqueConstraint("user_id", "kind", "item_id", name="uq_sync_change_item"),
+        Index("ix_sync_changes_user_id_id", "user_id", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(16), nullable=False)  # book | chapter | note | comment
+    item_id = Column(Integer, nullable=False)
+    deleted = Column(Boolean, default=False, nullable=False)
+    changed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class TextRevision(Base):
+    """One saved version of a chapter memo or note page; see revisions.py.
+
+    chain == 0 rows hold a full zlib-compressed snapshot, others a compressed
+    diff against the previous revision of the same item.
+    """
+
+    __tablename__ = "text_revisions"
+    __table_args__ = (UniqueConstraint("kind", "item_id", "revision", name="uq_text_revision"),)
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(16), nullable=False)  # chapter | note
+    item_id = Column(Integer, nullable=False)
+    revision = Column(Integer, nullable=False)
+    chain = Column(Integer, nullable=False)  # diffs since the last snapshot
+    data = Column(LargeBinary, nullable=False)
+    length = Column(Integer, nullable=False)  # characters in the full text
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class Activity(Base):
+    """Something a user did that their followers see in /api/feed; see feed.py."""
+
+    __tablename__ = "activities"
+    __table_args__ = (
+        Index("ix_activities_actor_created_id", "actor_id", "created_at", "id"),
+        Index("ix_activities_book_id", "book_id"),
+        Index("ix_activities_note_id", "note_id"),
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True)
+    actor_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(16), nullable=False)  # status | finished | note
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), nullable=False)
+    book_title = Column(String(200), nullable=False)
+    status = Column(Enum(BookStatus))
+    note_id = Column(Integer, ForeignKey("note_pages.id", ondelete="CASCADE"))
+    note_title = Column(String(200))
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    actor = relationship("User")
+
+
+class FeedEntry(Base):
+    """An activity copied into one follower's feed (fan-out on write)."""
+
+    __tablename__ = "feed_entries"
+    __table_args__ = (
+        Index("ix_feed_entries_owner_created_activity", "owner_id", "created_at", "activity_id"),
+        Index("ix_feed_entries_activity_id", "activity_id"),
+        Index("ix_feed_entries_actor_id", "actor_id"),
+    )
+
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    activity_id = Column(Integer, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True)
+    actor_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime, nullable=False)  # the activity's, for keyset pagination
+
+
+class RenderedHtml(Base):
+    """Sanitized HTML for a memo or note text, keyed by content hash; see rendering.py."""
+
+    __tablename__ = "rendered_html"
+
+    key = Column(String(64), primary_key=True)  # sha256 of renderer version, kind and source
+    html = Column(CompressedText, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,67 @@
+"""Calendar views over the books' reading dates.
+
+Every query here is two index range reads, one on (user_id, started_at) and one
+on (user_id, finished_at), glued with UNION ALL, so only books dated inside the
+window are touched however large the library is. The heatmap query reads
+nothing but those two indexes.
+
+(Not named calendar.py: that would shadow the standard library module.)
+"""
+from datetime import date, timedelta
+from typing import List
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, literal, select, union_all
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+
+MAX_RANGE_DAYS = 366
+
+
+def _dated(user_id: int, column, start: date, end: date, *columns):
+    """Books whose `column` falls in [start, end)."""
+    return select(column.label("day"), *columns).where(
+        models.Book.user_id == user_id, column >= start, column < end
+    )
+
+
+def events(db: Session, user_id: int, first: date, last: date) -> List[schemas.CalendarEvent]:
+    """Start and finish events for every day from first to last, inclusive."""
+    if last < first:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'to' is before 'from'")
+    if (last - first).days >= MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Date range is limited to {MAX_RANGE_DAYS} days"
+        )
+    Book = models.Book
+    end = last + timedelta(days=1)
+    columns = (Book.id.label("book_id"), Book.title, Book.author, Book.cover_image_url, Book.status)
+    dated = union_all(
+        _dated(user_id, Book.started_at, first, end, literal("start").label("kind"), *columns),
+        _dated(user_id, Book.finished_at, first, end, literal("finish").label("kind"), *columns),
+    ).subquery()
+    rows = db.execute(
+        select(dated).order_by(dated.c.day, dated.c.kind.desc(), dated.c.book_id)
+    ).all()
+    return [schemas.CalendarEvent.model_validate(row, from_attributes=True) for row in rows]
+
+
+def heatmap(db: Session, user_id: int, year: int) -> schemas.CalendarHeatmap:
+    """Per-day start/finish counts for a whole year in one grouped query; days without events are left out."""
+    Book = models.Book
+    first, end = date(year, 1, 1), date(year + 1, 1, 1)
+    dated = union_all(
+        _dated(user_id, Book.started_at, first, end, literal(1).label("started"), literal(0).label("finished")),
+        _dated(user_id, Book.finished_at, first, end, literal(0).label("started"), literal(1).label("finished")),
+    ).subquery()
+    rows = db.execute(
+        select(dated.c.day, func.sum(dated.c.started), func.sum(dated.c.finished))
+        .group_by(dated.c.day)
+        .order_by(dated.c.day)
+    ).all()
+    return schemas.CalendarHeatmap(
+        year=year,
+        days=[schemas.CalendarDay(day=day, started=started, finished=finished) for day, started, finished in rows],
+    )
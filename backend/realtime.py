@@ -0,0 +1,41 @@
+"""In-process pub/sub for pushing chat messages over WebSocket.
+
+The hub only reaches sockets connected to this worker process. Clients
+reconnect with ?after_id=<last id seen> to pick up anything they missed.
+"""
+import asyncio
+from collections import defaultdict
+from typing import Dict, Set
+
+from fastapi import WebSocket
+
+
+class MessageHub:
+    def __init__(self):
+        self._sockets: Dict[int, Set[WebSocket]] = defaultdict(set)
+        self._lock = asyncio.Lock()
+
+    async def connect(self, user_id: int, websocket: WebSocket) -> None:
+        async with self._lock:
+            self._sockets[user_id].add(websocket)
+
+    async def disconnect(self, user_id: int, websocket: WebSocket) -> None:
+        async with self._lock:
+            sockets = self._sockets.get(user_id)
+            if sockets is None:
+                return
+            sockets.discard(websocket)
+            if not sockets:
+                del self._sockets[user_id]
+
+    async def publish(self, user_ids, payload: dict) -> None:
+        targets = [(user_id, ws) for user_id in set(user_ids) for ws in list(self._sockets.get(user_id, ()))]
+        if not targets:
+            return
+        results = await asyncio.gather(*(ws.send_json(payload) for _, ws in targets), return_exceptions=True)
+        for (user_id, ws), result in zip(targets, results):
+            if isinstance(result, Exception):
+                await self.disconnect(user_id, ws)
+
+
+message_hub = MessageHub()
@@ -0,0 +1,252 @@
+"""Server-side HTML for note text, sanitized and cached by content hash.
+
+Book and chapter memos are Markdown; note pages hold Quill HTML. Markdown goes
+through markdown-it with raw HTML escaped (tables and strikethrough enabled, as
+with the frontend's remark-gfm), and both kinds then go through one nh3
+allowlist, so the result is safe to insert into a page as is.
+
+Results live in `rendered_html`, keyed by sha256 of RENDERER_VERSION, the kind
+and the source text: identical texts share a row, an edit is simply a new key,
+and bumping RENDERER_VERSION retires every entry at once. Read handlers only
+look keys up. Misses come back as None and are queued for a background thread
+that renders and stores them, so a later read has the HTML.
+
+    python rendering.py prune   # drop entries no current text hashes to
+"""
+import argparse
+import hashlib
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import nh3
+from markdown_it import MarkdownIt
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the output of render() changes for the same input.
+RENDERER_VERSION = "1"
+# ETag variant for responses carrying rendered_html (see http_cache.make_etag).
+ETAG_VARIANT = f"html{RENDERER_VERSION}"
+RENDER_QUEUE_SIZE = int(os.environ.get("BOOK_MEMORY_RENDER_QUEUE_SIZE", "1000"))
+RENDER_BATCH_SIZE = 50
+LOOKUP_CHUNK = 500
+
+MARKDOWN = "markdown"
+QUILL = "quill"
+
+_markdown = MarkdownIt("commonmark", {"html": False}).enable(["table", "strikethrough"])
+
+_TAGS = {
+    "a", "b", "blockquote", "br", "code", "del", "em", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img",
+    "li", "ol", "p", "pre", "s", "span", "strong", "sub", "sup", "table", "tbody", "td", "th", "thead", "tr",
+    "u", "ul",
+}
+
+
+def _attribute_filter(tag: str, attribute: str, value: str) -> Optional[str]:
+    if attribute == "class":
+        # Quill's own formatting classes (alignment, indent, size, code blocks) only.
+        kept = " ".join(name for name in value.split() if name.startswith("ql-"))
+        return kept or None
+    if attribute in ("href", "src") and value.strip().lower().startswith("data:"):
+        # Quill embeds pasted images as data: URLs; anything else under data: is dropped.
+        return value if tag == "img" and value.strip().lower().startswith("data:image/") else None
+    return value
+
+
+_cleaner = nh3.Cleaner(
+    tags=_TAGS,
+    attributes={
+        "*": {"class"},
+        "a": {"href", "target"},
+        "img": {"src", "alt", "width", "height"},
+        "span": {"style"},
+        "td": {"align", "style"},
+        "th": {"align", "style"},
+    },
+    url_schemes={"http", "https", "mailto", "data"},
+    attribute_filter=_attribute_filter,
+    filter_style_properties={"color", "background-color", "text-align"},
+    link_rel="noopener noreferrer nofollow",
+)
+
+
+def render(kind: str, source: str) -> str:
+    html = _markdown.render(source) if kind == MARKDOWN else source
+    return _cleaner.clean(html)
+
+
+def cache_key(kind: str, source: str) -> str:
+    return hashlib.sha256(f"{RENDERER_VERSION}\0{kind}\0{source}".encode("utf-8")).hexdigest()
+
+
+# --- Background rendering ---
+
+class RenderWorker:
+    """Renders queued cache misses on one daemon thread and stores them in batches."""
+
+    def __init__(self, maxsize: int = RENDER_QUEUE_SIZE):
+        self._queue: "queue.Queue[Optional[Tuple[str, str, str]]]" = queue.Queue(maxsize=maxsize)
+        self._queued: set = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, key: str, kind: str, source: str) -> None:
+        with self._lock:
+            if key in self._queued:
+                return
+            try:
+                self._queue.put_nowait((key, kind, source))
+            except queue.Full:
+                return  # a later read asks again
+            self._queued.add(key)
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            batch = [job]
+            while len(batch) < RENDER_BATCH_SIZE:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._queue.put(None)  # finish this batch, then stop
+                    break
+                batch.append(job)
+            try:
+                self._store(batch)
+            except Exception:
+                logger.exception("Rendering %d texts failed", len(batch))
+            finally:
+                with self._lock:
+                    self._queued.difference_update(key for key, _, _ in batch)
+
+    def _store(self, batch: List[Tuple[str, str, str]]) -> None:
+        # Render before taking the single writer connection.
+        now = datetime.utcnow()
+        rows = [{"key": key, "html": render(kind, source), "created_at": now} for key, kind, source in batch]
+        db = SessionLocal()
+        try:
+            db.execute(insert(models.RenderedHtml).prefix_with("OR IGNORE"), rows)
+            db.commit()
+        finally:
+            db.close()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="render-worker", daemon=True)
+            self._thread.start()
+
+    def shutdown(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+render_worker = RenderWorker()
+
+
+# --- Lookup ---
+
+def rendered(db: Session, kind: str, sources: Sequence[Optional[str]]) -> List[Optional[str]]:
+    """Cached HTML for each source, in order. Misses are None and get queued for rendering."""
+    keys = [cache_key(kind, source) if source else None for source in sources]
+    wanted = list({key for key in keys if key})
+    found: Dict[str, str] = {}
+    for start in range(0, len(wanted), LOOKUP_CHUNK):
+        chunk = wanted[start:start + LOOKUP_CHUNK]
+        found.update(db.execute(select(models.RenderedHtml.key, models.RenderedHtml.html).where(
+            models.RenderedHtml.key.in_(chunk)
+        )).all())
+    results: List[Optional[str]] = []
+    for key, source in zip(keys, sources):
+        if key is None:
+            results.append("")
+        elif key in found:
+            results.append(found[key])
+        else:
+            render_worker.submit(key, kind, source)
+            results.append(None)
+    return results
+
+
+def attach(db: Session, kind: str, items: Iterable, field: str) -> bool:
+    """Set rendered_html on response models or fast-path dicts from their `field`; True if any missed."""
+    items = list(items)
+    is_dict = bool(items) and isinstance(items[0], dict)
+    sources = [item[field] if is_dict else getattr(item, field) for item in items]
+    missed = False
+    for item, html in zip(items, rendered(db, kind, sources)):
+        missed = missed or html is None
+        if is_dict:
+            item["rendered_html"] = html
+        else:
+            item.rendered_html = html
+    return missed
+
+
+def attach_books(db: Session, books: Iterable) -> bool:
+    """attach() for full BookOut items: the book memo and every nested chapter and note."""
+    books = list(books)
+
+    def nested(book, name):
+        return (book[name] if isinstance(book, dict) else getattr(book, name)) or []
+
+    chapters = [chapter for book in books for chapter in nested(book, "chapters")]
+    notes = [note for book in books for note in nested(book, "notes")]
+    missed = attach(db, MARKDOWN, books, "note_markdown")
+    missed |= attach(db, MARKDOWN, chapters, "note_markdown")
+    missed |= attach(db, QUILL, notes, "content")
+    return missed
+
+
+# --- Maintenance ---
+
+SOURCES = (
+    (MARKDOWN, models.Book.note_markdown),
+    (MARKDOWN, models.Chapter.note_markdown),
+    (QUILL, models.NotePage.content),
+)
+
+
+def prune(db: Session) -> int:
+    """Delete entries that no current text (at the current RENDERER_VERSION) maps to."""
+    live = set()
+    for kind, column in SOURCES:
+        for source in db.execute(select(column).where(column.isnot(None))).scalars().yield_per(1000):
+            if source:
+                live.add(cache_key(kind, source))
+    stale = [key for key in db.execute(select(models.RenderedHtml.key)).scalars() if key not in live]
+    for start in range(0, len(stale), LOOKUP_CHUNK):
+        db.execute(delete(models.RenderedHtml).where(models.RenderedHtml.key.in_(stale[start:start + LOOKUP_CHUNK])))
+    db.commit()
+    return len(stale)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("prune", help="delete cached HTML no current text uses")
+    parser.parse_args(argv)
+    db = SessionLocal()
+    try:
+        print(f"Deleted {prune(db)} cached renderings")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Revision history for chapter memos and note pages.
+
+Every ORM write that changes the text stores one `text_revisions` row in the
+same transaction: a zlib-compressed full snapshot every REVISION_SNAPSHOT_INTERVAL
+revisions, and a compressed diff against the previous revision in between. So a
+write costs about the size of its diff, and rebuilding any revision replays at
+most REVISION_SNAPSHOT_INTERVAL - 1 diffs on top of one snapshot.
+
+Diffs are JSON lists applied left to right: a positive int keeps that many
+characters, a negative int drops that many, a string inserts itself; whatever
+is left after the last op is kept. They are computed in before_flush, ahead of
+the UPDATE that opens SQLite's write transaction, and diff tokens (lines, or
+tags for Quill HTML) rather than characters, so the cost stays near linear.
+"""
+import difflib
+import json
+import os
+import re
+import zlib
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, event, insert, select
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+
+import models
+
+REVISION_SNAPSHOT_INTERVAL = int(os.environ.get("BOOK_MEMORY_REVISION_SNAPSHOT_INTERVAL", "20"))
+# Above this many changed tokens, skip the matcher and replace the span.
+_MATCHER_LIMIT = 20000
+# A token ends after a newline or ">": Markdown lines, Quill HTML tags and text runs.
+_TOKEN = re.compile(r"[^\n>]+[\n>]?|[\n>]")
+
+KINDS = {
+    "chapter": (models.Chapter, "note_markdown"),
+    "note": (models.NotePage, "content"),
+}
+
+
+def _common_ends(old: str, new: str):
+    """Lengths of the common prefix and of the common suffix after it."""
+    start = 0
+    limit = min(len(old), len(new))
+    while start < limit and old[start] == new[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old[len(old) - 1 - end] == new[len(new) - 1 - end]:
+        end += 1
+    return start, end
+
+
+def _push(ops: list, op) -> None:
+    # Merge runs of the same kind so the stored list stays short.
+    if ops and type(ops[-1]) is type(op) and (isinstance(op, str) or (ops[-1] > 0) == (op > 0)):
+        ops[-1] += op
+    else:
+        ops.append(op)
+
+
+def _replace(ops: list, old: str, new: str) -> None:
+    """Keep the common prefix and suffix, replace what is between."""
+    start, end = _common_ends(old, new)
+    if start:
+        _push(ops, start)
+    if len(old) - start - end:
+        _push(ops, start + end - len(old))
+    if len(new) - start - end:
+        _push(ops, new[start:len(new) - end])
+    if end:
+        _push(ops, end)
+
+
+def make_diff(old: str, new: str) -> list:
+    start, end = _common_ends(old, new)
+    old_tokens = _TOKEN.findall(old[start:len(old) - end])
+    new_tokens = _TOKEN.findall(new[start:len(new) - end])
+
+    ops: list = []
+    if start:
+        _push(ops, start)
+    if len(old_tokens) + len(new_tokens) > _MATCHER_LIMIT:
+        _replace(ops, "".join(old_tokens), "".join(new_tokens))
+    else:
+        matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                _push(ops, sum(len(token) for token in old_tokens[i1:i2]))
+            elif tag == "replace" and i2 - i1 == j2 - j1:
+                # Same number of tokens, e.g. a word replaced on several lines: edit each in place.
+                for old_token, new_token in zip(old_tokens[i1:i2], new_tokens[j1:j2]):
+                    _replace(ops, old_token, new_token)
+            else:
+                _replace(ops, "".join(old_tokens[i1:i2]), "".join(new_tokens[j1:j2]))
+    # The common suffix is kept implicitly.
+    while ops and isinstance(ops[-1], int) and ops[-1] > 0:
+        ops.pop()
+    return ops
+
+
+def apply_diff(old: str, ops: list) -> str:
+    out = []
+    pos = 0
+    for op in ops:
+        if isinstance(op, str):
+            out.append(op)
+        elif op > 0:
+            out.append(old[pos:pos + op])
+            pos += op
+        else:
+            pos -= op
+    out.append(old[pos:])
+    return "".join(out)
+
+
+def _pack(value) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _unpack(data: bytes):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def _store(connection, kind: str, item_id: int, revision: int, text: str, previous, ops=None) -> None:
+    """previous: (revision, chain, text) of the item's latest stored revision, or None.
+
+    ops: make_diff(previous text, text) if already computed.
+    """
+    table = models.TextRevision.__table__
+    if previous is None or previous[1] + 1 >= REVISION_SNAPSHOT_INTERVAL:
+        chain, data = 0, _pack(text)
+    else:
+        chain, data = previous[1] + 1, _pack(ops if ops is not None else make_diff(previous[2], text))
+    connection.execute(
+        insert(table).values(
+            kind=kind,
+            item_id=item_id,
+            revision=revision,
+            chain=chain,
+            data=data,
+            length=len(text),
+            created_at=datetime.utcnow(),
+        )
+    )
+
+
+def _latest(connection, kind: str, item_id: int):
+    table = models.TextRevision.__table__
+    return connection.execute(
+        select(table.c.revision, table.c.chain)
+        .where(table.c.kind == kind, table.c.item_id == item_id)
+        .order_by(table.c.revision.desc())
+        .limit(1)
+    ).first()
+
+
+_DIFFS = "book_memory_revision_diffs"
+_TRACKED = {model: field for model, field in KINDS.values()}
+
+
+@event.listens_for(Session, "before_flush")
+def _diff_before_flush(session, flush_context, instances) -> None:
+    # Diff while nothing is written yet; the after_update listener below only stores the result.
+    diffs = session.info.setdefault(_DIFFS, {})
+    for target in session.dirty:
+        field = _TRACKED.get(type(target))
+        if field is None:
+            continue
+        history = get_history(target, field)
+        if history.has_changes():
+            old_text = (history.deleted or [None])[0] or ""
+            new_text = getattr(target, field) or ""
+            diffs[id(target)] = (old_text, new_text, make_diff(old_text, new_text))
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _forget_diffs(session, flush_context) -> None:
+    session.info.pop(_DIFFS, None)
+
+
+def _precomputed(target, old_text: str, new_text: str):
+    session = object_session(target)
+    entry = session.info.get(_DIFFS, {}).get(id(target)) if session is not None else None
+    if entry is not None and entry[0] == old_text and entry[1] == new_text:
+        return entry[2]
+    return None
+
+
+def _listen(model, kind: str, field: str) -> None:
+    def inserted(mapper, connection, target):
+        _store(connection, kind, target.id, target.revision or 0, getattr(target, field) or "", None)
+
+    def updated(mapper, connection, target):
+        text_history = get_history(target, field)
+        if not text_history.has_changes():
+            return
+        old_text = (text_history.deleted or [None])[0] or ""
+        revision_history = get_history(target, "revision")
+        old_revision = revision_history.deleted[0] if revision_history.deleted else None
+        latest = _latest(connection, kind, target.id)
+        if latest is None or latest.revision != old_revision:
+            # No history for the text being replaced yet (rows from before this
+            # table, bulk imports): keep it as a snapshot first.
+            if old_revision is not None and (latest is None or latest.revision < old_revision):
+                _store(connection, kind, target.id, old_revision, old_text, None)
+                latest = (old_revision, 0)
+            else:
+                latest = None
+        previous = None if latest is None else (latest[0], latest[1], old_text)
+        new_text = getattr(target, field) or ""
+        ops = _precomputed(target, old_text, new_text) if previous is not None else None
+        _store(connection, kind, target.id, target.revision, new_text, previous, ops)
+
+    def removed(mapper, connection, target):
+        table = models.TextRevision.__table__
+        connection.execute(delete(table).where(table.c.kind == kind, table.c.item_id == target.id))
+
+    event.listen(model, "after_insert", inserted)
+    event.listen(model, "after_update", updated)
+    event.listen(model, "after_delete", removed)
+
+
+for _kind, (_model, _field) in KINDS.items():
+    _listen(_model, _kind, _field)
+
+
+def _drop_history(connection, book_ids) -> None:
+    table = models.TextRevision.__table__
+    for kind, (model, _) in KINDS.items():
+        connection.execute(
+            delete(table).where(
+                table.c.kind == kind,
+                table.c.item_id.in_(select(model.id).where(model.book_id.in_(book_ids))),
+            )
+        )
+
+
+@event.listens_for(models.Book, "before_delete")
+def _book_deleted(mapper, connection, book) -> None:
+    # Its chapters and notes go through ON DELETE CASCADE, which skips `removed` above.
+    _drop_history(connection, [book.id])
+
+
+def drop_user(connection, user_id: int) -> None:
+    """Delete the history of all of a user's chapters and notes; call before their rows are deleted."""
+    _drop_history(connection, select(models.Book.id).where(models.Book.user_id == user_id))
+
+
+def list_revisions(db: Session, kind: str, item_id: int) -> List[models.TextRevision]:
+    return (
+        db.query(models.TextRevision)
+        .filter(models.TextRevision.kind == kind, models.TextRevision.item_id == item_id)
+        .order_by(models.TextRevision.revision.desc())
+        .all()
+    )
+
+
+def text_at(db: Session, kind: str, item_id: int, revision: int) -> Optional[str]:
+    """Rebuild the text of one revision: nearest snapshot at or before it, plus the diffs after."""
+    table = models.TextRevision
+    target = (
+        db.query(table.chain)
+        .filter(table.kind == kind, table.item_id == item_id, table.revision == revision)
+        .first()
+    )
+    if target is None:
+        return None
+    rows = (
+        db.query(table.chain, table.data)
+        .filter(table.kind == kind, table.item_id == item_id, table.revision <= revision)
+        .order_by(table.revision.desc())
+        .limit(target.chain + 1)
+        .all()
+    )
+    rows.reverse()
+    text = _unpack(rows[0].data)
+    for row in rows[1:]:
+        text = apply_diff(text, _unpack(row.data))
+    return text
+
+
+def require_text_at(db: Session, kind: str, item_id: int, revision: int) -> str:
+    text = text_at(db, kind, item_id, revision)
+    if text is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Revision not found")
+    return text
@@ -0,0 +1,246 @@
+"""Incrementally maintained reading statistics (user_stats / user_monthly_stats).
+
+Book writes call `apply_book_change` with the book's state before and after the
+change, inside the same transaction, so /api/stats reads are primary-key lookups.
+`python rollup.py rebuild [--check]` recomputes everything from the books table.
+"""
+import argparse
+import sys
+from collections import Counter, namedtuple
+from datetime import date
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import case, func, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+
+BookSnapshot = namedtuple("BookSnapshot", ["status", "started_at", "finished_at"])
+
+USER_FIELDS = ("total_read", "total_want_to_read", "duration_days_total", "duration_count")
+MONTHLY_FIELDS = ("started_count", "finished_count")
+
+
+def month_key(day: date) -> str:
+    return day.strftime("%Y-%m")
+
+
+def snapshot(book: models.Book) -> BookSnapshot:
+    return BookSnapshot(book.status, book.started_at, book.finished_at)
+
+
+def _contribution(snap: Optional[BookSnapshot]) -> Tuple[Counter, Counter]:
+    user_delta: Counter = Counter()
+    monthly_delta: Counter = Counter()
+    if snap is None:
+        return user_delta, monthly_delta
+    if snap.status == models.BookStatus.READ:
+        user_delta["total_read"] += 1
+    elif snap.status == models.BookStatus.WANT_TO_READ:
+        user_delta["total_want_to_read"] += 1
+    if snap.started_at is not None:
+        monthly_delta[(month_key(snap.started_at), "started_count")] += 1
+    if snap.finished_at is not None:
+        monthly_delta[(month_key(snap.finished_at), "finished_count")] += 1
+    if snap.started_at is not None and snap.finished_at is not None and snap.finished_at >= snap.started_at:
+        user_delta["duration_days_total"] += (snap.finished_at - snap.started_at).days
+        user_delta["duration_count"] += 1
+    return user_delta, monthly_delta
+
+
+def _subtract(after: Counter, before: Counter) -> Dict:
+    keys = set(after) | set(before)
+    return {key: after[key] - before[key] for key in keys if after[key] != before[key]}
+
+
+def _upsert_monthly(db: Session, user_id: int, month: str, values: Dict[str, int]) -> None:
+    table = models.UserMonthlyStats.__table__
+    stmt = insert(table).values(
+        user_id=user_id, month=month, **{field: values.get(field, 0) for field in MONTHLY_FIELDS}
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.month],
+        set_={field: table.c[field] + stmt.excluded[field] for field in values},
+    )
+    db.execute(stmt)
+
+
+def has_rollup(db: Session, user_id: int) -> bool:
+    return db.get(models.UserStats, user_id) is not None
+
+
+def create_rollup(user_id: int) -> None:
+    """Build a missing stats row in its own short writer transaction, for read handlers."""
+    db = SessionLocal()
+    try:
+        if not has_rollup(db, user_id):
+            rebuild_user(db, user_id)
+            db.commit()
+    finally:
+        db.close()
+
+
+def ensure_rollup(db: Session, user_id: int) -> models.UserStats:
+    """Return the user's stats row, building it from the books table the first time."""
+    row = db.get(models.UserStats, user_id)
+    if row is None:
+        row = rebuild_user(db, user_id)
+    return row
+
+
+def apply_book_change(
+    db: Session,
+    user_id: int,
+    before: Optional[BookSnapshot],
+    after: Optional[BookSnapshot],
+) -> None:
+    """Fold one book create (before=None), update or delete (after=None) into the rollups.
+
+    Must run before the change is flushed so that a first-time `ensure_rollup`
+    counts the book in its old state.
+    """
+    apply_book_changes(db, user_id, [(before, after)])
+
+
+def apply_book_changes(
+    db: Session,
+    user_id: int,
+    changes: Iterable[Tuple[Optional[BookSnapshot], Optional[BookSnapshot]]],
+) -> None:
+    """Batched form of `apply_book_change`: one UPDATE plus one upsert per touched month."""
+    user_before, monthly_before = Counter(), Counter()
+    user_after, monthly_after = Counter(), Counter()
+    for before, after in changes:
+        if before == after:
+            continue
+        for snap, user_total, monthly_total in (
+            (before, user_before, monthly_before),
+            (after, user_after, monthly_after),
+        ):
+            user_delta, monthly_delta = _contribution(snap)
+            user_total.update(user_delta)
+            monthly_total.update(monthly_delta)
+
+    user_delta = _subtract(user_after, user_before)
+    monthly_delta = _subtract(monthly_after, monthly_before)
+    if not user_delta and not monthly_delta:
+        return
+    stats_row = ensure_rollup(db, user_id)
+    if user_delta:
+        db.execute(
+            update(models.UserStats)
+            .where(models.UserStats.user_id == user_id)
+            .values({field: getattr(models.UserStats, field) + delta for field, delta in user_delta.items()})
+        )
+        db.expire(stats_row)
+
+    by_month: Dict[str, Dict[str, int]] = {}
+    for (month, field), delta in monthly_delta.items():
+        by_month.setdefault(month, {})[field] = delta
+    for month, values in by_month.items():
+        _upsert_monthly(db, user_id, month, values)
+
+
+def read_month(db: Session, user_id: int, month: str) -> Optional[models.UserMonthlyStats]:
+    return db.get(models.UserMonthlyStats, (user_id, month))
+
+
+# --- Rebuild from scratch ---
+def compute_user(db: Session, user_id: int) -> Tuple[Dict[str, int], Dict[str, Dict[str, int]]]:
+    Book = models.Book
+    has_duration = (
+        Book.started_at.isnot(None) & Book.finished_at.isnot(None) & (Book.finished_at >= Book.started_at)
+    )
+    duration_days = func.julianday(Book.finished_at) - func.julianday(Book.started_at)
+    row = (
+        db.query(
+            func.coalesce(func.sum(case((Book.status == models.BookStatus.READ, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((Book.status == models.BookStatus.WANT_TO_READ, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((has_duration, duration_days), else_=0)), 0),
+            func.coalesce(func.sum(case((has_duration, 1), else_=0)), 0),
+        )
+        .filter(Book.user_id == user_id)
+        .one()
+    )
+    totals = {field: int(value) for field, value in zip(USER_FIELDS, row)}
+
+    monthly: Dict[str, Dict[str, int]] = {}
+    for column, field in ((Book.started_at, "started_count"), (Book.finished_at, "finished_count")):
+        key = func.strftime("%Y-%m", column)
+        for month, count in (
+            db.query(key, func.count()).filter(Book.user_id == user_id, column.isnot(None)).group_by(key)
+        ):
+            monthly.setdefault(month, dict.fromkeys(MONTHLY_FIELDS, 0))[field] = count
+    return totals, monthly
+
+
+def stored_user(db: Session, user_id: int) -> Tuple[Optional[Dict[str, int]], Dict[str, Dict[str, int]]]:
+    row = db.get(models.UserStats, user_id)
+    totals = {field: getattr(row, field) for field in USER_FIELDS} if row is not None else None
+    monthly = {
+        m.month: {field: getattr(m, field) for field in MONTHLY_FIELDS}
+        for m in db.query(models.UserMonthlyStats).filter(models.UserMonthlyStats.user_id == user_id)
+        if any(getattr(m, field) for field in MONTHLY_FIELDS)
+    }
+    return totals, monthly
+
+
+def rebuild_user(db: Session, user_id: int) -> models.UserStats:
+    totals, monthly = compute_user(db, user_id)
+    db.query(models.UserMonthlyStats).filter(models.UserMonthlyStats.user_id == user_id).delete()
+    for month, values in monthly.items():
+        db.add(models.UserMonthlyStats(user_id=user_id, month=month, **values))
+    row = db.get(models.UserStats, user_id)
+    if row is None:
+        row = models.UserStats(user_id=user_id)
+        db.add(row)
+    for field, value in totals.items():
+        setattr(row, field, value)
+    db.flush()
+    return row
+
+
+def check_and_rebuild(db: Session, user_id: int, fix: bool) -> bool:
+    """Return True if the stored rollup for `user_id` drifted from the books table."""
+    if not has_rollup(db, user_id):
+        return False  # nothing stored yet; the first stats read or book write builds it
+    expected = compute_user(db, user_id)
+    drifted = stored_user(db, user_id) != expected
+    if drifted and fix:
+        rebuild_user(db, user_id)
+    return drifted
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Maintain the user_stats rollup tables.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild", help="recompute rollups from the books table")
+    rebuild.add_argument("--user-id", type=int, help="only this user (default: everyone)")
+    rebuild.add_argument("--check", action="store_true", help="report drift without writing")
+    args = parser.parse_args(argv)
+
+    from database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if args.user_id is not None:
+            user_ids = [args.user_id]
+        else:
+            user_ids = [user_id for (user_id,) in db.query(models.User.id).order_by(models.User.id)]
+        drifted = [user_id for user_id in user_ids if check_and_rebuild(db, user_id, fix=not args.check)]
+        if not args.check:
+            db.commit()
+    finally:
+        db.close()
+
+    for user_id in drifted:
+        print(f"user {user_id}: drift {'found' if args.check else 'repaired'}")
+    print(f"checked {len(user_ids)} users, {len(drifted)} drifted")
+    return 1 if args.check and drifted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
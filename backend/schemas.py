@@ -1,5 +1,5 @@
 from datetime import datetime, date
-from typing import Optional, List
+from typing import Dict, List, Literal, Optional, Union
 from pydantic import BaseModel, Field, ConfigDict
 
 from models import BookStatus
@@ -17,6 +17,10 @@ class UserOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class AccountDelete(BaseModel):
+    password: str  # re-entered to confirm
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
@@ -38,6 +42,24 @@ class BookCreate(BookBase):
     pass
 
 
+# Columns returned by GET /api/books?fields=summary; leaves out note_markdown and the
+# chapter/note collections so the shelf view never reads the large Text columns.
+BOOK_SUMMARY_FIELDS = (
+    "id",
+    "title",
+    "author",
+    "status",
+    "amazon_url",
+    "cover_image_url",
+    "started_at",
+    "finished_at",
+    "title_guess",
+    "created_at",
+    "updated_at",
+)
+BOOK_SPARSE_FIELDS = BOOK_SUMMARY_FIELDS + ("note_markdown",)
+
+
 class BookUpdate(BaseModel):
     title: Optional[str] = None
     author: Optional[str] = None
@@ -64,13 +86,29 @@ class ChapterUpdate(BaseModel):
     title: Optional[str] = None
     order: Optional[int] = None
     note_markdown: Optional[str] = None
+    base_revision: Optional[int] = None  # if set, 409 unless it matches the stored revision
+
+
+class ChapterBatchOp(BaseModel):
+    op: Literal["create", "update", "delete", "reorder"]
+    id: Optional[int] = None  # update / delete
+    ids: Optional[List[int]] = None  # reorder: existing ids in their new order
+    title: Optional[str] = None
+    order: Optional[int] = None
+    note_markdown: Optional[str] = None
+
+
+class ChapterBatch(BaseModel):
+    operations: List[ChapterBatchOp] = Field(..., min_length=1, max_length=500)
 
 
 class ChapterOut(ChapterBase):
     id: int
     book_id: int
+    revision: int = 0
     created_at: datetime
     updated_at: Optional[datetime] = None
+    rendered_html: Optional[str] = None  # with ?render=true; None until rendered
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -89,17 +127,60 @@ class NotePageUpdate(BaseModel):
     title: Optional[str] = None
     sort_order: Optional[int] = None
     content: Optional[str] = None
+    base_revision: Optional[int] = None
+
+
+class NotePageBatchOp(BaseModel):
+    op: Literal["create", "update", "delete", "reorder"]
+    id: Optional[int] = None
+    ids: Optional[List[int]] = None
+    title: Optional[str] = None
+    sort_order: Optional[int] = None
+    content: Optional[str] = None
+
+
+class NotePageBatch(BaseModel):
+    operations: List[NotePageBatchOp] = Field(..., min_length=1, max_length=500)
 
 
 class NotePageOut(NotePageBase):
     id: int
     book_id: int
+    revision: int = 0
     created_at: datetime
     updated_at: Optional[datetime] = None
+    rendered_html: Optional[str] = None  # with ?render=true; None until rendered
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class TextPatch(BaseModel):
+    """Quill-style delta against base_revision: [{"retain": n}, {"insert": "..."}, {"delete": n}]."""
+
+    base_revision: int
+    ops: List[Dict[str, Union[int, str]]] = Field(..., max_length=10000)
+
+
+class TextPatchResult(BaseModel):
+    id: int
+    revision: int
+    length: int  # UTF-16 code units, for the client to sanity-check its copy
+
+
+class TextRevisionOut(BaseModel):
+    revision: int
+    chain: int  # 0 = stored as a full snapshot
+    length: int
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class TextRevisionContent(BaseModel):
+    revision: int
+    text: str
+
+
 class CommentBase(BaseModel):
     content: str
 
@@ -117,9 +198,27 @@ class CommentOut(CommentBase):
     model_config = ConfigDict(from_attributes=True)
 
 
-class FollowOut(BaseModel):
-    follower: UserOut
-    following: UserOut
+class UserProfileOut(UserOut):
+    follower_count: int = 0
+    following_count: int = 0
+
+
+class FollowListItem(BaseModel):
+    user: UserProfileOut
+    is_following: bool  # the viewer follows this user
+    follows_you: bool  # this user follows the viewer
+    followed_at: datetime
+
+
+class FeedItemOut(BaseModel):
+    id: int
+    kind: str  # status | finished | note
+    actor: UserOut
+    book_id: int
+    book_title: str
+    status: Optional[BookStatus] = None
+    note_id: Optional[int] = None
+    note_title: Optional[str] = None
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
@@ -142,10 +241,20 @@ class MessageOut(MessageBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ConversationOut(BaseModel):
+    other_user: UserOut
+    last_message_id: Optional[int] = None
+    last_message_sender_id: Optional[int] = None
+    last_message_preview: str = ""
+    last_message_at: datetime
+    unread_count: int
+
+
 class BookOut(BookBase):
     id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
+    rendered_html: Optional[str] = None  # with ?render=true; None until rendered
     chapters: Optional[List[ChapterOut]] = None
     notes: Optional[List[NotePageOut]] = None
 
@@ -159,4 +268,85 @@ class StatsOverview(BaseModel):
     finished_this_month: int
 
 
+class MonthlyCount(BaseModel):
+    month: str  # YYYY-MM
+    count: int
+
+
+class AuthorCount(BaseModel):
+    author: str
+    count: int
+
+
+class StatsDashboard(StatsOverview):
+    avg_days_to_finish: Optional[float] = None
+    finished_by_month: List[MonthlyCount]
+    top_authors: List[AuthorCount]
+
+
+class CalendarEvent(BaseModel):
+    day: date
+    kind: Literal["start", "finish"]
+    book_id: int
+    title: str
+    author: Optional[str] = None
+    cover_image_url: Optional[str] = None
+    status: BookStatus
+
+
+class CalendarDay(BaseModel):
+    day: date
+    started: int
+    finished: int
+
+
+class CalendarHeatmap(BaseModel):
+    year: int
+    days: List[CalendarDay]
+
+
+class BookRecordOut(BookBase):
+    id: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class SyncTombstone(BaseModel):
+    kind: str  # "book" | "chapter" | "note" | "comment"
+    id: int
+
+
+class SyncResponse(BaseModel):
+    token: str
+    has_more: bool
+    books: List[BookRecordOut]
+    chapters: List[ChapterOut]
+    notes: List[NotePageOut]
+    comments: List[CommentOut]
+    deleted: List[SyncTombstone]
+
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+
+class ImportResult(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    batches: int = 0
+    errors: List[ImportRowError] = []  # first 100 only; `failed` has the full count
+
+
+class SearchHit(BaseModel):
+    kind: str  # "book" | "chapter" | "note"
+    id: int
+    book_id: int
+    title: str
+    snippet: str  # HTML-escaped text with matches wrapped in <mark>
+    score: float
+
+
 BookOut.update_forward_refs()
@@ -0,0 +1,339 @@
+"""Full-text search over books, chapter notes and note pages (SQLite FTS5).
+
+`search_index` is a standalone FTS5 table kept in sync by mapper events on
+Book, Chapter and NotePage, inside the same transaction as the ORM write.
+Each row's rowid is derived from (kind, id), so updates and deletes are rowid
+lookups rather than scans. The trigram tokenizer gives substring matching,
+which is what Japanese text needs since it has no word boundaries.
+
+The table is shared by all users. Each row carries an indexed `owner` token
+("[u42]") that every query MATCHes, so FTS5 narrows to one user's rows inside
+the index lookup and cost follows that user's notes, not everyone's.
+"""
+import html
+import re
+import sys
+from html.parser import HTMLParser
+from typing import List, Optional
+
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+
+INDEX_TABLE = "search_index"
+KIND_CODES = {"book": 0, "chapter": 1, "note": 2}
+MIN_MATCH_CHARS = 3  # shortest term the trigram tokenizer can MATCH
+SNIPPET_TOKENS = 16
+# Control characters survive html.escape(), so the snippet can be escaped first
+# and the markers swapped for <mark> afterwards.
+_MARK_OPEN, _MARK_CLOSE = "\x02", "\x03"
+
+_CREATE_INDEX = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5(
+    title,
+    body,
+    kind UNINDEXED,
+    item_id UNINDEXED,
+    book_id UNINDEXED,
+    owner,
+    tokenize = 'trigram'
+)
+"""
+
+
+class _TextExtractor(HTMLParser):
+    _BREAKS = {"p", "br", "div", "li", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "tr"}
+    _SKIP = {"script", "style"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skipping += 1
+        elif tag in self._BREAKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP and self._skipping:
+            self._skipping -= 1
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+def strip_html(value: Optional[str]) -> str:
+    if not value:
+        return ""
+    parser = _TextExtractor()
+    parser.feed(value)
+    parser.close()
+    return "".join(parser.parts).strip()
+
+
+def rowid_for(kind: str, item_id: int) -> int:
+    return item_id * len(KIND_CODES) + KIND_CODES[kind]
+
+
+def owner_token(user_id: int) -> str:
+    # The brackets keep "[u4]" from matching inside "[u42]".
+    return f"[u{user_id}]"
+
+
+def ensure_index(bind) -> None:
+    """Create the FTS table on first run (or rebuild one without `owner`) and fill it from the existing rows."""
+    with bind.begin() as conn:
+        columns = {row[1] for row in conn.execute(text(f"PRAGMA table_info({INDEX_TABLE})"))}
+        if "owner" in columns:
+            return
+        conn.execute(text(f"DROP TABLE IF EXISTS {INDEX_TABLE}"))
+        conn.execute(text(_CREATE_INDEX))
+        _fill(conn)
+
+
+def rebuild(bind) -> None:
+    with bind.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {INDEX_TABLE}"))
+        conn.execute(text(_CREATE_INDEX))
+        _fill(conn)
+
+
+def _fill(conn) -> None:
+    Book, Chapter, NotePage = models.Book, models.Chapter, models.NotePage
+    for row in conn.execute(select(Book.id, Book.user_id, Book.title, Book.author, Book.note_markdown)):
+        _put(conn, "book", row.id, row.id, row.user_id, row.title, _book_body(row.author, row.note_markdown))
+    for row in conn.execute(
+        select(Chapter.id, Chapter.book_id, Book.user_id, Chapter.title, Chapter.note_markdown).join(Book)
+    ):
+        _put(conn, "chapter", row.id, row.book_id, row.user_id, row.title, row.note_markdown or "")
+    for row in conn.execute(
+        select(NotePage.id, NotePage.book_id, Book.user_id, NotePage.title, NotePage.content).join(Book)
+    ):
+        _put(conn, "note", row.id, row.book_id, row.user_id, row.title, strip_html(row.content))
+
+
+def _book_body(author: Optional[str], note_markdown: Optional[str]) -> str:
+    return "\n".join(part for part in (author, note_markdown) if part)
+
+
+def _put(conn, kind: str, item_id: int, book_id: int, user_id: int, title: str, body: str) -> None:
+    rowid = rowid_for(kind, item_id)
+    conn.execute(text(f"DELETE FROM {INDEX_TABLE} WHERE rowid = :rowid"), {"rowid": rowid})
+    conn.execute(
+        text(
+            f"INSERT INTO {INDEX_TABLE} (rowid, title, body, kind, item_id, book_id, owner) "
+            "VALUES (:rowid, :title, :body, :kind, :item_id, :book_id, :owner)"
+        ),
+        {
+            "rowid": rowid,
+            "title": title or "",
+            "body": body,
+            "kind": kind,
+            "item_id": item_id,
+            "book_id": book_id,
+            "owner": owner_token(user_id),
+        },
+    )
+
+
+def index_rows(conn, kind: str, rows) -> None:
+    """Index rows written outside the ORM (bulk inserts skip the mapper events below).
+
+    `rows` are dicts with id, book_id, user_id, title and the kind's text fields.
+    """
+    for row in rows:
+        if kind == "book":
+            body = _book_body(row.get("author"), row.get("note_markdown"))
+        elif kind == "chapter":
+            body = row.get("note_markdown") or ""
+        else:
+            body = strip_html(row.get("content"))
+        _put(conn, kind, row["id"], row["book_id"], row["user_id"], row["title"], body)
+
+
+def _drop(conn, kind: str, item_id: int) -> None:
+    conn.execute(text(f"DELETE FROM {INDEX_TABLE} WHERE rowid = :rowid"), {"rowid": rowid_for(kind, item_id)})
+
+
+def _changed(target, *fields: str) -> bool:
+    state = inspect(target)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+def _owner_of(conn, book_id: int) -> int:
+    return conn.execute(select(models.Book.user_id).where(models.Book.id == book_id)).scalar_one()
+
+
+# --- ORM sync ---
+@event.listens_for(models.Book, "after_insert")
+@event.listens_for(models.Book, "after_update")
+def _index_book(mapper, connection, target) -> None:
+    if not _changed(target, "title", "author", "note_markdown", "user_id"):
+        return
+    body = _book_body(target.author, target.note_markdown)
+    _put(connection, "book", target.id, target.id, target.user_id, target.title, body)
+
+
+@event.listens_for(models.Chapter, "after_insert")
+@event.listens_for(models.Chapter, "after_update")
+def _index_chapter(mapper, connection, target) -> None:
+    if not _changed(target, "title", "note_markdown", "book_id"):
+        return
+    user_id = _owner_of(connection, target.book_id)
+    _put(connection, "chapter", target.id, target.book_id, user_id, target.title, target.note_markdown or "")
+
+
+@event.listens_for(models.NotePage, "after_insert")
+@event.listens_for(models.NotePage, "after_update")
+def _index_note(mapper, connection, target) -> None:
+    if not _changed(target, "title", "content", "book_id"):
+        return
+    user_id = _owner_of(connection, target.book_id)
+    _put(connection, "note", target.id, target.book_id, user_id, target.title, strip_html(target.content))
+
+
+@event.listens_for(models.Book, "after_delete")
+def _unindex_book(mapper, connection, target) -> None:
+    _drop(connection, "book", target.id)
+
+
+@event.listens_for(models.Chapter, "after_delete")
+def _unindex_chapter(mapper, connection, target) -> None:
+    _drop(connection, "chapter", target.id)
+
+
+@event.listens_for(models.NotePage, "after_delete")
+def _unindex_note(mapper, connection, target) -> None:
+    _drop(connection, "note", target.id)
+
+
+def _drop_all(conn, kind: str, ids_query) -> None:
+    rowids = [{"rowid": rowid_for(kind, item_id)} for item_id in conn.execute(ids_query).scalars()]
+    if rowids:
+        conn.execute(text(f"DELETE FROM {INDEX_TABLE} WHERE rowid = :rowid"), rowids)
+
+
+@event.listens_for(models.Book, "before_delete")
+def _unindex_book_children(mapper, connection, target) -> None:
+    # Chapters and notes go with the book through ON DELETE CASCADE, without mapper events.
+    _drop_all(connection, "chapter", select(models.Chapter.id).where(models.Chapter.book_id == target.id))
+    _drop_all(connection, "note", select(models.NotePage.id).where(models.NotePage.book_id == target.id))
+
+
+def drop_user(conn, user_id: int) -> None:
+    """Remove a user's entries; call before their rows are deleted."""
+    Book, Chapter, NotePage = models.Book, models.Chapter, models.NotePage
+    _drop_all(conn, "book", select(Book.id).where(Book.user_id == user_id))
+    _drop_all(conn, "chapter", select(Chapter.id).join(Book, Book.id == Chapter.book_id).where(Book.user_id == user_id))
+    _drop_all(conn, "note", select(NotePage.id).join(Book, Book.id == NotePage.book_id).where(Book.user_id == user_id))
+
+
+# --- Query ---
+def _terms(query: str) -> List[str]:
+    return [term for term in query.split() if term]
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _render_snippet(raw: str) -> str:
+    return html.escape(raw).replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
+
+
+def _python_snippet(body: str, terms: List[str]) -> str:
+    lowered = body.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    start = min((pos for pos in positions if pos >= 0), default=0)
+    begin = max(0, start - 20)
+    window = body[begin : begin + 80]
+    for term in terms:
+        # Case-insensitive, as both search paths are; the text keeps its own casing.
+        window = re.sub(re.escape(term), lambda m: f"{_MARK_OPEN}{m.group(0)}{_MARK_CLOSE}", window, flags=re.I)
+    return ("…" if begin else "") + window + ("…" if begin + 80 < len(body) else "")
+
+
+def search(
+    db: Session, user_id: int, query: str, limit: int, kind: Optional[str] = None
+) -> List[schemas.SearchHit]:
+    terms = _terms(query)
+    if not terms:
+        return []
+    owner = f"owner : {_fts_phrase(owner_token(user_id))}"
+    params = {"limit": limit}
+    kind_filter = ""
+    if kind is not None:
+        kind_filter = " AND kind = :kind"
+        params["kind"] = kind
+
+    if all(len(term) >= MIN_MATCH_CHARS for term in terms):
+        phrases = " ".join(_fts_phrase(term) for term in terms)
+        params["match"] = f"{owner} AND {{title body}} : ({phrases})"
+        rows = db.execute(
+            text(
+                # Weight 0 for owner: it matches every row of the user and must not affect ranking.
+                f"SELECT kind, item_id, book_id, title, bm25({INDEX_TABLE}, 5.0, 1.0, 0.0, 0.0, 0.0, 0.0) AS score, "
+                f"snippet({INDEX_TABLE}, 1, '{_MARK_OPEN}', '{_MARK_CLOSE}', '…', {SNIPPET_TOKENS}) AS snippet "
+                f"FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH :match{kind_filter} "
+                "ORDER BY score LIMIT :limit"
+            ),
+            params,
+        ).all()
+        return [
+            schemas.SearchHit(
+                kind=row.kind,
+                id=row.item_id,
+                book_id=row.book_id,
+                title=row.title,
+                snippet=_render_snippet(row.snippet),
+                score=-row.score,
+            )
+            for row in rows
+        ]
+
+    # Terms below the trigram size can't use MATCH; they become a substring scan
+    # over this user's rows as narrowed by the owner token and any longer terms
+    # (instr() rather than LIKE, which misbehaves on trigram tables). lower() on
+    # both sides matches the case folding of the trigram MATCH path.
+    longer = [_fts_phrase(term) for term in terms if len(term) >= MIN_MATCH_CHARS]
+    params["owner"] = f"{owner} AND {{title body}} : ({' '.join(longer)})" if longer else owner
+    conditions = []
+    for i, term in enumerate(terms):
+        if len(term) >= MIN_MATCH_CHARS:
+            continue
+        params[f"term{i}"] = term
+        conditions.append(f"(instr(lower(title), lower(:term{i})) > 0 OR instr(lower(body), lower(:term{i})) > 0)")
+    rows = db.execute(
+        text(
+            f"SELECT kind, item_id, book_id, title, body FROM {INDEX_TABLE} "
+            f"WHERE {INDEX_TABLE} MATCH :owner{kind_filter} AND {' AND '.join(conditions)} "
+            "ORDER BY rowid DESC LIMIT :limit"
+        ),
+        params,
+    ).all()
+    return [
+        schemas.SearchHit(
+            kind=row.kind,
+            id=row.item_id,
+            book_id=row.book_id,
+            title=row.title,
+            snippet=_render_snippet(_python_snippet(row.body, terms)),
+            score=0.0,
+        )
+        for row in rows
+    ]
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python search.py rebuild")
+    from database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    rebuild(engine)
+    print("search index rebuilt")
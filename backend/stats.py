@@ -0,0 +1,74 @@
+from datetime import date
+from typing import List
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+import rollup
+import schemas
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + (day.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def rollup_counters(db: Session, user_id: int, today: date) -> dict:
+    """Counters from the user's rollup rows, which must exist (see rollup.create_rollup)."""
+    totals = db.get(models.UserStats, user_id)
+    month = rollup.read_month(db, user_id, rollup.month_key(today))
+    return {
+        "total_read": totals.total_read,
+        "total_want_to_read": totals.total_want_to_read,
+        "read_this_month": month.started_count if month else 0,
+        "finished_this_month": month.finished_count if month else 0,
+        "avg_days_to_finish": (
+            round(totals.duration_days_total / totals.duration_count, 1) if totals.duration_count else None
+        ),
+    }
+
+
+def finished_by_month(db: Session, user_id: int, today: date, months: int) -> List[schemas.MonthlyCount]:
+    Monthly = models.UserMonthlyStats
+    first = add_months(month_start(today), -(months - 1))
+    keys = [rollup.month_key(add_months(first, i)) for i in range(months)]
+    rows = (
+        db.query(Monthly.month, Monthly.finished_count)
+        .filter(Monthly.user_id == user_id, Monthly.month >= keys[0], Monthly.month <= keys[-1])
+        .all()
+    )
+    counts = {row.month: row.finished_count for row in rows}
+    # Months without finished books are returned as zero so charts get a continuous axis.
+    return [schemas.MonthlyCount(month=key, count=counts.get(key, 0)) for key in keys]
+
+
+def top_authors(db: Session, user_id: int, limit: int) -> List[schemas.AuthorCount]:
+    Book = models.Book
+    rows = (
+        db.query(Book.author, func.count().label("count"))
+        .filter(Book.user_id == user_id, Book.author.isnot(None), Book.author != "")
+        .group_by(Book.author)
+        .order_by(func.count().desc(), Book.author)
+        .limit(limit)
+        .all()
+    )
+    return [schemas.AuthorCount(author=row.author, count=row.count) for row in rows]
+
+
+def overview(db: Session, user_id: int, today: date) -> schemas.StatsOverview:
+    counters = rollup_counters(db, user_id, today)
+    counters.pop("avg_days_to_finish")
+    return schemas.StatsOverview(**counters)
+
+
+def dashboard(db: Session, user_id: int, today: date, months: int, authors: int) -> schemas.StatsDashboard:
+    return schemas.StatsDashboard(
+        **rollup_counters(db, user_id, today),
+        finished_by_month=finished_by_month(db, user_id, today, months),
+        top_authors=top_authors(db, user_id, authors),
+    )
@@ -0,0 +1,183 @@
+"""Delta sync: which books, chapters, note pages and comments changed since a token.
+
+Mapper events record the latest change per row in `sync_changes`, in the same
+transaction as the write. Each record replaces the previous one for that row,
+so the table holds one row per live item plus one tombstone per deleted item.
+SQLite runs one write transaction at a time and the ids are AUTOINCREMENT, so
+ids grow in commit order. A client's token is the last id it has seen.
+
+Deleting a book implies its chapters, notes and comments are gone too; clients
+should drop those when the book's tombstone arrives. The database removes those
+rows through ON DELETE CASCADE without mapper events, so their records here are
+dropped along with the book instead of getting tombstones of their own.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, event, false, func, insert, literal, select
+from sqlalchemy.orm import Session, joinedload, undefer
+
+import models
+import schemas
+
+SYNC_KINDS = {
+    "book": models.Book,
+    "chapter": models.Chapter,
+    "note": models.NotePage,
+    "comment": models.Comment,
+}
+
+
+def _record(connection, user_id: int, kind: str, item_id: int, deleted: bool) -> None:
+    table = models.SyncChange.__table__
+    connection.execute(
+        delete(table).where(table.c.user_id == user_id, table.c.kind == kind, table.c.item_id == item_id)
+    )
+    connection.execute(
+        insert(table).values(
+            user_id=user_id, kind=kind, item_id=item_id, deleted=deleted, changed_at=datetime.utcnow()
+        )
+    )
+
+
+def record_bulk(connection, user_id: int, kind: str, item_ids, deleted: bool = False) -> None:
+    """Log rows written by bulk statements, which don't fire the mapper events below."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return
+    table = models.SyncChange.__table__
+    connection.execute(
+        delete(table).where(table.c.user_id == user_id, table.c.kind == kind, table.c.item_id.in_(item_ids))
+    )
+    now = datetime.utcnow()
+    connection.execute(
+        insert(table),
+        [
+            {"user_id": user_id, "kind": kind, "item_id": item_id, "deleted": deleted, "changed_at": now}
+            for item_id in item_ids
+        ],
+    )
+
+
+def _owner_of(connection, book_id: int) -> int:
+    return connection.execute(select(models.Book.user_id).where(models.Book.id == book_id)).scalar_one()
+
+
+def _listen(model, kind: str, owner) -> None:
+    def changed(mapper, connection, target):
+        _record(connection, owner(connection, target), kind, target.id, deleted=False)
+
+    def removed(mapper, connection, target):
+        _record(connection, owner(connection, target), kind, target.id, deleted=True)
+
+    event.listen(model, "after_insert", changed)
+    event.listen(model, "after_update", changed)
+    event.listen(model, "after_delete", removed)
+
+
+_listen(models.Book, "book", lambda connection, book: book.user_id)
+_listen(models.Chapter, "chapter", lambda connection, chapter: _owner_of(connection, chapter.book_id))
+_listen(models.NotePage, "note", lambda connection, note: _owner_of(connection, note.book_id))
+_listen(models.Comment, "comment", lambda connection, comment: _owner_of(connection, comment.book_id))
+
+
+@event.listens_for(models.Book, "before_delete")
+def _forget_book_children(mapper, connection, book) -> None:
+    table = models.SyncChange.__table__
+    for kind, model in (("chapter", models.Chapter), ("note", models.NotePage), ("comment", models.Comment)):
+        connection.execute(
+            delete(table).where(
+                table.c.user_id == book.user_id,
+                table.c.kind == kind,
+                table.c.item_id.in_(select(model.id).where(model.book_id == book.id)),
+            )
+        )
+
+
+def ensure_backfill(bind) -> None:
+    """Seed sync_changes from existing rows the first time the table is used."""
+    SyncChange = models.SyncChange.__table__
+    Book = models.Book
+    with bind.begin() as conn:
+        if conn.execute(select(SyncChange.c.id).limit(1)).first() is not None:
+            return
+        columns = [
+            SyncChange.c.user_id,
+            SyncChange.c.kind,
+            SyncChange.c.item_id,
+            SyncChange.c.deleted,
+            SyncChange.c.changed_at,
+        ]
+        sources = [
+            select(Book.user_id, literal("book"), Book.id, false(), func.coalesce(Book.updated_at, Book.created_at)),
+            select(
+                Book.user_id, literal("chapter"), models.Chapter.id, false(),
+                func.coalesce(models.Chapter.updated_at, models.Chapter.created_at),
+            ).join(Book, models.Chapter.book_id == Book.id),
+            select(
+                Book.user_id, literal("note"), models.NotePage.id, false(),
+                func.coalesce(models.NotePage.updated_at, models.NotePage.created_at),
+            ).join(Book, models.NotePage.book_id == Book.id),
+            select(
+                Book.user_id, literal("comment"), models.Comment.id, false(), models.Comment.created_at,
+            ).join(Book, models.Comment.book_id == Book.id),
+        ]
+        for source in sources:
+            conn.execute(insert(SyncChange).from_select(columns, source))
+
+
+def current_version(db: Session, user_id: int) -> int:
+    """Id of the user's most recent change (0 if none); one index lookup."""
+    return (
+        db.query(func.max(models.SyncChange.id)).filter(models.SyncChange.user_id == user_id).scalar() or 0
+    )
+
+
+def parse_token(token: Optional[str]) -> int:
+    if not token:
+        return 0
+    try:
+        value = int(token)
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sync token")
+    return value
+
+
+def changes_since(db: Session, user_id: int, since: int, limit: int) -> schemas.SyncResponse:
+    changes = (
+        db.query(models.SyncChange)
+        .filter(models.SyncChange.user_id == user_id, models.SyncChange.id > since)
+        .order_by(models.SyncChange.id)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    live: Dict[str, List[int]] = {kind: [] for kind in SYNC_KINDS}
+    deleted: List[schemas.SyncTombstone] = []
+    for change in changes:
+        if change.deleted:
+            deleted.append(schemas.SyncTombstone(kind=change.kind, id=change.item_id))
+        else:
+            live[change.kind].append(change.item_id)
+
+    def load(kind: str, *options):
+        ids = live[kind]
+        if not ids:
+            return []
+        model = SYNC_KINDS[kind]
+        return db.query(model).options(*options).filter(model.id.in_(ids)).order_by(model.id).all()
+
+    return schemas.SyncResponse(
+        token=str(changes[-1].id if changes else since),
+        has_more=has_more,
+        books=load("book", undefer(models.Book.note_markdown)),
+        chapters=load("chapter"),
+        notes=load("note"),
+        comments=load("comment", joinedload(models.Comment.user)),
+        deleted=deleted,
+    )
@@ -0,0 +1,35 @@
+"""Shared fixtures. Run from backend/: python -m pytest tests
+
+The app is imported once against a throwaway SQLite file, so tests never touch
+data.db. Usernames are unique per test, so tests can share the database.
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="book-memory-tests-")
+os.environ.setdefault("BOOK_MEMORY_DATABASE_URL", f"sqlite:///{os.path.join(_tmp, 'test.db')}")
+os.environ.setdefault("BOOK_MEMORY_BCRYPT_ROUNDS", "4")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+_names = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def auth(client):
+    """Sign up a fresh user and return their Authorization header."""
+    response = client.post("/api/auth/signup", json={"username": f"user{next(_names)}", "password": "secret1"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,77 @@
+import pytest
+from fastapi import HTTPException
+
+from autosave import apply_patch
+
+
+def test_offsets_count_utf16_units():
+    # 😀 and 𠮷 are two UTF-16 code units each, as JavaScript's String.length counts them.
+    text = "a😀b𠮷c"
+    assert apply_patch(text, [{"retain": 3}, {"insert": "X"}]) == "a😀Xb𠮷c"
+    assert apply_patch(text, [{"retain": 1}, {"delete": 2}]) == "ab𠮷c"
+    assert apply_patch(text, [{"retain": 4}, {"delete": 2}, {"insert": "🍣"}]) == "a😀b🍣c"
+    assert apply_patch(text, [{"retain": 7}, {"insert": "!"}]) == text + "!"
+
+
+@pytest.mark.parametrize("ops", [
+    [{"retain": 2}, {"insert": "X"}],
+    [{"retain": 1}, {"delete": 1}],
+    [{"retain": 4}, {"delete": 1}],
+])
+def test_splitting_a_surrogate_pair_is_rejected(ops):
+    with pytest.raises(HTTPException) as excinfo:
+        apply_patch("a😀b𠮷c", ops)
+    assert excinfo.value.status_code == 400
+
+
+@pytest.mark.parametrize("ops", [
+    [{"retain": 8}],
+    [{"delete": -1}],
+    [{"retain": 1, "insert": "x"}],
+    [{"move": 1}],
+])
+def test_malformed_ops_are_rejected(ops):
+    with pytest.raises(HTTPException) as excinfo:
+        apply_patch("a😀b𠮷c", ops)
+    assert excinfo.value.status_code == 400
+
+
+def _note_content(client, auth, book_id, note_id):
+    notes = client.get(f"/api/books/{book_id}/notes", headers=auth).json()
+    return next(note["content"] for note in notes if note["id"] == note_id)
+
+
+def test_note_patch_and_stale_revision(client, auth):
+    book = client.post("/api/books", json={"title": "Patch"}, headers=auth).json()
+    note = client.post(f"/api/books/{book['id']}/notes", json={"title": "n", "content": "<p>😀</p>"}, headers=auth).json()
+    url = f"/api/notes/{note['id']}/content"
+
+    first = client.patch(url, json={"base_revision": note["revision"], "ops": [{"retain": 5}, {"insert": "🍣"}]}, headers=auth)
+    assert first.status_code == 200, first.text
+    assert first.json()["length"] == len("<p>😀🍣</p>".encode("utf-16-le")) // 2
+
+    stale = client.patch(url, json={"base_revision": note["revision"], "ops": [{"insert": "x"}]}, headers=auth)
+    assert stale.status_code == 409
+    assert stale.json()["detail"]["revision"] == first.json()["revision"]
+
+    split = client.patch(url, json={"base_revision": first.json()["revision"], "ops": [{"retain": 4}, {"delete": 1}]}, headers=auth)
+    assert split.status_code == 400
+    assert _note_content(client, auth, book["id"], note["id"]) == "<p>😀🍣</p>"
+
+
+def test_chapter_patch_and_stale_revision(client, auth):
+    book = client.post("/api/books", json={"title": "Patch"}, headers=auth).json()
+    chapter = client.post(f"/api/books/{book['id']}/chapters", json={"title": "c", "note_markdown": "𠮷"}, headers=auth).json()
+    url = f"/api/chapters/{chapter['id']}/note_markdown"
+
+    first = client.patch(url, json={"base_revision": chapter["revision"], "ops": [{"retain": 2}, {"insert": "野家"}]}, headers=auth)
+    assert first.status_code == 200, first.text
+    second = client.patch(url, json={"base_revision": first.json()["revision"], "ops": [{"insert": "# "}]}, headers=auth)
+    assert second.status_code == 200, second.text
+
+    stale = client.patch(url, json={"base_revision": first.json()["revision"], "ops": [{"delete": 1}]}, headers=auth)
+    assert stale.status_code == 409
+    assert stale.json()["detail"]["revision"] == second.json()["revision"]
+
+    chapters = client.get(f"/api/books/{book['id']}/chapters", headers=auth).json()
+    assert chapters[0]["note_markdown"] == "# 𠮷野家"
@@ -0,0 +1,28 @@
+import time
+
+import anyio
+import anyio.to_thread
+
+import metrics
+import main  # noqa: F401  installs the threadpool instrumentation
+
+
+def test_threadpool_wait_covers_plain_run_sync():
+    # Sync endpoints and dependencies reach the threadpool through anyio.to_thread.run_sync
+    # directly, not through our own helpers, so that is where the wait has to be measured.
+    stats = metrics.RequestStats()
+
+    async def scenario():
+        limiter = anyio.CapacityLimiter(1)
+        token = metrics._current.set(stats)
+        try:
+            async with anyio.create_task_group() as group:
+                group.start_soon(lambda: anyio.to_thread.run_sync(time.sleep, 0.2, limiter=limiter))
+                await anyio.sleep(0.02)
+                await anyio.to_thread.run_sync(lambda: None, limiter=limiter)
+        finally:
+            metrics._current.reset(token)
+
+    anyio.run(scenario)
+    assert stats.wait_seconds >= 0.1
+
@@ -0,0 +1,87 @@
+import logging
+import re
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.schema import CreateTable
+
+from database import Base
+from migrations import ensure_foreign_keys
+
+
+@pytest.fixture
+def old_engine(tmp_path):
+    """A database shaped like the models before foreign keys had ON DELETE actions."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for table in Base.metadata.sorted_tables:
+            ddl = str(CreateTable(table).compile(dialect=engine.dialect))
+            cursor.execute(re.sub(r" ON DELETE (CASCADE|SET NULL)", "", ddl))
+        cursor.execute("INSERT INTO users (id, username, password_hash) VALUES (1, 'old', 'x')")
+        cursor.execute("INSERT INTO books (id, user_id, title, status) VALUES (1, 1, 'kept', 'READ')")
+        cursor.execute("INSERT INTO chapters (id, book_id, title) VALUES (1, 1, 'kept')")
+        cursor.execute("INSERT INTO chapters (id, book_id, title) VALUES (2, 999, 'orphan')")
+        for item_id in range(1, 6):
+            cursor.execute(
+                "INSERT INTO sync_changes (user_id, kind, item_id, deleted, changed_at) "
+                "VALUES (1, 'book', ?, 0, '2024-01-01')",
+                (item_id,),
+            )
+        # The newest ids are gone, so only sqlite_sequence remembers 5 was handed out.
+        cursor.execute("DELETE FROM sync_changes WHERE id > 3")
+        cursor.execute(
+            "INSERT INTO sync_changes (id, user_id, kind, item_id, deleted, changed_at) "
+            "VALUES (4, 42, 'book', 9, 0, '2024-01-01')"
+        )
+        raw.commit()
+    finally:
+        raw.close()
+    yield engine
+    engine.dispose()
+
+
+def _query(engine, sql):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(sql).fetchall()
+
+
+def test_rebuild_adds_on_delete_actions(old_engine):
+    assert {row[6] for row in _query(old_engine, "PRAGMA foreign_key_list(chapters)")} == {"NO ACTION"}
+    ensure_foreign_keys(old_engine)
+
+    assert {row[6] for row in _query(old_engine, "PRAGMA foreign_key_list(chapters)")} == {"CASCADE"}
+    assert {row[6] for row in _query(old_engine, "PRAGMA foreign_key_list(conversations)")} == {"CASCADE", "SET NULL"}
+    assert _query(old_engine, "PRAGMA foreign_key_check") == []
+
+    with old_engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+        conn.exec_driver_sql("DELETE FROM books WHERE id = 1")
+        conn.commit()
+    assert _query(old_engine, "SELECT id FROM chapters") == []
+
+
+def test_rebuild_deletes_orphans_and_keeps_autoincrement(old_engine):
+    ensure_foreign_keys(old_engine)
+
+    assert _query(old_engine, "SELECT id FROM chapters") == [(1,)]
+    assert _query(old_engine, "SELECT id FROM sync_changes ORDER BY id") == [(1,), (2,), (3,)]
+    assert _query(old_engine, "SELECT seq FROM sqlite_sequence WHERE name = 'sync_changes'") == [(5,)]
+    with old_engine.connect() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO sync_changes (user_id, kind, item_id, deleted, changed_at) "
+            "VALUES (1, 'book', 6, 0, '2024-01-02')"
+        )
+        conn.commit()
+    assert _query(old_engine, "SELECT max(id) FROM sync_changes") == [(6,)]
+
+
+def test_second_run_changes_nothing(old_engine, caplog):
+    ensure_foreign_keys(old_engine)
+    schema = _query(old_engine, "SELECT name, sql FROM sqlite_master ORDER BY name")
+
+    with caplog.at_level(logging.INFO, logger="migrations"):
+        ensure_foreign_keys(old_engine)
+    assert _query(old_engine, "SELECT name, sql FROM sqlite_master ORDER BY name") == schema
+    assert "Rebuilt foreign keys" not in caplog.text
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+import revisions
+from revisions import apply_diff, make_diff
+
+EDITS = [
+    ("", ""),
+    ("", "new text"),
+    ("old text", ""),
+    ("same", "same"),
+    ("prefix middle suffix", "prefix MIDDLE suffix"),
+    ("aaaa", "aaaaaa"),
+    ("abcabc", "abc"),
+    ("line one\nline two\nline three\n", "line one\nline 2\nline three\nline four\n"),
+    ("<p>hello</p><p>world</p>", "<p>hello</p><p>there</p><p>world</p>"),
+    ("絵文字 😀 と 𠮷野家", "絵文字 😃 と 𠮷野家 🍣"),
+    ("😀😀😀", "😀🍣😀"),
+    (">>\n\n>", "\n>>\n"),
+]
+
+
+@pytest.mark.parametrize("old, new", EDITS)
+def test_round_trip(old, new):
+    assert apply_diff(old, make_diff(old, new)) == new
+
+
+def test_trimmed_ends_are_kept_not_stored():
+    old = "x" * 1000 + "middle" + "y" * 1000
+    ops = make_diff(old, old.replace("middle", "centre"))
+    assert ops[0] == 1000
+    assert sum(len(op) for op in ops if isinstance(op, str)) <= len("centre")
+
+
+def test_global_replace_is_fast_and_small():
+    # A word replaced on every line used to run the character matcher on the whole
+    # middle section: minutes for ~10 KB, all of it under the writer connection.
+    lines = [f"line {i}: the quick brown fox jumps over the lazy dog 😀\n" for i in range(2000)]
+    old = "".join(lines)
+    new = old.replace("fox", "cat")
+    started = time.perf_counter()
+    ops = make_diff(old, new)
+    assert time.perf_counter() - started < 1.0
+    assert apply_diff(old, ops) == new
+    assert sum(len(op) for op in ops if isinstance(op, str)) == 3 * 2000
+
+
+def test_large_rewrite_falls_back_to_replacing_the_span(monkeypatch):
+    monkeypatch.setattr(revisions, "_MATCHER_LIMIT", 10)
+    old = "".join(f"{i}\n" for i in range(100))
+    new = "".join(f"{i * 2}\n" for i in range(100))
+    assert apply_diff(old, make_diff(old, new)) == new
+
+
+def test_history_round_trips_through_the_api(client, auth):
+    book = client.post("/api/books", json={"title": "History"}, headers=auth).json()
+    note = client.post(f"/api/books/{book['id']}/notes", json={"title": "n", "content": "<p>v0</p>"}, headers=auth).json()
+    texts = ["<p>v0</p>"]
+    for i in range(1, revisions.REVISION_SNAPSHOT_INTERVAL + 5):
+        texts.append(texts[-1].replace("</p>", f" {i}😀</p>", 1) if i % 3 else f"<p>rewrite {i} 𠮷</p>" + texts[-1])
+        response = client.put(f"/api/notes/{note['id']}", json={"content": texts[-1]}, headers=auth)
+        assert response.status_code == 200, response.text
+    listed = client.get(f"/api/notes/{note['id']}/revisions", headers=auth).json()
+    assert len(listed) == len(texts)
+    for entry in listed:
+        got = client.get(f"/api/notes/{note['id']}/revisions/{entry['revision']}", headers=auth).json()
+        assert got["text"] == texts[entry["revision"]]
+
+
+def test_diff_is_computed_before_the_write(client, auth, monkeypatch):
+    from sqlalchemy import event
+
+    from database import engine
+
+    book = client.post("/api/books", json={"title": "Order"}, headers=auth).json()
+    note = client.post(f"/api/books/{book['id']}/notes", json={"title": "n", "content": "<p>a</p>"}, headers=auth).json()
+    events = []
+    real = revisions.make_diff
+    monkeypatch.setattr(revisions, "make_diff", lambda old, new: events.append("diff") or real(old, new))
+
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("UPDATE"):
+            events.append("update")
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        client.put(f"/api/notes/{note['id']}", json={"content": "<p>b</p>"}, headers=auth)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert events.count("diff") == 1
+    assert events.index("diff") < events.index("update")
@@ -0,0 +1,71 @@
+from datetime import date
+
+from sqlalchemy import update
+
+import models
+import rollup
+from database import SessionLocal
+
+
+def _user_id(book_id):
+    db = SessionLocal()
+    try:
+        return db.get(models.Book, book_id).user_id
+    finally:
+        db.close()
+
+
+def _drifted(user_id):
+    db = SessionLocal()
+    try:
+        return rollup.check_and_rebuild(db, user_id, fix=False)
+    finally:
+        db.close()
+
+
+def test_rollup_follows_create_update_delete(client, auth):
+    this_month = date.today().replace(day=1).isoformat()
+    first = client.post("/api/books", json={"title": "Read", "status": "read", "started_at": "2024-01-05", "finished_at": "2024-02-10"}, headers=auth).json()
+    user_id = _user_id(first["id"])
+    assert not _drifted(user_id)
+
+    second = client.post("/api/books", json={"title": "Later"}, headers=auth).json()
+    third = client.post("/api/books", json={"title": "Gone", "status": "read", "finished_at": this_month}, headers=auth).json()
+    assert not _drifted(user_id)
+
+    updated = dict(second, status="read", started_at="2024-02-01", finished_at=this_month)
+    for key in ("id", "created_at", "updated_at", "rendered_html", "chapters", "notes"):
+        updated.pop(key)
+    assert client.put(f"/api/books/{second['id']}", json=updated, headers=auth).status_code == 200
+    assert not _drifted(user_id)
+
+    assert client.delete(f"/api/books/{third['id']}", headers=auth).status_code == 204
+    assert not _drifted(user_id)
+
+    overview = client.get("/api/stats/overview", headers=auth).json()
+    assert overview["total_read"] == 2
+    assert overview["total_want_to_read"] == 0
+    assert overview["finished_this_month"] == 1
+
+
+def test_rebuild_check_command(client, auth, capsys):
+    book = client.post("/api/books", json={"title": "Checked", "status": "read", "finished_at": "2024-03-01"}, headers=auth).json()
+    user_id = _user_id(book["id"])
+    client.put(f"/api/books/{book['id']}", json={"title": "Checked", "status": "want_to_read"}, headers=auth)
+    assert rollup.main(["rebuild", "--check"]) == 0
+
+    db = SessionLocal()
+    db.execute(update(models.UserStats).where(models.UserStats.user_id == user_id).values(total_read=99))
+    db.commit()
+    db.close()
+    assert rollup.main(["rebuild", "--check", "--user-id", str(user_id)]) == 1
+    assert f"user {user_id}: drift found" in capsys.readouterr().out
+
+    assert rollup.main(["rebuild", "--user-id", str(user_id)]) == 0
+    assert rollup.main(["rebuild", "--check"]) == 0
+
+
+def test_missing_rollup_is_not_drift(client):
+    response = client.post("/api/auth/signup", json={"username": "nostats", "password": "secret1"})
+    assert response.status_code == 200, response.text
+    assert rollup.main(["rebuild", "--check"]) == 0
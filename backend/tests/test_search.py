@@ -0,0 +1,20 @@
+def test_short_terms_are_case_insensitive(client, auth):
+    client.post("/api/books", json={"title": "Greeting", "note_markdown": "Hello World"}, headers=auth)
+    for query in ("he", "He", "HE", "hel", "HELLO", "wo"):
+        hits = client.get("/api/search", params={"q": query}, headers=auth).json()
+        assert [hit["title"] for hit in hits] == ["Greeting"], query
+
+
+def test_snippet_keeps_original_casing(client, auth):
+    client.post("/api/books", json={"title": "Lang", "note_markdown": "Python is fun"}, headers=auth)
+    hits = client.get("/api/search", params={"q": "python is"}, headers=auth).json()
+    assert "<mark>Python</mark>" in hits[0]["snippet"] and "<mark>is</mark>" in hits[0]["snippet"]
+
+
+def test_results_are_scoped_to_the_user(client, auth):
+    other = client.post("/api/auth/signup", json={"username": "searchother", "password": "secret1"}).json()
+    other_auth = {"Authorization": f"Bearer {other['access_token']}"}
+    client.post("/api/books", json={"title": "Mine", "note_markdown": "shared words"}, headers=auth)
+    client.post("/api/books", json={"title": "Theirs", "note_markdown": "shared words"}, headers=other_auth)
+    for query in ("shared", "sh"):
+        assert [hit["title"] for hit in client.get("/api/search", params={"q": query}, headers=auth).json()] == ["Mine"]
@@ -1,4 +1,27 @@
-import { Book, BookStatus, Chapter, NotePage, Comment, Follow, Message, StatsOverview, User } from "./types";
+import {
+  Book,
+  BookStatus,
+  BatchOp,
+  CalendarEvent,
+  CalendarHeatmap,
+  Chapter,
+  Conversation,
+  FeedItem,
+  NotePage,
+  Comment,
+  FollowListItem,
+  ImportResult,
+  Message,
+  SearchHit,
+  StatsDashboard,
+  StatsOverview,
+  SyncResponse,
+  TextOp,
+  TextPatchResult,
+  TextRevision,
+  User,
+  UserProfile,
+} from "./types";
 
 const API_BASE = import.meta.env.VITE_API_URL || "http://localhost:8000";
 
@@ -37,10 +60,16 @@ async function apiClient<T>(path: string, options: ApiOptions = {}): Promise<T>
 export { apiClient };
 
 // Books
-export const fetchBooks = (status?: BookStatus) =>
-  apiClient<Book[]>(`/api/books${status ? `?status_filter=${status}` : ""}`);
+export const fetchBooks = (status?: BookStatus, fields?: "summary" | string) => {
+  const params = new URLSearchParams();
+  if (status) params.set("status_filter", status);
+  if (fields) params.set("fields", fields);
+  const qs = params.toString();
+  return apiClient<Book[]>(`/api/books${qs ? `?${qs}` : ""}`);
+};
 
-export const fetchBook = (id: number) => apiClient<Book>(`/api/books/${id}`);
+// render=true adds sanitized server-side HTML for the memos (null while it is still rendering).
+export const fetchBook = (id: number) => apiClient<Book>(`/api/books/${id}?render=true`);
 
 export const createBook = (data: Partial<Book>) =>
   apiClient<Book>("/api/books", { method: "POST", body: JSON.stringify(data) });
@@ -53,6 +82,23 @@ export const updateBook = (id: number, data: Partial<Book>) =>
 
 export const deleteBook = (id: number) => apiClient<void>(`/api/books/${id}`, { method: "DELETE" });
 
+// Bulk import/export: CSV (books only, Goodreads headers accepted) or NDJSON (books, chapters, notes)
+export const importBooks = (file: File, format: "csv" | "ndjson") =>
+  apiClient<ImportResult>(`/api/books/import?format=${format}`, {
+    method: "POST",
+    body: file,
+    headers: { "Content-Type": format === "csv" ? "text/csv" : "application/x-ndjson" },
+  });
+
+export const downloadBooksExport = async (format: "csv" | "ndjson") => {
+  const token = localStorage.getItem("book_memory_token");
+  const res = await fetch(`${API_BASE}/api/books/export?format=${format}`, {
+    headers: token ? { Authorization: `Bearer ${token}` } : {},
+  });
+  if (!res.ok) throw new Error((await res.text()) || "API error");
+  return res.blob();
+};
+
 // Chapters
 export const fetchChapters = (bookId: number) => apiClient<Chapter[]>(`/api/books/${bookId}/chapters`);
 
@@ -71,6 +117,36 @@ export const updateChapter = (id: number, data: Partial<Chapter>) =>
 export const deleteChapterApi = (id: number) =>
   apiClient<void>(`/api/chapters/${id}`, { method: "DELETE" });
 
+export const batchChapters = (bookId: number, operations: BatchOp<Chapter>[]) =>
+  apiClient<Chapter[]>(`/api/books/${bookId}/chapters:batch`, {
+    method: "POST",
+    body: JSON.stringify({ operations }),
+  });
+
+export const patchChapterNote = (id: number, baseRevision: number, ops: TextOp[]) =>
+  apiClient<TextPatchResult>(`/api/chapters/${id}/note_markdown`, {
+    method: "PATCH",
+    body: JSON.stringify({ base_revision: baseRevision, ops }),
+  });
+
+// Minimal delta from prev to next: keep the common prefix/suffix, replace the middle.
+export const textDelta = (prev: string, next: string): TextOp[] => {
+  let start = 0;
+  while (start < prev.length && start < next.length && prev[start] === next[start]) start++;
+  let end = 0;
+  while (
+    end < prev.length - start &&
+    end < next.length - start &&
+    prev[prev.length - 1 - end] === next[next.length - 1 - end]
+  )
+    end++;
+  const ops: TextOp[] = [];
+  if (start > 0) ops.push({ retain: start });
+  if (prev.length - start - end > 0) ops.push({ delete: prev.length - start - end });
+  if (next.length - start - end > 0) ops.push({ insert: next.slice(start, next.length - end) });
+  return ops;
+};
+
 // Notes
 export const fetchNotes = (bookId: number) => apiClient<NotePage[]>(`/api/books/${bookId}/notes`);
 export const createNote = (bookId: number, data: Partial<NotePage>) =>
@@ -78,6 +154,19 @@ export const createNote = (bookId: number, data: Partial<NotePage>) =>
 export const updateNote = (noteId: number, data: Partial<NotePage>) =>
   apiClient<NotePage>(`/api/notes/${noteId}`, { method: "PUT", body: JSON.stringify(data) });
 export const deleteNote = (noteId: number) => apiClient<void>(`/api/notes/${noteId}`, { method: "DELETE" });
+export const patchNoteContent = (noteId: number, baseRevision: number, ops: TextOp[]) =>
+  apiClient<TextPatchResult>(`/api/notes/${noteId}/content`, {
+    method: "PATCH",
+    body: JSON.stringify({ base_revision: baseRevision, ops }),
+  });
+export const fetchNoteRevisions = (noteId: number) =>
+  apiClient<TextRevision[]>(`/api/notes/${noteId}/revisions`);
+export const fetchNoteRevision = (noteId: number, revision: number) =>
+  apiClient<{ revision: number; text: string }>(`/api/notes/${noteId}/revisions/${revision}`);
+export const restoreNoteRevision = (noteId: number, revision: number) =>
+  apiClient<NotePage>(`/api/notes/${noteId}/revisions/${revision}/restore`, { method: "POST" });
+export const batchNotes = (bookId: number, operations: BatchOp<NotePage>[]) =>
+  apiClient<NotePage[]>(`/api/books/${bookId}/notes:batch`, { method: "POST", body: JSON.stringify({ operations }) });
 
 // Comments
 export const fetchComments = (bookId: number) => apiClient<Comment[]>(`/api/books/${bookId}/comments`);
@@ -89,16 +178,54 @@ export const deleteCommentApi = (commentId: number) =>
 // Follow
 export const followUser = (userId: number) => apiClient<{ message: string }>(`/api/users/${userId}/follow`, { method: "POST" });
 export const unfollowUser = (userId: number) => apiClient<{ message: string }>(`/api/users/${userId}/unfollow`, { method: "POST" });
-export const getFollowing = () => apiClient<Follow[]>(`/api/users/me/following`);
-export const getFollowers = () => apiClient<Follow[]>(`/api/users/me/followers`);
+export const getUserProfile = (userId: number | "me" = "me") => apiClient<UserProfile>(`/api/users/${userId}`);
+export const getFollowing = (userId: number | "me" = "me", cursor?: string) =>
+  apiClient<FollowListItem[]>(`/api/users/${userId}/following${cursor ? `?cursor=${encodeURIComponent(cursor)}` : ""}`);
+export const getFollowers = (userId: number | "me" = "me", cursor?: string) =>
+  apiClient<FollowListItem[]>(`/api/users/${userId}/followers${cursor ? `?cursor=${encodeURIComponent(cursor)}` : ""}`);
 
 // Messages
-export const fetchMessages = (otherUserId: number) => apiClient<Message[]>(`/api/messages/${otherUserId}`);
+export const fetchMessages = (otherUserId: number, afterId?: number) =>
+  apiClient<Message[]>(`/api/messages/${otherUserId}${afterId !== undefined ? `?after_id=${afterId}` : ""}`);
+// Pushes {"type": "message", "message": Message} for every message sent to or by the current user.
+export const openMessageSocket = (afterId?: number) => {
+  const token = localStorage.getItem("book_memory_token") || "";
+  const params = new URLSearchParams({ token });
+  if (afterId !== undefined) params.set("after_id", String(afterId));
+  return new WebSocket(`${API_BASE.replace(/^http/, "ws")}/ws/messages?${params.toString()}`);
+};
 export const sendMessageApi = (otherUserId: number, content: string) =>
   apiClient<Message>(`/api/messages/${otherUserId}`, { method: "POST", body: JSON.stringify({ content }) });
 
+// Conversations (inbox, newest activity first)
+export const fetchConversations = (cursor?: string) =>
+  apiClient<Conversation[]>(`/api/conversations${cursor ? `?cursor=${encodeURIComponent(cursor)}` : ""}`);
+export const markConversationRead = (otherUserId: number) =>
+  apiClient<void>(`/api/conversations/${otherUserId}/read`, { method: "POST" });
+
+// Feed of followed users' reading activity
+export const fetchFeed = (cursor?: string) =>
+  apiClient<FeedItem[]>(`/api/feed${cursor ? `?cursor=${encodeURIComponent(cursor)}` : ""}`);
+
+// Sync (pass the previous response's token to receive only what changed since)
+export const fetchSync = (since?: string | null) =>
+  apiClient<SyncResponse>(`/api/sync${since ? `?since=${encodeURIComponent(since)}` : ""}`);
+
+// Search
+export const searchApi = (q: string, kind?: SearchHit["kind"]) => {
+  const params = new URLSearchParams({ q });
+  if (kind) params.set("kind", kind);
+  return apiClient<SearchHit[]>(`/api/search?${params.toString()}`);
+};
+
 // Stats
 export const fetchStatsOverview = () => apiClient<StatsOverview>(`/api/stats/overview`);
+export const fetchStatsDashboard = (months = 12) => apiClient<StatsDashboard>(`/api/stats/dashboard?months=${months}`);
+
+// Calendar (from/to are inclusive YYYY-MM-DD dates)
+export const fetchCalendar = (from: string, to: string) =>
+  apiClient<CalendarEvent[]>(`/api/calendar?from=${from}&to=${to}`);
+export const fetchCalendarHeatmap = (year: number) => apiClient<CalendarHeatmap>(`/api/calendar/heatmap?year=${year}`);
 
 // Users (lightweight helper)
 export const searchUserById = async (userId: number): Promise<User> => {
@@ -1,15 +1,15 @@
 import { useEffect, useState } from "react";
-import { fetchStatsOverview } from "../api";
-import { StatsOverview } from "../types";
+import { fetchStatsDashboard } from "../api";
+import { StatsDashboard } from "../types";
 
 const AnalyticsPage = () => {
-  const [stats, setStats] = useState<StatsOverview | null>(null);
+  const [stats, setStats] = useState<StatsDashboard | null>(null);
   const [error, setError] = useState<string | null>(null);
 
   useEffect(() => {
     const load = async () => {
       try {
-        const data = await fetchStatsOverview();
+        const data = await fetchStatsDashboard();
         setStats(data);
       } catch (err) {
         setError((err as Error).message);
@@ -18,6 +18,8 @@ const AnalyticsPage = () => {
     load();
   }, []);
 
+  const maxMonthly = Math.max(1, ...(stats?.finished_by_month.map((m) => m.count) ?? []));
+
   return (
     <div className="container">
       <div className="header">
@@ -41,6 +43,37 @@ const AnalyticsPage = () => {
           <h3>今月読み終わり</h3>
           <p style={{ fontSize: 28, margin: 0 }}>{stats?.finished_this_month ?? "-"} 冊</p>
         </div>
+        <div className="section">
+          <h3>平均読了日数</h3>
+          <p style={{ fontSize: 28, margin: 0 }}>{stats?.avg_days_to_finish ?? "-"} 日</p>
+        </div>
+      </div>
+
+      <div className="section" style={{ marginTop: 12 }}>
+        <h3 style={{ marginTop: 0 }}>月別の読了数</h3>
+        <div style={{ display: "flex", alignItems: "flex-end", gap: 6, height: 160 }}>
+          {stats?.finished_by_month.map((m) => (
+            <div key={m.month} style={{ flex: 1, textAlign: "center" }}>
+              <div
+                title={`${m.month}: ${m.count} 冊`}
+                style={{ height: (m.count / maxMonthly) * 120, background: "#0f7cff", borderRadius: 4 }}
+              />
+              <div style={{ fontSize: 11, color: "#6b7280" }}>{m.month.slice(5)}</div>
+            </div>
+          ))}
+        </div>
+      </div>
+
+      <div className="section" style={{ marginTop: 12 }}>
+        <h3 style={{ marginTop: 0 }}>よく読む著者</h3>
+        {stats && stats.top_authors.length === 0 && <p>まだデータがありません。</p>}
+        <ol style={{ margin: 0 }}>
+          {stats?.top_authors.map((a) => (
+            <li key={a.author}>
+              {a.author}（{a.count} 冊）
+            </li>
+          ))}
+        </ol>
       </div>
     </div>
   );
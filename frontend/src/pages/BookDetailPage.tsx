@@ -1,4 +1,4 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { useNavigate, useParams } from "react-router-dom";
 import ReactMarkdown from "react-markdown";
 import remarkGfm from "remark-gfm";
@@ -11,12 +11,16 @@ import {
   fetchBook,
   fetchComments,
   fetchNotes,
+  patchNoteContent,
+  textDelta,
   updateBook,
   updateNote,
 } from "../api";
 import { Book, BookStatus, Comment, NotePage } from "../types";
 import RichNoteEditor from "../components/RichNoteEditor";
 
+const AUTOSAVE_DELAY_MS = 1500;
+
 const BookDetailPage = () => {
   const { id } = useParams();
   const navigate = useNavigate();
@@ -30,6 +34,9 @@ const BookDetailPage = () => {
   const [noteForm, setNoteForm] = useState<Partial<NotePage>>({});
   const [showNewNote, setShowNewNote] = useState(false);
   const [newNote, setNewNote] = useState<Partial<NotePage>>({ title: "新規ノート", sort_order: 0, content: "" });
+  // Last content/revision the server has for the open note; autosave patches against it.
+  const savedNote = useRef<{ id: number; content: string; revision: number } | null>(null);
+  const autosaveQueue = useRef<Promise<void>>(Promise.resolve());
 
   const [comments, setComments] = useState<Comment[]>([]);
   const [commentInput, setCommentInput] = useState("");
@@ -47,8 +54,7 @@ const BookDetailPage = () => {
       setNotes(noteList);
       setComments(comm);
       if (noteList.length > 0) {
-        setOpenNoteId(noteList[0].id);
-        setNoteForm(noteList[0]);
+        selectNote(noteList[0]);
       }
     } catch (err) {
       setError((err as Error).message);
@@ -99,8 +105,30 @@ const BookDetailPage = () => {
   const selectNote = (note: NotePage) => {
     setOpenNoteId(note.id);
     setNoteForm(note);
+    savedNote.current = { id: note.id, content: note.content || "", revision: note.revision ?? 0 };
   };
 
+  // Autosave: after a pause in typing, send only the changed span of the open note.
+  useEffect(() => {
+    const content = noteForm.content ?? "";
+    if (!openNoteId || savedNote.current?.id !== openNoteId || savedNote.current.content === content) return;
+    const timer = setTimeout(() => {
+      autosaveQueue.current = autosaveQueue.current.then(async () => {
+        const base = savedNote.current;
+        if (!base || base.id !== openNoteId || base.content === content) return;
+        try {
+          const result = await patchNoteContent(base.id, base.revision, textDelta(base.content, content));
+          savedNote.current = { id: base.id, content, revision: result.revision };
+          setNotes((prev) => prev.map((n) => (n.id === base.id ? { ...n, content, revision: result.revision } : n)));
+        } catch (err) {
+          setError((err as Error).message);
+        }
+      });
+    }, AUTOSAVE_DELAY_MS);
+    return () => clearTimeout(timer);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [openNoteId, noteForm.content]);
+
   const handleCreateNote = async () => {
     if (!book || !newNote.title) return;
     try {
@@ -111,8 +139,7 @@ const BookDetailPage = () => {
       });
       const updatedNotes = [...notes, created].sort((a, b) => (a.sort_order || 0) - (b.sort_order || 0));
       setNotes(updatedNotes);
-      setOpenNoteId(created.id);
-      setNoteForm(created);
+      selectNote(created);
       setNewNote({ title: "新規ノート", sort_order: updatedNotes.length, content: "" });
       setShowNewNote(false);
     } catch (err) {
@@ -130,7 +157,7 @@ const BookDetailPage = () => {
       });
       const updatedList = notes.map((n) => (n.id === updated.id ? updated : n)).sort((a, b) => (a.sort_order || 0) - (b.sort_order || 0));
       setNotes(updatedList);
-      setNoteForm(updated);
+      selectNote(updated);
       setError(null);
     } catch (err) {
       setError((err as Error).message);
@@ -143,11 +170,11 @@ const BookDetailPage = () => {
     const remaining = notes.filter((n) => n.id !== noteId);
     setNotes(remaining);
     if (remaining.length > 0) {
-      setOpenNoteId(remaining[0].id);
-      setNoteForm(remaining[0]);
+      selectNote(remaining[0]);
     } else {
       setOpenNoteId(null);
       setNoteForm({});
+      savedNote.current = null;
     }
   };
 
@@ -336,6 +363,9 @@ const BookDetailPage = () => {
                 <ReactMarkdown remarkPlugins={[remarkGfm]}>{form.note_markdown || "メモを書きましょう"}</ReactMarkdown>
               </div>
             </div>
+          ) : book.note_markdown && book.rendered_html ? (
+            // Already sanitized on the server (backend/rendering.py).
+            <div className="markdown-box" dangerouslySetInnerHTML={{ __html: book.rendered_html }} />
           ) : (
             <div className="markdown-box">
               <ReactMarkdown remarkPlugins={[remarkGfm]}>
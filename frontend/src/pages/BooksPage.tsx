@@ -16,7 +16,7 @@ const BooksPage = () => {
 
   const loadBooks = async () => {
     try {
-      const data = await fetchBooks(filter === "all" ? undefined : filter);
+      const data = await fetchBooks(filter === "all" ? undefined : filter, "summary");
       setBooks(data);
     } catch (err) {
       setError((err as Error).message);
@@ -1,52 +1,56 @@
 import { useEffect, useMemo, useState } from "react";
 import Calendar from "react-calendar";
 import "react-calendar/dist/Calendar.css";
-import { fetchBooks } from "../api";
-import { Book } from "../types";
+import { fetchCalendar, fetchCalendarHeatmap, fetchStatsOverview } from "../api";
+import { CalendarDay, CalendarEvent } from "../types";
+
+const pad = (n: number) => String(n).padStart(2, "0");
+// Local date, not toISOString(): that would shift days east of UTC.
+const dateKey = (d: Date) => `${d.getFullYear()}-${pad(d.getMonth() + 1)}-${pad(d.getDate())}`;
+const monthStart = (d: Date) => new Date(d.getFullYear(), d.getMonth(), 1);
+const monthEnd = (d: Date) => new Date(d.getFullYear(), d.getMonth() + 1, 0);
 
 const CalendarPage = () => {
-  const [books, setBooks] = useState<Book[]>([]);
   const [selectedDate, setSelectedDate] = useState<Date>(new Date());
+  const [activeMonth, setActiveMonth] = useState<Date>(monthStart(new Date()));
+  // Events for the visible month only; the heatmap covers the whole year.
+  const [events, setEvents] = useState<CalendarEvent[]>([]);
+  const [heatmap, setHeatmap] = useState<Record<string, CalendarDay>>({});
+  const [totalBooks, setTotalBooks] = useState<number | null>(null);
   const [error, setError] = useState<string | null>(null);
 
+  const year = activeMonth.getFullYear();
+  const month = activeMonth.getMonth();
+
   useEffect(() => {
-    const load = async () => {
-      try {
-        const data = await fetchBooks();
-        setBooks(data);
-      } catch (err) {
-        setError((err as Error).message);
-      }
-    };
-    load();
+    fetchStatsOverview()
+      .then((overview) => setTotalBooks(overview.total_read + overview.total_want_to_read))
+      .catch((err) => setError((err as Error).message));
   }, []);
 
-  const activityDates = useMemo(() => {
-    const set = new Set<string>();
-    books.forEach((b) => {
-      if (b.started_at) set.add(b.started_at);
-      if (b.finished_at) set.add(b.finished_at);
-    });
-    return set;
-  }, [books]);
+  useEffect(() => {
+    fetchCalendarHeatmap(year)
+      .then((data) => setHeatmap(Object.fromEntries(data.days.map((d) => [d.day, d]))))
+      .catch((err) => setError((err as Error).message));
+  }, [year]);
+
+  useEffect(() => {
+    const first = new Date(year, month, 1);
+    fetchCalendar(dateKey(first), dateKey(monthEnd(first)))
+      .then(setEvents)
+      .catch((err) => setError((err as Error).message));
+  }, [year, month]);
 
-  const booksByDate = useMemo(() => {
-    const map: Record<string, Book[]> = {};
-    books.forEach((b) => {
-      if (b.started_at) {
-        map[b.started_at] = map[b.started_at] ? [...map[b.started_at], b] : [b];
-      }
-      if (b.finished_at) {
-        map[b.finished_at] = map[b.finished_at] ? [...map[b.finished_at], b] : [b];
-      }
+  const eventsByDate = useMemo(() => {
+    const map: Record<string, CalendarEvent[]> = {};
+    events.forEach((e) => {
+      map[e.day] = map[e.day] ? [...map[e.day], e] : [e];
     });
     return map;
-  }, [books]);
-
-  const dateKey = (d: Date) => d.toISOString().slice(0, 10);
+  }, [events]);
 
   const selectedKey = dateKey(selectedDate);
-  const selectedBooks = booksByDate[selectedKey] || [];
+  const selectedEvents = eventsByDate[selectedKey] || [];
 
   return (
     <div className="container">
@@ -65,57 +69,59 @@ const CalendarPage = () => {
             <span className="legend-dot finish" /> 読み終わり
           </div>
           <Calendar
-            onChange={(value) => setSelectedDate(value as Date)}
+            onChange={(value) => {
+              setSelectedDate(value as Date);
+              setActiveMonth(monthStart(value as Date));
+            }}
             value={selectedDate}
+            activeStartDate={activeMonth}
+            onActiveStartDateChange={({ activeStartDate }) => activeStartDate && setActiveMonth(monthStart(activeStartDate))}
             tileContent={({ date }) => {
-              const key = dateKey(date);
-              const isStart = books.some((b) => b.started_at === key);
-              const isFinish = books.some((b) => b.finished_at === key);
+              const day = heatmap[dateKey(date)];
               return (
                 <div className="tile-badges">
-                  {isStart && <span className="dot start" />}
-                  {isFinish && <span className="dot finish" />}
+                  {day && day.started > 0 && <span className="dot start" />}
+                  {day && day.finished > 0 && <span className="dot finish" />}
                 </div>
               );
             }}
-            tileClassName={({ date }) =>
-              activityDates.has(dateKey(date)) ? "calendar-active-day" : undefined
-            }
+            tileClassName={({ date }) => {
+              const day = heatmap[dateKey(date)];
+              if (!day) return undefined;
+              const count = day.started + day.finished;
+              return count >= 3 ? "calendar-active-day heat-3" : count === 2 ? "calendar-active-day heat-2" : "calendar-active-day";
+            }}
           />
         </div>
 
         <div className="calendar-summary">
           <div className="summary-card">
             <div className="summary-title">今月の開始</div>
-            <div className="summary-value">
-              {books.filter((b) => b.started_at?.startsWith(selectedKey.slice(0, 7))).length} 冊
-            </div>
+            <div className="summary-value">{events.filter((e) => e.kind === "start").length} 冊</div>
           </div>
           <div className="summary-card">
             <div className="summary-title">今月の完了</div>
-            <div className="summary-value">
-              {books.filter((b) => b.finished_at?.startsWith(selectedKey.slice(0, 7))).length} 冊
-            </div>
+            <div className="summary-value">{events.filter((e) => e.kind === "finish").length} 冊</div>
           </div>
           <div className="summary-card">
             <div className="summary-title">総ブック数</div>
-            <div className="summary-value">{books.length} 冊</div>
+            <div className="summary-value">{totalBooks ?? "-"} 冊</div>
           </div>
         </div>
       </div>
 
       <div className="section" style={{ marginTop: 12 }}>
         <h4 style={{ marginTop: 0 }}>{selectedKey} の記録</h4>
-        {selectedBooks.length === 0 && <p>この日に記録はありません。</p>}
+        {selectedEvents.length === 0 && <p>この日に記録はありません。</p>}
         <div className="activity-list">
-          {selectedBooks.map((b) => (
-            <div key={`${b.id}-${selectedKey}`} className="activity-item">
+          {selectedEvents.map((e) => (
+            <div key={`${e.book_id}-${e.kind}`} className="activity-item">
               <div>
-                <strong>{b.title}</strong>
-                <div style={{ color: "#4b5563" }}>{b.author || "作者不明"}</div>
+                <strong>{e.title}</strong>
+                <div style={{ color: "#4b5563" }}>{e.author || "作者不明"}</div>
               </div>
-              <span className={`badge ${b.status === "want_to_read" ? "want" : ""}`}>
-                {b.status === "read" ? "読んだ本" : "今後読みたい本"}
+              <span className={`badge ${e.kind === "start" ? "want" : ""}`}>
+                {e.kind === "start" ? "読み始め" : "読み終わり"}
               </span>
             </div>
           ))}
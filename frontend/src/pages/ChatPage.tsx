@@ -1,5 +1,5 @@
-import { FormEvent, useEffect, useState } from "react";
-import { fetchMessages, sendMessageApi } from "../api";
+import { FormEvent, useEffect, useRef, useState } from "react";
+import { fetchMessages, openMessageSocket, sendMessageApi } from "../api";
 import { Message } from "../types";
 
 const ChatPage = () => {
@@ -7,11 +7,20 @@ const ChatPage = () => {
   const [messages, setMessages] = useState<Message[]>([]);
   const [content, setContent] = useState("");
   const [error, setError] = useState<string | null>(null);
+  const lastIdRef = useRef<number | undefined>(undefined);
+
+  const appendMessage = (m: Message) => {
+    const other = Number(targetId);
+    if (m.sender.id !== other && m.receiver.id !== other) return;
+    lastIdRef.current = Math.max(lastIdRef.current ?? 0, m.id);
+    setMessages((prev) => (prev.some((p) => p.id === m.id) ? prev : [...prev, m]));
+  };
 
   const load = async (userId: number) => {
     try {
       const data = await fetchMessages(userId);
       setMessages(data);
+      lastIdRef.current = data.length > 0 ? data[data.length - 1].id : undefined;
     } catch (err) {
       setError((err as Error).message);
     }
@@ -23,15 +32,40 @@ const ChatPage = () => {
     }
   }, [targetId]);
 
+  // New messages arrive over the socket; on reconnect the server replays anything after lastIdRef.
+  useEffect(() => {
+    if (!targetId) return;
+    let socket: WebSocket | null = null;
+    let closed = false;
+    let retry: number | undefined;
+    const connect = () => {
+      socket = openMessageSocket(lastIdRef.current);
+      socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type === "message") appendMessage(data.message as Message);
+      };
+      socket.onclose = () => {
+        if (!closed) retry = window.setTimeout(connect, 3000);
+      };
+    };
+    connect();
+    return () => {
+      closed = true;
+      window.clearTimeout(retry);
+      socket?.close();
+    };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [targetId]);
+
   const handleSend = async (e: FormEvent) => {
     e.preventDefault();
     setError(null);
     const id = Number(targetId);
     if (!id || !content.trim()) return;
     try {
-      await sendMessageApi(id, content.trim());
+      const sent = await sendMessageApi(id, content.trim());
       setContent("");
-      load(id);
+      appendMessage(sent);
     } catch (err) {
       setError((err as Error).message);
     }
@@ -1,19 +1,29 @@
 import { FormEvent, useEffect, useState } from "react";
-import { followUser, getFollowers, getFollowing, unfollowUser } from "../api";
-import { Follow } from "../types";
+import { fetchFeed, followUser, getFollowers, getFollowing, getUserProfile, unfollowUser } from "../api";
+import { FeedItem, FollowListItem, UserProfile } from "../types";
+
+const describeActivity = (item: FeedItem) => {
+  if (item.kind === "finished") return `『${item.book_title}』を読み終えました`;
+  if (item.kind === "note") return `『${item.book_title}』にノート「${item.note_title ?? ""}」を追加しました`;
+  return `『${item.book_title}』を読みたい本に追加しました`;
+};
 
 const ProfilePage = () => {
-  const [followers, setFollowers] = useState<Follow[]>([]);
-  const [following, setFollowing] = useState<Follow[]>([]);
+  const [profile, setProfile] = useState<UserProfile | null>(null);
+  const [followers, setFollowers] = useState<FollowListItem[]>([]);
+  const [following, setFollowing] = useState<FollowListItem[]>([]);
+  const [feed, setFeed] = useState<FeedItem[]>([]);
   const [targetId, setTargetId] = useState<string>("");
   const [message, setMessage] = useState<string | null>(null);
   const [error, setError] = useState<string | null>(null);
 
   const load = async () => {
     try {
-      const [fol, ing] = await Promise.all([getFollowers(), getFollowing()]);
+      const [me, fol, ing, items] = await Promise.all([getUserProfile(), getFollowers(), getFollowing(), fetchFeed()]);
+      setProfile(me);
       setFollowers(fol);
       setFollowing(ing);
+      setFeed(items);
     } catch (err) {
       setError((err as Error).message);
     }
@@ -62,23 +72,42 @@ const ProfilePage = () => {
       </div>
 
       <div className="section" style={{ marginTop: 12 }}>
-        <h4 style={{ marginTop: 0 }}>フォロー中</h4>
+        <h4 style={{ marginTop: 0 }}>フォロー中のユーザーの読書</h4>
+        {feed.length === 0 && <p>まだアクティビティはありません。</p>}
+        {feed.map((item) => (
+          <div key={item.id} className="list-row">
+            <span>
+              @{item.actor.username} {describeActivity(item)}
+            </span>
+            <small style={{ color: "#6b7280" }}>{new Date(item.created_at).toLocaleString()}</small>
+          </div>
+        ))}
+      </div>
+
+      <div className="section" style={{ marginTop: 12 }}>
+        <h4 style={{ marginTop: 0 }}>フォロー中（{profile?.following_count ?? following.length}）</h4>
         {following.length === 0 && <p>フォローしているユーザーはいません。</p>}
         {following.map((f) => (
-          <div key={f.following.id} className="list-row">
-            <span>@{f.following.username}</span>
-            <small style={{ color: "#6b7280" }}>{new Date(f.created_at).toLocaleString()}</small>
+          <div key={f.user.id} className="list-row">
+            <span>
+              @{f.user.username}
+              {f.follows_you && <small style={{ color: "#6b7280" }}> フォローされています</small>}
+            </span>
+            <small style={{ color: "#6b7280" }}>{new Date(f.followed_at).toLocaleString()}</small>
           </div>
         ))}
       </div>
 
       <div className="section" style={{ marginTop: 12 }}>
-        <h4 style={{ marginTop: 0 }}>フォロワー</h4>
+        <h4 style={{ marginTop: 0 }}>フォロワー（{profile?.follower_count ?? followers.length}）</h4>
         {followers.length === 0 && <p>フォロワーはいません。</p>}
         {followers.map((f) => (
-          <div key={f.follower.id} className="list-row">
-            <span>@{f.follower.username}</span>
-            <small style={{ color: "#6b7280" }}>{new Date(f.created_at).toLocaleString()}</small>
+          <div key={f.user.id} className="list-row">
+            <span>
+              @{f.user.username}
+              {f.is_following && <small style={{ color: "#6b7280" }}> 相互フォロー</small>}
+            </span>
+            <small style={{ color: "#6b7280" }}>{new Date(f.followed_at).toLocaleString()}</small>
           </div>
         ))}
       </div>
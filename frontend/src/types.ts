@@ -13,6 +13,7 @@ export interface Book {
   title_guess?: string | null;
   created_at: string;
   updated_at?: string | null;
+  rendered_html?: string | null; // sanitized server-side HTML (?render=true); null until rendered
   chapters?: Chapter[];
   notes?: NotePage[];
 }
@@ -28,8 +29,10 @@ export interface Chapter {
   title: string;
   order?: number | null;
   note_markdown?: string | null;
+  revision?: number;
   created_at: string;
   updated_at?: string | null;
+  rendered_html?: string | null;
 }
 
 export interface NotePage {
@@ -38,8 +41,10 @@ export interface NotePage {
   title: string;
   sort_order?: number | null;
   content?: string | null; // stored as HTML/JSON string
+  revision?: number;
   created_at: string;
   updated_at?: string | null;
+  rendered_html?: string | null;
 }
 
 export interface Comment {
@@ -55,10 +60,16 @@ export interface User {
   username: string;
 }
 
-export interface Follow {
-  follower: User;
-  following: User;
-  created_at: string;
+export interface UserProfile extends User {
+  follower_count: number;
+  following_count: number;
+}
+
+export interface FollowListItem {
+  user: UserProfile;
+  is_following: boolean; // you follow this user
+  follows_you: boolean;
+  followed_at: string;
 }
 
 export interface Message {
@@ -69,9 +80,119 @@ export interface Message {
   created_at: string;
 }
 
+export interface Conversation {
+  other_user: User;
+  last_message_id?: number | null;
+  last_message_sender_id?: number | null;
+  last_message_preview: string;
+  last_message_at: string;
+  unread_count: number;
+}
+
 export interface StatsOverview {
   total_read: number;
   total_want_to_read: number;
   read_this_month: number;
   finished_this_month: number;
 }
+
+export interface MonthlyCount {
+  month: string; // YYYY-MM
+  count: number;
+}
+
+export interface AuthorCount {
+  author: string;
+  count: number;
+}
+
+export interface StatsDashboard extends StatsOverview {
+  avg_days_to_finish?: number | null;
+  finished_by_month: MonthlyCount[];
+  top_authors: AuthorCount[];
+}
+
+export interface CalendarEvent {
+  day: string; // YYYY-MM-DD
+  kind: "start" | "finish";
+  book_id: number;
+  title: string;
+  author?: string | null;
+  cover_image_url?: string | null;
+  status: BookStatus;
+}
+
+export interface CalendarDay {
+  day: string;
+  started: number;
+  finished: number;
+}
+
+export interface CalendarHeatmap {
+  year: number;
+  days: CalendarDay[]; // only days with events
+}
+
+export interface SearchHit {
+  kind: "book" | "chapter" | "note";
+  id: number;
+  book_id: number;
+  title: string;
+  snippet: string; // escaped HTML with <mark> highlights
+  score: number;
+}
+
+export interface SyncTombstone {
+  kind: "book" | "chapter" | "note" | "comment";
+  id: number;
+}
+
+export interface SyncResponse {
+  token: string;
+  has_more: boolean;
+  books: Book[];
+  chapters: Chapter[];
+  notes: NotePage[];
+  comments: Comment[];
+  deleted: SyncTombstone[]; // a deleted book also removes its chapters, notes and comments
+}
+
+export interface ImportResult {
+  imported: number;
+  failed: number;
+  batches: number;
+  errors: { line: number; error: string }[];
+}
+
+export type BatchOp<T> =
+  | ({ op: "create" } & Partial<T>)
+  | ({ op: "update"; id: number } & Partial<T>)
+  | { op: "delete"; id: number }
+  | { op: "reorder"; ids: number[] };
+
+export type TextOp = { retain: number } | { insert: string } | { delete: number };
+
+export interface TextPatchResult {
+  id: number;
+  revision: number;
+  length: number;
+}
+
+export interface TextRevision {
+  revision: number;
+  chain: number; // 0 = full snapshot
+  length: number;
+  created_at: string;
+}
+
+export interface FeedItem {
+  id: number;
+  kind: "status" | "finished" | "note";
+  actor: User;
+  book_id: number;
+  book_title: string;
+  status?: BookStatus | null;
+  note_id?: number | null;
+  note_title?: string | null;
+  created_at: string;
+}